@@ -1,9 +1,38 @@
+import io
 import logging
+import threading
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
 import os
 from datetime import datetime, timezone
 
+# One shared client per process. boto3 clients are thread-safe, so every worker
+# reuses its connection pool instead of resolving credentials and doing a TLS
+# handshake per image.
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "32"))
+S3_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=int(os.getenv("S3_MULTIPART_THRESHOLD", str(8 * 1024 * 1024))),
+    max_concurrency=int(os.getenv("S3_MAX_CONCURRENCY", "4")),
+    use_threads=True
+)
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+
+def get_s3_client():
+    """Return the process-wide S3 client, creating it on first use"""
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                # A private session: creating clients from the default session isn't thread-safe
+                _s3_client = boto3.session.Session().client('s3', config=Config(
+                    max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+                    retries={'max_attempts': 5, 'mode': 'adaptive'}
+                ))
+    return _s3_client
 
 
 def upload_file(file_name, bucket, object_name=None):
@@ -20,28 +49,73 @@ def upload_file(file_name, bucket, object_name=None):
         object_name = os.path.basename(file_name)
 
     # Upload the file
-    s3_client = boto3.client('s3')
+    s3_client = get_s3_client()
+    try:
+        response = s3_client.upload_file(file_name,bucket, object_name, Config=S3_TRANSFER_CONFIG)
+    except ClientError as e:
+        logging.error(e)
+        return False
+    return True
+def upload_fileobj(fileobj, bucket, object_name):
+    """Upload a binary file-like object to an S3 bucket
+
+    :return: True if the object was uploaded, else False
+    """
+    s3_client = get_s3_client()
     try:
-        response = s3_client.upload_file(file_name,bucket, object_name)
+        s3_client.upload_fileobj(fileobj, bucket, object_name, Config=S3_TRANSFER_CONFIG)
     except ClientError as e:
         logging.error(e)
         return False
     return True
+def upload_bytes(data, bucket, object_name):
+    """Upload in-memory bytes to an S3 bucket without touching the disk"""
+    return upload_fileobj(io.BytesIO(data), bucket, object_name)
 def download_file(bucket_name, s3_key, object_name=None):
     # Download the file
-    s3_client = boto3.client('s3')
+    s3_client = get_s3_client()
+    try:
+        response = s3_client.download_file(bucket_name, s3_key, object_name, Config=S3_TRANSFER_CONFIG)
+    except ClientError as e:
+        logging.error(e)
+        return e
+    return True
+def download_fileobj(bucket_name, s3_key, fileobj):
+    # Download into a binary file-like object
+    s3_client = get_s3_client()
     try:
-        response = s3_client.download_file(bucket_name, s3_key, object_name)
+        s3_client.download_fileobj(bucket_name, s3_key, fileobj, Config=S3_TRANSFER_CONFIG)
     except ClientError as e:
         logging.error(e)
         return e
     return True
+def download_bytes(bucket_name, s3_key):
+    """Download an object into memory
+
+    :return: The object's bytes, or None if the download failed
+    """
+    buffer = io.BytesIO()
+    if download_fileobj(bucket_name, s3_key, buffer) is not True:
+        return None
+    return buffer.getvalue()
+def copy_file(bucket_name, source_key, s3_key):
+    """Server-side copy of an object within a bucket, no data goes through this host
+
+    :return: True if the object was copied, else False
+    """
+    s3_client = get_s3_client()
+    try:
+        s3_client.copy({'Bucket': bucket_name, 'Key': source_key}, bucket_name, s3_key, Config=S3_TRANSFER_CONFIG)
+    except ClientError as e:
+        logging.error(e)
+        return False
+    return True
 def delete_file(bucket_name, s3_key):
     # Delete the file
-    s3_client = boto3.client('s3')
+    s3_client = get_s3_client()
     try:
         response = s3_client.delete_object(Bucket=bucket_name, Key=s3_key)
     except ClientError as e:
         logging.error(e)
         return False
-    return True
\ No newline at end of file
+    return True
@@ -0,0 +1,22 @@
+import numpy as np
+import cv2
+from annotate import draw_detections, label_color, render_detections
+
+
+def test_draws_box_in_label_color():
+    image = np.zeros((200, 300, 3), dtype=np.uint8)
+    draw_detections(image, [("dog", 0.9, [50.0, 60.0, 150.0, 160.0])])
+    color = label_color("dog")
+    # Left edge of the box, away from the label
+    assert tuple(image[120, 50]) == color
+    assert not image[120, 100].any()
+    assert label_color("dog") == color
+
+
+def test_render_detections(tmp_path):
+    original = str(tmp_path / "original.jpg")
+    cv2.imwrite(original, np.full((100, 100, 3), 255, dtype=np.uint8))
+    target = str(tmp_path / "predicted" / "a.jpg")
+    assert render_detections(original, [("cat", 0.5, [10, 10, 90, 90])], target)
+    assert cv2.imread(target).shape == (100, 100, 3)
+    assert not render_detections(str(tmp_path / "missing.jpg"), [], str(tmp_path / "b.jpg"))
@@ -1,13 +1,23 @@
+import importlib.metadata
+import io
 import os
 import shutil
 import sqlite3
 import pytest
+from PIL import Image
 from db_for_prediction import DatabaseFactory
 from fastapi.testclient import TestClient
 from app import app
 client = TestClient(app)
 
 
+def remove_db(path):
+    # WAL mode keeps -wal and -shm files next to the DB; a stale WAL would be replayed into the next one
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
 #Clean The DB
 @pytest.fixture(scope="module", autouse=True)
 def setup_and_teardown():
@@ -15,12 +25,13 @@ def setup_and_teardown():
     UPLOAD_DIR = "uploads/original"
     PREDICTED_DIR = "uploads/predicted"
     DB_PATH = "predictions.db"
-    if os.path.exists(DB_PATH):
-        os.remove(DB_PATH)
+    remove_db(DB_PATH)
     if os.path.exists(UPLOAD_DIR):
         shutil.rmtree(UPLOAD_DIR)
     if os.path.exists(PREDICTED_DIR):
         shutil.rmtree(PREDICTED_DIR)
+    if os.path.exists("variants"):
+        shutil.rmtree("variants")
 
     os.makedirs(UPLOAD_DIR, exist_ok=True)
     os.makedirs(PREDICTED_DIR, exist_ok=True)
@@ -46,12 +57,13 @@ def setup_and_teardown():
             box=DUMMY_BOXS[i]
         )
     yield
-    if os.path.exists(DB_PATH):
-        os.remove(DB_PATH)
+    remove_db(DB_PATH)
     if os.path.exists(UPLOAD_DIR):
         shutil.rmtree(UPLOAD_DIR)
     if os.path.exists(PREDICTED_DIR):
         shutil.rmtree(PREDICTED_DIR)
+    if os.path.exists("variants"):
+        shutil.rmtree("variants")
 
 
 def test_health():
@@ -80,4 +92,266 @@ def test_prediction_by_score():
     assert resp.json() == [{'uid': '1'}, {'uid': '2'}] or resp.json() == [{'uid': '2'}, {'uid': '1'}]
 
 
-#Check This Test again
\ No newline at end of file
+#Check This Test again
+
+def test_prediction_by_score_pagination():
+    first = client.get("/predictions/score/0.7", params={"limit": 2})
+    assert first.status_code == 200
+    assert len(first.json()) == 2
+    cursor = first.headers["X-Next-Cursor"]
+    second = client.get("/predictions/score/0.7", params={"limit": 2, "cursor": cursor})
+    assert second.status_code == 200
+    assert "X-Next-Cursor" not in second.headers
+    uids = [item["uid"] for item in first.json() + second.json()]
+    assert sorted(uids) == ["1", "2", "3"]
+
+
+def test_prediction_by_label_stream():
+    resp = client.get("/predictions/label/dog/stream")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    assert resp.text == '{"uid": "2"}\n'
+
+
+def test_prediction_by_label_invalid_cursor():
+    resp = client.get("/predictions/label/dog", params={"cursor": "not-a-cursor"})
+    assert resp.status_code == 400
+
+
+def test_metrics():
+    client.get("/health")
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert 'http_request_duration_seconds_count{method="GET",route="/health",status="200"}' in resp.text
+    assert "yolo_stage_seconds" in resp.text
+
+
+def test_predict():
+    with open("Test/test_image.jpg", "rb") as f:
+        resp = client.post("/predict", files={"file": ("test_image.jpg", f, "image/jpeg")})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["detection_count"] == len(body["labels"])
+    assert client.get(f"/prediction/{body['prediction_uid']}").status_code == 200
+    resp = client.get(f"/prediction/{body['prediction_uid']}/image", headers={"Accept": "image/jpeg"})
+    assert resp.status_code == 200 and resp.content
+    assert client.get(f"/image/predicted/{body['prediction_uid']}.jpg").status_code == 200
+    assert client.get("/image/predicted/missing.jpg").status_code == 404
+
+
+def test_image_conditional_get_and_variants():
+    with open("Test/test_image.jpg", "rb") as f:
+        uid = client.post("/predict", files={"file": ("test_image.jpg", f, "image/jpeg")}).json()["prediction_uid"]
+    resp = client.get(f"/prediction/{uid}/image", headers={"Accept": "image/jpeg"})
+    assert resp.status_code == 200
+    assert "immutable" in resp.headers["cache-control"]
+    etag = resp.headers["etag"]
+    resp = client.get(f"/prediction/{uid}/image", headers={"Accept": "image/jpeg", "If-None-Match": etag})
+    assert resp.status_code == 304 and not resp.content
+    # Same image under its file name, same tag
+    assert client.get(f"/image/predicted/{uid}.jpg", headers={"If-None-Match": etag}).status_code == 304
+
+    resp = client.get(f"/prediction/{uid}/image", params={"w": 64, "format": "webp"})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "image/webp"
+    assert resp.headers["etag"] != etag
+    assert Image.open(io.BytesIO(resp.content)).size[0] == 64
+    assert client.get(f"/image/predicted/{uid}.jpg", params={"format": "gif"}).status_code == 400
+
+    # A wildcard only matches images that exist
+    assert client.get(f"/image/original/{uid}.jpg", headers={"If-None-Match": "*"}).status_code == 304
+    assert client.get("/image/original/missing.jpg", headers={"If-None-Match": "*"}).status_code == 404
+
+
+def test_deferred_rendering(monkeypatch):
+    import app as app_module
+
+    monkeypatch.setattr(app_module, "DEFERRED_RENDERING", True)
+    with open("Test/test_image.jpg", "rb") as f:
+        uid = client.post("/predict", files={"file": ("test_image.jpg", f, "image/jpeg")}).json()["prediction_uid"]
+    predicted_path = os.path.join("uploads", "predicted", uid + ".jpg")
+    assert not os.path.exists(predicted_path)
+
+    resp = client.get(f"/prediction/{uid}/image", headers={"Accept": "image/jpeg"})
+    assert resp.status_code == 200
+    assert Image.open(io.BytesIO(resp.content)).size == Image.open("Test/test_image.jpg").size
+    # Rendered once, then served like any stored image
+    assert os.path.exists(predicted_path)
+    assert client.get(f"/image/predicted/{uid}.jpg").content == resp.content
+
+
+def test_callback_image_url_and_ack(monkeypatch):
+    import app as app_module
+
+    class Recorder:
+        def __init__(self):
+            self.items = []
+            self.full = False
+            self.released = []
+
+        def submit(self, payload):
+            self.items.append(payload)
+            return not self.full
+
+        def ack(self, msg):
+            self.items.append(msg)
+
+        def release(self, msg):
+            self.released.append(msg)
+
+    dispatcher, consumer = Recorder(), Recorder()
+    monkeypatch.setattr(app_module, "callback_dispatcher", dispatcher)
+    monkeypatch.setattr(app_module, "sqs_consumer", consumer)
+    monkeypatch.setattr(app_module, "PUBLIC_URL", "http://yolo:8080")
+    job = {"uid": "u1", "chat_id": 1, "file_path": "photo.jpg", "msg": {"MessageId": "m1"},
+           "image_url": "yolo_to_poly_images/photo.jpg"}
+    app_module.notify_and_ack(job)
+    # Deferred rendering uploads nothing: the URL of the route that renders it instead
+    app_module.notify_and_ack({**job, "image_url": None})
+    assert [payload["image_url"] for payload in dispatcher.items] == [
+        "yolo_to_poly_images/photo.jpg", "http://yolo:8080/prediction/u1/image"]
+    assert len(consumer.items) == 2
+
+    # Dispatcher queue full: released for redelivery, not acked
+    dispatcher.full = True
+    app_module.notify_and_ack(job)
+    assert len(consumer.items) == 2 and consumer.released == [job["msg"]]
+
+
+def test_deferred_rendering_requires_public_url(monkeypatch):
+    import app as app_module
+    monkeypatch.setattr(app_module, "DEFERRED_RENDERING", True)
+    monkeypatch.setattr(app_module, "PUBLIC_URL", "")
+    with pytest.raises(RuntimeError):
+        app_module.start_sqs_polling()
+
+
+def quarter_box(result, names):
+    """
+    Stands in for extract_detections: one box over the second quarter of
+    whatever image the model was given
+    """
+    height, width = result.orig_shape
+    return [("person", 0.9, [width / 4, height / 4, width / 2, height / 2])]
+
+
+def predict_boxes(data):
+    uid = client.post("/predict", files={"file": ("large.jpg", data, "image/jpeg")}).json()["prediction_uid"]
+    return [obj["box"] for obj in client.get(f"/prediction/{uid}").json()["detection_objects"]]
+
+
+def test_reduced_decode_keeps_original_coordinates(monkeypatch):
+    import app as app_module
+
+    monkeypatch.setattr(app_module, "extract_detections", quarter_box)
+    buffer = io.BytesIO()
+    Image.open("Test/test_image.jpg").resize((2400, 1600)).save(buffer, format="JPEG", quality=95)
+    # Decoded at 1/2, boxes still land in 2400x1600 coordinates
+    for draft in (True, False):
+        monkeypatch.setattr(app_module, "JPEG_DRAFT_DECODE", draft)
+        [box] = predict_boxes(buffer.getvalue())
+        assert box == pytest.approx([600, 400, 1200, 800], abs=2)
+
+
+def test_tiled_inference(monkeypatch):
+    import app as app_module
+
+    monkeypatch.setattr(app_module, "extract_detections", quarter_box)
+    monkeypatch.setattr(app_module, "TILED_INFERENCE", True)
+    monkeypatch.setattr(app_module, "TILE_MIN_SIZE", 256)
+    monkeypatch.setattr(app_module, "TILE_SIZE", 160)
+    with open("Test/test_image.jpg", "rb") as f:
+        resp = client.post("/predict", files={"file": ("test_image.jpg", f, "image/jpeg")})
+    assert resp.status_code == 200
+    uid = resp.json()["prediction_uid"]
+    boxes = [obj["box"] for obj in client.get(f"/prediction/{uid}").json()["detection_objects"]]
+    # The whole image's box plus the tiles' boxes, shifted into full-image coordinates
+    assert [75, 50, 150, 100] in boxes
+    assert len(boxes) > 1
+    for x1, y1, x2, y2 in boxes:
+        assert 0 <= x1 <= x2 <= 300 and 0 <= y1 <= y2 <= 200
+    assert os.path.exists(os.path.join("uploads", "predicted", uid + ".jpg"))
+
+
+def test_result_cache_key_does_not_load_model(monkeypatch):
+    import app as app_module
+
+    def no_model():
+        raise AssertionError("the API process loaded a model")
+
+    with open("Test/test_image.jpg", "rb") as f:
+        data = f.read()
+    monkeypatch.setattr(app_module, "get_model", no_model)
+    monkeypatch.setattr(app_module, "IN_MEMORY_IMAGES", True)
+    monkeypatch.setattr(app_module, "download_bytes", lambda bucket, key: data)
+    msg = {"MessageId": "m1", "ReceiptHandle": "r1",
+           "Body": '{"s3_key": "photo.jpg", "chat_id": 1, "file_path": "photo.jpg"}'}
+    job = app_module.download_message(msg)
+    assert job["cache_key"].endswith(":yolov8n.pt/torch:" + importlib.metadata.version("ultralytics"))
+
+
+def test_failed_stage_releases_messages(monkeypatch):
+    import app as app_module
+
+    class Consumer:
+        released = []
+
+        def release(self, msg):
+            self.released.append(msg["MessageId"])
+
+    monkeypatch.setattr(app_module, "sqs_consumer", Consumer())
+    app_module.record_stage_error("Download", RuntimeError("boom"), {"MessageId": "m1", "Body": "{}"})
+    app_module.record_stage_error("Infer", RuntimeError("boom"), [{"msg": {"MessageId": "m2"}},
+                                                                  {"msg": {"MessageId": "m3"}}])
+    assert Consumer.released == ["m1", "m2", "m3"]
+
+
+def test_predict_invalid_image():
+    resp = client.post("/predict", files={"file": ("notes.txt", b"not an image", "text/plain")})
+    assert resp.status_code == 400
+
+
+def test_predict_rejects_when_saturated(monkeypatch):
+    import app as app_module
+    from micro_batcher import MicroBatcher
+
+    class Saturated(MicroBatcher):
+        def submit(self, item):
+            raise app_module.QueueFull("full")
+
+    monkeypatch.setattr(app_module, "predict_batcher", Saturated(lambda items: items))
+    with open("Test/test_image.jpg", "rb") as f:
+        resp = client.post("/predict", files={"file": ("test_image.jpg", f, "image/jpeg")})
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == "1"
+
+
+def test_ready_after_warm_up():
+    import app as app_module
+
+    if not app_module.ready.is_set():
+        resp = client.get("/ready")
+        assert resp.status_code == 503
+        assert resp.json()["status"] == "warming_up"
+    app_module.warm_up()
+    resp = client.get("/ready")
+    assert resp.status_code == 200
+    assert resp.json()["warmup_seconds"] >= 0
+
+
+def test_detections_by_label_and_region():
+    resp = client.get("/detections/label/cat?region=0,0,12,22")
+    assert resp.status_code == 200
+    assert resp.json()[0]["uid"] == "1"
+    assert resp.json()[0]["box"] == [10.0, 20.0, 30.0, 40.0]
+    assert client.get("/detections/label/cat?min_area=1000").json() == []
+    assert client.get("/detections/label/cat?region=1,2,3").status_code == 400
+
+
+def test_stats():
+    resp = client.get("/stats?days=1")
+    assert resp.status_code == 200
+    today = resp.json()["days"][0]
+    assert today["labels"]["bird"]["sessions"] >= 1
+    buckets = client.get("/stats/scores/cat").json()["buckets"]
+    assert len(buckets) == 10 and buckets[9]["count"] >= 1
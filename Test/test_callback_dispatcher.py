@@ -0,0 +1,80 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from callback_dispatcher import CallbackDispatcher
+
+
+class PolybotStub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        server.received.append(body)
+        server.connections.add(self.client_address)
+        status = server.statuses.pop(0) if server.statuses else 200
+        if server.delay:
+            time.sleep(server.delay)
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def polybot():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PolybotStub)
+    server.received, server.connections, server.statuses, server.delay = [], set(), [], 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}/predictions"
+
+
+def test_delivers_over_reused_connections(polybot):
+    dispatcher = CallbackDispatcher(url(polybot), workers=1).start()
+    for i in range(5):
+        assert dispatcher.submit({"uid": str(i)})
+    dispatcher.close(timeout=5)
+    assert [p["uid"] for p in polybot.received] == ["0", "1", "2", "3", "4"]
+    # Keep-alive: one worker, one connection
+    assert len(polybot.connections) == 1
+    assert dispatcher.stats()["sent"] == 5
+
+
+def test_retries_server_errors_with_backoff(polybot):
+    polybot.statuses = [500, 503]
+    dispatcher = CallbackDispatcher(url(polybot), workers=1, backoff=0.01).start()
+    dispatcher.submit({"uid": "a"})
+    dispatcher.close(timeout=5)
+    assert len(polybot.received) == 3
+    assert dispatcher.stats()["sent"] == 1
+
+
+def test_client_errors_are_not_retried(polybot):
+    polybot.statuses = [400]
+    dispatcher = CallbackDispatcher(url(polybot), workers=1, backoff=0.01).start()
+    dispatcher.submit({"uid": "a"})
+    dispatcher.close(timeout=5)
+    assert len(polybot.received) == 1
+    assert dispatcher.stats()["failed"] == 1
+
+
+def test_slow_polybot_times_out_and_full_queue_drops(polybot):
+    polybot.delay = 0.5
+    dispatcher = CallbackDispatcher(url(polybot), workers=1, queue_size=1, timeout=0.1, max_retries=0).start()
+    results = [dispatcher.submit({"uid": str(i)}, block_timeout=0.01) for i in range(5)]
+    assert not all(results)
+    dispatcher.close(timeout=5)
+    stats = dispatcher.stats()
+    assert stats["dropped"] >= 1
+    assert stats["failed"] >= 1
@@ -0,0 +1,402 @@
+import gc
+import sqlite3
+import threading
+from decimal import Decimal
+import pytest
+from db_for_prediction import DatabaseFactory
+
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    db = DatabaseFactory.create_database("sqlite", db_path=str(tmp_path / "predictions.db"))
+    yield db
+    db.close()
+
+
+def test_sqlite_save_prediction_writes_session_and_detections(sqlite_db):
+    sqlite_db.save_prediction("a", "orig.jpg", "pred.jpg", [
+        ("cat", 0.9, [1.0, 2.0, 3.0, 4.0]),
+        ("dog", 0.5, [5.0, 6.0, 7.0, 8.0]),
+    ])
+    with sqlite3.connect(sqlite_db.db_path) as conn:
+        assert conn.execute("SELECT predicted_image FROM prediction_sessions WHERE uid = 'a'").fetchone() == ("pred.jpg",)
+        labels = conn.execute("SELECT label FROM detection_objects WHERE prediction_uid = 'a' ORDER BY id").fetchall()
+    assert labels == [("cat",), ("dog",)]
+
+
+def test_sqlite_save_prediction_concurrent_writers(sqlite_db):
+    threads = [
+        threading.Thread(target=sqlite_db.save_prediction, args=(str(i), "o", "p", [("cat", 0.5, [0, 0, 1, 1])] * 3))
+        for i in range(20)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    with sqlite3.connect(sqlite_db.db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM prediction_sessions").fetchone() == (20,)
+        assert conn.execute("SELECT COUNT(*) FROM detection_objects").fetchone() == (60,)
+
+
+def test_sqlite_save_prediction_duplicate_uid_only_fails_that_request(sqlite_db):
+    sqlite_db.save_prediction("dup", "o", "p", [])
+    with pytest.raises(sqlite3.IntegrityError):
+        sqlite_db.save_prediction("dup", "o", "p", [("cat", 0.5, [0, 0, 1, 1])])
+    sqlite_db.save_prediction("ok", "o", "p", [])
+    with sqlite3.connect(sqlite_db.db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM detection_objects").fetchone() == (0,)
+
+
+@pytest.fixture
+def dynamo_db(monkeypatch):
+    moto = pytest.importorskip("moto")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with moto.mock_aws():
+        db = DatabaseFactory.create_database("dynamodb", env="test", table_prefix="majd_yolo")
+        db.create_tables()
+        yield db
+
+
+def count_calls(db):
+    calls = []
+    db.dynamodb.meta.client.meta.events.register(
+        "before-call.dynamodb", lambda model, **kwargs: calls.append(model.name))
+    return calls
+
+
+def test_dynamodb_save_prediction_batches_writes(dynamo_db):
+    calls = count_calls(dynamo_db)
+    detections = [("person", 0.1 + i / 100, [1.5, 2.5, 3.5, 4.5]) for i in range(30)]
+    dynamo_db.save_prediction("u1", "orig.jpg", "pred.jpg", detections)
+    # 31 items -> two BatchWriteItem requests instead of 31 PutItem calls, then one
+    # transaction for the stats counters (day total, person that day, score buckets 1-3)
+    assert calls == ["BatchWriteItem", "BatchWriteItem", "TransactWriteItems"]
+
+    prediction = dynamo_db.get_prediction_by_uid("u1")
+    assert prediction["predicted_image"] == "pred.jpg"
+    assert len(prediction["detection_objects"]) == 30
+
+
+def test_dynamodb_batch_write_retries_unprocessed_items(dynamo_db, monkeypatch):
+    client = dynamo_db.dynamodb.meta.client
+    real_batch_write = client.batch_write_item
+    responses = []
+
+    def flaky_batch_write(RequestItems):
+        if not responses:
+            # Pretend DynamoDB throttled the whole first request
+            responses.append(RequestItems)
+            return {"UnprocessedItems": RequestItems}
+        return real_batch_write(RequestItems=RequestItems)
+
+    monkeypatch.setattr(client, "batch_write_item", flaky_batch_write)
+    dynamo_db.save_prediction("u2", "orig.jpg", "pred.jpg", [("cat", 0.9, [0, 0, 1, 1])])
+    assert dynamo_db.get_prediction_by_uid("u2")["detection_objects"][0]["label"] == "cat"
+
+
+def test_dynamodb_threads_share_the_low_level_client(dynamo_db):
+    from concurrent.futures import ThreadPoolExecutor
+    tables = [dynamo_db.prediction_sessions_table, dynamo_db.detection_objects_table,
+              dynamo_db.result_cache_table, dynamo_db.stats_table]
+    # No resource objects are shared between threads, only the thread-safe client
+    assert all(table.client is dynamo_db.dynamodb.meta.client for table in tables)
+    for i in range(8):
+        dynamo_db.save_prediction(f"u{i}", "o", "p", [("cat", 0.5, [0, 0, 1, 1])] * 3)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        predictions = list(pool.map(dynamo_db.get_prediction_by_uid, [f"u{i % 8}" for i in range(64)]))
+    assert all(len(prediction["detection_objects"]) == 3 for prediction in predictions)
+
+
+def test_dynamodb_save_prediction_returns_the_stored_record(dynamo_db):
+    detections = [("cat", 0.5, [0, 0, 1, 1]), ("dog", 0.9, [1, 1, 2, 2]), ("cat", 0.75, [2, 2, 3, 3])]
+    record = dynamo_db.save_prediction("u1", "orig.jpg", "pred.jpg", detections)
+    assert record == dynamo_db.get_prediction_by_uid("u1")
+
+
+def test_dynamodb_get_prediction_by_uid_not_found(dynamo_db):
+    from fastapi import HTTPException
+    with pytest.raises(HTTPException) as e:
+        dynamo_db.get_prediction_by_uid("missing")
+    assert e.value.status_code == 404
+
+
+def test_dynamodb_label_pages_follow_last_evaluated_key(dynamo_db):
+    for i in range(5):
+        dynamo_db.save_prediction(f"u{i}", "o", "p", [("cat", 0.5 + i / 10, [0, 0, 1, 1])])
+    items, cursor = dynamo_db.get_predictions_by_label_page("cat", 2)
+    seen = [item["uid"] for item in items]
+    while cursor:
+        items, cursor = dynamo_db.get_predictions_by_label_page("cat", 2, cursor)
+        seen += [item["uid"] for item in items]
+    assert sorted(seen) == [f"u{i}" for i in range(5)]
+    # Several detections of the label in one session: listed once per page
+    dynamo_db.save_prediction("many", "o", "p", [("dog", 0.5, [0, 0, 1, 1])] * 3)
+    assert dynamo_db.get_predictions_by_label_page("dog", 10) == ([{"uid": "many"}], None)
+    assert len(dynamo_db.get_predictions_by_score(0.7)) == 3
+
+
+BOXES = [
+    ("u1", "cat", 0.9, [0.0, 0.0, 10.0, 10.0]),
+    ("u2", "cat", 0.8, [100.0, 100.0, 300.0, 200.0]),
+    ("u3", "dog", 0.7, [0.0, 0.0, 500.0, 500.0]),
+]
+
+
+def save_boxes(db):
+    for uid, label, score, box in BOXES:
+        db.save_prediction(uid, "o", "p", [(label, score, box)])
+
+
+def test_sqlite_boxes_are_numeric_arrays(sqlite_db):
+    save_boxes(sqlite_db)
+    assert sqlite_db.get_prediction_by_uid("u2")["detection_objects"][0]["box"] == [100.0, 100.0, 300.0, 200.0]
+    with sqlite3.connect(sqlite_db.db_path) as conn:
+        assert conn.execute("SELECT area, box FROM detection_objects WHERE prediction_uid = 'u2'").fetchone() == \
+            (20000.0, None)
+
+
+def test_sqlite_detections_by_area_and_region(sqlite_db):
+    save_boxes(sqlite_db)
+    items, cursor = sqlite_db.get_detections("cat", min_area=1000)
+    assert [item["uid"] for item in items] == ["u2"] and cursor is None
+    items, _ = sqlite_db.get_detections("cat", region=(5.0, 5.0, 50.0, 50.0))
+    assert [item["uid"] for item in items] == ["u1"]
+    assert sqlite_db.get_detections("cat", min_area=1000, region=(5.0, 5.0, 50.0, 50.0))[0] == []
+    first, cursor = sqlite_db.get_detections("cat", limit=1)
+    second, _ = sqlite_db.get_detections("cat", limit=1, cursor=cursor)
+    assert [first[0]["uid"], second[0]["uid"]] == ["u1", "u2"]
+
+
+def test_sqlite_detection_queries_use_indexes(sqlite_db):
+    with sqlite3.connect(sqlite_db.db_path) as conn:
+        plan = " ".join(row[3] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM detection_objects WHERE label = ? AND area >= ?", ("cat", 10)))
+        assert "idx_label_area" in plan
+        plan = " ".join(row[3] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT d.id FROM detection_boxes b JOIN detection_objects d ON d.id = b.id "
+            "WHERE b.x1 <= 1 AND b.x2 >= 0 AND b.y1 <= 1 AND b.y2 >= 0 AND d.label = 'cat'"))
+        assert "VIRTUAL TABLE INDEX" in plan and "SCAN d" not in plan
+
+
+def test_sqlite_migrates_text_boxes(tmp_path):
+    path = str(tmp_path / "old.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE prediction_sessions (uid TEXT PRIMARY KEY, timestamp DATETIME "
+                     "DEFAULT CURRENT_TIMESTAMP, original_image TEXT, predicted_image TEXT)")
+        conn.execute("CREATE TABLE detection_objects (id INTEGER PRIMARY KEY AUTOINCREMENT, prediction_uid TEXT, "
+                     "label TEXT, score REAL, box TEXT)")
+        conn.execute("INSERT INTO prediction_sessions (uid, original_image, predicted_image) VALUES ('old', 'o', 'p')")
+        conn.execute("INSERT INTO detection_objects (prediction_uid, label, score, box) "
+                     "VALUES ('old', 'cat', 0.9, '[1.5, 2.0, 11.5, 12.0]')")
+        conn.execute("INSERT INTO detection_objects (prediction_uid, label, score, box) "
+                     "VALUES ('old', 'dog', 0.8, 'not a box')")
+    db = DatabaseFactory.create_database("sqlite", db_path=path)
+    cat, dog = db.get_prediction_by_uid("old")["detection_objects"]
+    assert cat["box"] == [1.5, 2.0, 11.5, 12.0]
+    # Unparseable legacy boxes come back as None, not a list of Nones
+    assert dog["box"] is None
+    items, _ = db.get_detections("cat", min_area=100, region=(0.0, 0.0, 2.0, 3.0))
+    assert [item["uid"] for item in items] == ["old"]
+    db.close()
+
+
+def test_dynamodb_detections_by_area_and_region(dynamo_db):
+    save_boxes(dynamo_db)
+    assert dynamo_db.get_prediction_by_uid("u2")["detection_objects"][0]["box"] == [100.0, 100.0, 300.0, 200.0]
+    items, _ = dynamo_db.get_detections("cat", min_area=1000)
+    assert [item["uid"] for item in items] == ["u2"]
+    items, _ = dynamo_db.get_detections("cat", region=(5.0, 5.0, 50.0, 50.0))
+    assert [item["uid"] for item in items] == ["u1"]
+
+
+def test_dynamodb_migrates_string_boxes(dynamo_db):
+    from decimal import Decimal
+    dynamo_db.detection_objects_table.put_item(Item={
+        'prediction_uid': 'old', 'score': '0.9_0', 'label': 'cat', 'score_partition': 'score',
+        'label_score': Decimal('0.9'), 'box': str([Decimal('1.5'), Decimal('2.0'), Decimal('11.5'), Decimal('12.0')])
+    })
+    assert dynamo_db.migrate_boxes() == 1
+    items, _ = dynamo_db.get_detections("cat", min_area=100)
+    assert items[0]["box"] == [1.5, 2.0, 11.5, 12.0] and items[0]["area"] == 100.0
+    assert dynamo_db.migrate_boxes() == 0
+
+
+def test_dynamodb_unparseable_box_is_none(dynamo_db):
+    from decimal import Decimal
+    dynamo_db.save_prediction("old", "o", "p", [])
+    dynamo_db.detection_objects_table.put_item(Item={
+        'prediction_uid': 'old', 'score': '0.9_0', 'label': 'cat', 'score_partition': 'score',
+        'label_score': Decimal('0.9'), 'box': 'not a box'
+    })
+    assert dynamo_db.get_prediction_by_uid("old")["detection_objects"][0]["box"] is None
+
+
+def test_sqlite_aggregates_follow_writes(sqlite_db):
+    sqlite_db.save_prediction("a", "o", "p", [("cat", 0.95, [0, 0, 1, 1]), ("cat", 0.42, [0, 0, 1, 1])])
+    sqlite_db.save_prediction("b", "o", "p", [("dog", 0.5, [0, 0, 1, 1])])
+    sqlite_db.save_prediction("c", "o", "p", [])
+    # The per-row methods keep the aggregates up to date as well
+    sqlite_db.save_prediction_session("d", "o", "p")
+    sqlite_db.save_detection_object(0, "d", "cat", 0.3, [0, 0, 1, 1])
+    sqlite_db.save_detection_object(1, "d", "cat", 0.35, [0, 0, 1, 1])
+
+    today = sqlite_db.get_stats(1)[0]
+    assert (today["sessions"], today["detections"]) == (4, 5)
+    assert today["labels"] == {"cat": {"sessions": 2, "detections": 4}, "dog": {"sessions": 1, "detections": 1}}
+    counts = [bucket["count"] for bucket in sqlite_db.get_score_histogram("cat")]
+    assert counts == [0, 0, 0, 2, 1, 0, 0, 0, 0, 1]
+    assert sorted(item["uid"] for item in sqlite_db.get_predictions_by_score(0.45)) == ["a", "b"]
+    assert sqlite_db.get_predictions_by_score_page(0.3, 2)[0] == [{"uid": "a"}, {"uid": "b"}]
+
+
+def test_sqlite_aggregates_are_built_for_existing_rows(tmp_path):
+    path = str(tmp_path / "old.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE prediction_sessions (uid TEXT PRIMARY KEY, timestamp DATETIME "
+                     "DEFAULT CURRENT_TIMESTAMP, original_image TEXT, predicted_image TEXT)")
+        conn.execute("CREATE TABLE detection_objects (id INTEGER PRIMARY KEY AUTOINCREMENT, prediction_uid TEXT, "
+                     "label TEXT, score REAL, box TEXT)")
+        conn.execute("INSERT INTO prediction_sessions (uid, original_image, predicted_image) VALUES ('old', 'o', 'p')")
+        conn.executemany("INSERT INTO detection_objects (prediction_uid, label, score, box) VALUES ('old', ?, ?, "
+                         "'[0, 0, 1, 1]')", [("cat", 0.9), ("cat", 0.2), ("dog", 0.6)])
+    db = DatabaseFactory.create_database("sqlite", db_path=path)
+    today = db.get_stats(1)[0]
+    assert (today["sessions"], today["detections"]) == (1, 3)
+    assert today["labels"]["cat"] == {"sessions": 1, "detections": 2}
+    assert db.get_score_histogram("dog")[6]["count"] == 1
+    assert db.get_predictions_by_score(0.8) == [{"uid": "old"}]
+    db.close()
+
+
+def test_dynamodb_aggregates_follow_writes(dynamo_db):
+    dynamo_db.save_prediction("a", "o", "p", [("cat", 0.95, [0, 0, 1, 1]), ("cat", 0.42, [0, 0, 1, 1])])
+    dynamo_db.save_prediction_session("d", "o", "p")
+    dynamo_db.save_detection_object(0, "d", "cat", 0.3, [0, 0, 1, 1])
+    dynamo_db.save_detection_object(1, "d", "cat", 0.35, [0, 0, 1, 1])
+    today = dynamo_db.get_stats(3)
+    assert len(today) == 1
+    assert (today[0]["sessions"], today[0]["detections"]) == (2, 4)
+    assert today[0]["labels"] == {"cat": {"sessions": 2, "detections": 4}}
+    counts = [bucket["count"] for bucket in dynamo_db.get_score_histogram("cat")]
+    assert counts == [0, 0, 0, 2, 1, 0, 0, 0, 0, 1]
+    assert dynamo_db.prediction_sessions_table.get_item(Key={"uid": "d"})["Item"]["max_score"] == Decimal("0.35")
+
+
+def test_dynamodb_retried_write_is_counted_once(dynamo_db):
+    for _ in range(2):
+        dynamo_db.save_prediction("a", "o", "p", [("cat", 0.95, [0, 0, 1, 1]), ("dog", 0.5, [0, 0, 1, 1])])
+    today = dynamo_db.get_stats(1)[0]
+    assert (today["sessions"], today["detections"]) == (1, 2)
+    assert today["labels"] == {"cat": {"sessions": 1, "detections": 1}, "dog": {"sessions": 1, "detections": 1}}
+    assert sum(bucket["count"] for bucket in dynamo_db.get_score_histogram("cat")) == 1
+
+
+def test_dynamodb_transaction_conflicts_are_retried(dynamo_db, monkeypatch):
+    from botocore.exceptions import ClientError
+    client = dynamo_db.dynamodb.meta.client
+    real_transact_write = client.transact_write_items
+    conflicts = []
+
+    def conflicting_transact_write(TransactItems):
+        if not conflicts:
+            conflicts.append(TransactItems)
+            raise ClientError({"Error": {"Code": "TransactionCanceledException"},
+                               "CancellationReasons": [{"Code": "None"}, {"Code": "TransactionConflict"}]},
+                              "TransactWriteItems")
+        return real_transact_write(TransactItems=TransactItems)
+
+    monkeypatch.setattr(client, "transact_write_items", conflicting_transact_write)
+    dynamo_db.save_prediction("a", "o", "p", [("cat", 0.9, [0, 0, 1, 1])])
+    assert conflicts and dynamo_db.get_stats(1)[0]["detections"] == 1
+
+
+def test_dynamodb_counter_failure_keeps_the_stored_write(dynamo_db, monkeypatch):
+    from botocore.exceptions import ClientError
+    import metrics
+    client = dynamo_db.dynamodb.meta.client
+
+    def failing_transact_write(TransactItems):
+        raise ClientError({"Error": {"Code": "ProvisionedThroughputExceededException"}}, "TransactWriteItems")
+
+    monkeypatch.setattr(client, "transact_write_items", failing_transact_write)
+    errors = metrics.ERRORS.labels("stats")._value.get()
+    dynamo_db.save_prediction("a", "o", "p", [("cat", 0.9, [0, 0, 1, 1])])
+    assert dynamo_db.get_prediction_by_uid("a")["detection_objects"][0]["label"] == "cat"
+    assert metrics.ERRORS.labels("stats")._value.get() == errors + 1
+
+
+def test_dynamodb_day_total_is_sharded_and_markers_expire(dynamo_db):
+    import time
+    for i in range(20):
+        dynamo_db.save_prediction(f"u{i}", "o", "p", [("cat", 0.9, [0, 0, 1, 1])])
+    assert dynamo_db.get_stats(1)[0]["sessions"] == 20
+    items = dynamo_db.stats_table.scan()["Items"]
+    assert len({item["sk"] for item in items if item["sk"].startswith("total#")}) > 1
+    markers = [item for item in items if item["pk"].startswith("counted#")]
+    assert len(markers) == 20 and all(item["expires_at"] > time.time() for item in markers)
+    ttl = dynamo_db.dynamodb.meta.client.describe_time_to_live(TableName=dynamo_db.stats_table.name)
+    assert ttl["TimeToLiveDescription"]["AttributeName"] == "expires_at"
+
+
+def test_dynamodb_score_queries_read_session_max_score(dynamo_db):
+    dynamo_db.save_prediction("a", "o", "p", [("cat", 0.95, [0, 0, 1, 1]), ("cat", 0.9, [0, 0, 1, 1])])
+    dynamo_db.save_prediction("b", "o", "p", [("dog", 0.4, [0, 0, 1, 1])])
+    dynamo_db.save_prediction("c", "o", "p", [])
+    calls = count_calls(dynamo_db)
+    # One item per session, not one per matching detection
+    assert dynamo_db.get_predictions_by_score(0.8) == [{"uid": "a"}]
+    assert sorted(item["uid"] for item in dynamo_db.get_predictions_by_score(0.3)) == ["a", "b"]
+    items, cursor = dynamo_db.get_predictions_by_score_page(0.3, 1)
+    items += dynamo_db.get_predictions_by_score_page(0.3, 1, cursor)[0]
+    assert sorted(item["uid"] for item in items) == ["a", "b"]
+    assert "Scan" not in calls
+
+
+def test_dynamodb_migrates_max_score(dynamo_db):
+    dynamo_db.save_prediction("old", "o", "p", [])
+    for c, score in enumerate(["0.3", "0.8"]):
+        dynamo_db.detection_objects_table.put_item(Item=dynamo_db._detection_item(c, "old", "cat", score, [0, 0, 1, 1]))
+    assert dynamo_db.get_predictions_by_score(0.5) == []
+    assert dynamo_db.migrate_max_score() == 1
+    assert dynamo_db.get_predictions_by_score(0.5) == [{"uid": "old"}]
+    assert dynamo_db.migrate_max_score() == 0
+
+
+def test_sqlite_inverted_box_is_normalised(sqlite_db):
+    sqlite_db.save_prediction("inv", "o", "p", [("cat", 0.5, [10.0, 20.0, 0.0, 0.0])])
+    assert sqlite_db.get_prediction_by_uid("inv")["detection_objects"][0]["box"] == [0.0, 0.0, 10.0, 20.0]
+
+
+def test_sqlite_reads_reuse_one_read_only_connection_per_thread(sqlite_db):
+    sqlite_db.save_prediction("u1", "o1.jpg", "p1.jpg", [("dog", 0.9, [0, 0, 1, 1])])
+    assert sqlite_db.get_predicted_image("u1") == "p1.jpg"
+    conn = sqlite_db._read_connection()
+    assert sqlite_db.get_prediction_by_uid("u1")["detection_objects"][0]["label"] == "dog"
+    assert sqlite_db._read_connection() is conn
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute("DELETE FROM prediction_sessions")
+
+    # Other threads get their own connection, and see later commits
+    sqlite_db.save_prediction("u2", "o2.jpg", "p2.jpg", [])
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append((sqlite_db._read_connection(),
+                                                          sqlite_db.get_predicted_image("u2"))))
+    thread.start()
+    thread.join()
+    assert seen[0][0] is not conn and seen[0][1] == "p2.jpg"
+    del thread, seen
+
+    # Connections of threads that exited are closed, not kept forever
+    threads = [threading.Thread(target=sqlite_db.get_predicted_image, args=("u2",)) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    del threads, thread
+    gc.collect()
+    assert sqlite_db._read_connections == {conn}
+
+    sqlite_db.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
@@ -0,0 +1,63 @@
+import os
+import pytest
+import S3_requests
+from image_store import ImageStore
+
+BUCKET = "test-bucket"
+
+
+def write(path, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    return str(path)
+
+
+@pytest.fixture
+def s3_bucket(monkeypatch):
+    moto = pytest.importorskip("moto")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "eu-west-1")
+    monkeypatch.setattr(S3_requests, "_s3_client", None)
+    with moto.mock_aws():
+        S3_requests.get_s3_client().create_bucket(
+            Bucket=BUCKET, CreateBucketConfiguration={"LocationConstraint": "eu-west-1"})
+        yield BUCKET
+
+
+def test_evicts_least_recently_used_within_budget(tmp_path):
+    store = ImageStore(str(tmp_path), max_bytes=250)
+    a = write(tmp_path / "original" / "a.jpg", 100)
+    store.added(a)
+    b = write(tmp_path / "original" / "b.jpg", 100)
+    store.added(b)
+    assert store.get(a) == a  # a is now the most recently used
+    store.added(write(tmp_path / "predicted" / "c.jpg", 100))
+    assert not os.path.exists(b) and os.path.exists(a)
+    assert store.get(b) is None
+    stats = store.stats()
+    assert stats["bytes"] == 200 and stats["evictions"] == 1
+
+
+def test_rejects_paths_outside_root(tmp_path):
+    store = ImageStore(str(tmp_path / "uploads"))
+    write(tmp_path / "secret.txt", 10)
+    assert store.get(str(tmp_path / "uploads" / "original" / ".." / ".." / "secret.txt")) is None
+
+
+def test_other_replica_fetches_through_s3(tmp_path, s3_bucket):
+    writer = ImageStore(str(tmp_path / "writer"), bucket=s3_bucket)
+    path = write(tmp_path / "writer" / "predicted" / "u1.jpg", 50)
+    assert writer.added(path)
+    S3_requests.upload_bytes(b"original", s3_bucket, "photos/u1.jpg")
+    assert writer.added(str(tmp_path / "writer" / "original" / "u1.jpg"), s3_source="photos/u1.jpg")
+
+    reader = ImageStore(str(tmp_path / "reader"), bucket=s3_bucket)
+    fetched = reader.get(str(tmp_path / "reader" / "predicted" / "u1.jpg"))
+    assert open(fetched, "rb").read() == b"x" * 50
+    original = reader.prefetch(str(tmp_path / "reader" / "original" / "u1.jpg")).result(5)
+    assert open(original, "rb").read() == b"original"
+    assert reader.prefetch(original) is None
+    assert reader.get(str(tmp_path / "reader" / "predicted" / "missing.jpg")) is None
+    assert reader.stats()["s3_fetches"] == 2
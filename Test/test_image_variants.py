@@ -0,0 +1,49 @@
+import os
+from PIL import Image
+from starlette.requests import Request
+from image_variants import VariantCache, etag_matches, image_etag, render_variant
+
+
+def write_image(path, size=(400, 200), image_format="JPEG"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.new("RGB", size, (200, 30, 30)).save(path, format=image_format)
+    return str(path)
+
+
+def request_with(headers):
+    return Request({"type": "http", "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()]})
+
+
+def test_render_resizes_and_reencodes(tmp_path):
+    source = write_image(tmp_path / "a.jpg")
+    render_variant(source, str(tmp_path / "out" / "a.webp"), width=100, image_format="webp")
+    with Image.open(tmp_path / "out" / "a.webp") as image:
+        assert image.format == "WEBP" and image.size == (100, 50)
+    # Never scaled up, and the source format is kept without a format
+    render_variant(source, str(tmp_path / "out" / "big.jpg"), width=1000)
+    with Image.open(tmp_path / "out" / "big.jpg") as image:
+        assert image.format == "JPEG" and image.size == (400, 200)
+
+
+def test_variant_cache_renders_once_within_budget(tmp_path):
+    source = write_image(tmp_path / "uploads" / "predicted" / "a.png", image_format="PNG")
+    cache = VariantCache(str(tmp_path / "variants"), max_bytes=10 ** 6)
+    first = cache.get(source, "predicted/a.png", 64, "jpeg")
+    assert first.endswith(os.path.join("predicted", "a.w64.jpg"))
+    assert cache.get(source, "predicted/a.png", 64, "jpeg") == first
+    stats = cache.stats()
+    assert stats["renders"] == 1 and stats["hits"] == 1 and stats["files"] == 1
+
+    cache.store.max_bytes = 1
+    cache.get(source, "predicted/a.png", 32)
+    assert not os.path.exists(first) and cache.stats()["evictions"] == 1
+
+
+def test_etag_matching():
+    etag = image_etag("predicted/a.jpg", 64, "webp")
+    assert etag == image_etag("predicted/a.jpg", 64, "webp")
+    assert etag != image_etag("predicted/a.jpg")
+    assert etag_matches(request_with({"If-None-Match": f'"other", W/{etag}'}), etag)
+    assert etag_matches(request_with({"If-None-Match": "*"}), etag)
+    assert not etag_matches(request_with({"If-None-Match": '"other"'}), etag)
+    assert not etag_matches(request_with({}), etag)
@@ -0,0 +1,77 @@
+import importlib.util
+import os
+import shutil
+import threading
+import time
+import pytest
+import inference_backends
+from inference_backends import load_backend, prepare_backend
+from inference_pool import extract_detections
+
+IMAGES = ["Test/test_image.jpg", "images/file_0.jpg", "images/file_1.jpg"]
+
+pytestmark = pytest.mark.skipif(not os.path.exists("yolov8n.pt"), reason="needs the yolov8n.pt weights")
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        load_backend("tensorrt", "yolov8n.pt")
+
+
+def test_concurrent_loads_export_once(monkeypatch, tmp_path):
+    exports = []
+
+    class FakeYolo:
+        def __init__(self, path, task=None):
+            self.ckpt_path = path
+
+        def export(self, format, dynamic):
+            exports.append(self.ckpt_path)
+            exported = os.path.splitext(self.ckpt_path)[0] + ".onnx"
+            with open(exported, "w") as f:
+                f.write("partial")
+                time.sleep(0.2)  # a reader must never see this half-written file
+                f.write(" model")
+            return exported
+
+    monkeypatch.setattr(inference_backends, "_yolo", FakeYolo)
+    weights = str(tmp_path / "yolov8n.pt")
+    open(weights, "w").close()
+    loaded = []
+    threads = [threading.Thread(target=lambda: loaded.append(load_backend("onnx", weights).model.ckpt_path))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    prepare_backend("onnx", weights)
+    for thread in threads:
+        thread.join()
+
+    export = str(tmp_path / "yolov8n.onnx")
+    assert len(exports) == 1
+    assert loaded == [export] * 4
+    with open(export) as f:
+        assert f.read() == "partial model"
+    assert sorted(os.listdir(tmp_path)) == ["yolov8n.onnx", "yolov8n.onnx.lock", "yolov8n.pt"]
+
+
+def assert_same_detections(expected, actual):
+    assert [label for label, _, _ in actual] == [label for label, _, _ in expected]
+    for (_, score_a, box_a), (_, score_b, box_b) in zip(expected, actual):
+        assert score_a == pytest.approx(score_b, abs=0.02)
+        assert box_a == pytest.approx(box_b, abs=2.0)
+
+
+@pytest.mark.parametrize("backend", ["onnx", "openvino"])
+def test_backend_accuracy_parity_with_torch(backend, tmp_path):
+    runtime = {"onnx": "onnxruntime", "openvino": "openvino"}[backend]
+    if importlib.util.find_spec(runtime) is None:
+        pytest.skip(f"{runtime} is not installed")
+    # Export into a temp dir so the test doesn't leave exports next to the real weights
+    weights = str(tmp_path / "yolov8n.pt")
+    shutil.copy("yolov8n.pt", weights)
+
+    reference = load_backend("torch", weights)
+    exported = load_backend(backend, weights)
+    for expected, actual in zip(reference(IMAGES, verbose=False), exported(IMAGES, verbose=False)):
+        assert_same_detections(extract_detections(expected, reference.names),
+                               extract_detections(actual, exported.names))
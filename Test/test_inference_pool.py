@@ -0,0 +1,63 @@
+import os
+import pytest
+from inference_pool import InferenceProcessPool, default_pool_size, default_threads_per_process, extract_detections
+
+IMAGE = "Test/test_image.jpg"
+
+
+def test_default_sizes_leave_a_core_for_the_api():
+    processes = default_pool_size()
+    assert processes >= 1
+    assert processes * default_threads_per_process(processes) <= max(1, (os.cpu_count() or 1) - 1)
+
+
+@pytest.mark.skipif(not os.path.exists("yolov8n.pt"), reason="needs the yolov8n.pt weights")
+def test_pool_matches_in_process_model():
+    from ultralytics import YOLO
+    model = YOLO("yolov8n.pt")
+    expected = extract_detections(model(IMAGE, device="cpu", verbose=False)[0], model.names)
+
+    pool = InferenceProcessPool("yolov8n.pt", processes=1, threads_per_process=1).start()
+    try:
+        outputs = pool.infer([IMAGE, IMAGE])
+        # e.g. tiles, whose frames are never used
+        unplotted = pool.infer([IMAGE, IMAGE], plot=[True, False])
+    finally:
+        pool.close()
+    assert len(outputs) == 2
+    assert [d[0] for d in outputs[0]["detections"]] == [d[0] for d in expected]
+    assert outputs[0]["annotated_frame"].ndim == 3
+    assert unplotted[0]["annotated_frame"].ndim == 3 and unplotted[1]["annotated_frame"] is None
+    assert unplotted[1]["detections"] == outputs[1]["detections"]
+
+
+@pytest.mark.skipif(not os.path.exists("yolov8n.pt"), reason="needs the yolov8n.pt weights")
+def test_dead_worker_fails_its_batch_and_is_replaced():
+    import signal
+    import threading
+    import time
+
+    pool = InferenceProcessPool("yolov8n.pt", processes=1, threads_per_process=1).start()
+    try:
+        errors = []
+
+        def infer():
+            try:
+                pool.infer([IMAGE] * 16)
+            except RuntimeError as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=infer)
+        thread.start()
+        deadline = time.monotonic() + 120
+        while pool._current[0].value < 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        killed = pool._workers[0]
+        os.kill(killed.pid, signal.SIGKILL)
+        thread.join(30)
+        assert not thread.is_alive() and errors
+        # The replacement takes the next batch
+        assert len(pool.infer([IMAGE])) == 1
+        assert pool.alive() == 1 and pool._workers[0] is not killed
+    finally:
+        pool.close()
@@ -0,0 +1,95 @@
+import time
+import pytest
+from fastapi import HTTPException
+from db_for_prediction import DatabaseFactory
+from lookup_cache import CachedDatabaseHandler, TTLCache
+
+DETECTIONS = [("cat", 0.9, [1.0, 2.0, 3.0, 4.0])]
+
+
+class CountingHandler:
+    """
+    Wraps a real handler and counts the reads that reach it
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.reads = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        if name.startswith("get_"):
+            def counted(*args, **kwargs):
+                self.reads += 1
+                return attr(*args, **kwargs)
+            return counted
+        return attr
+
+
+@pytest.fixture
+def handler(tmp_path):
+    inner = CountingHandler(DatabaseFactory.create_database("sqlite", db_path=str(tmp_path / "lookup.db")))
+    yield inner, CachedDatabaseHandler(inner, query_ttl=60)
+    inner.db.close()
+
+
+def test_ttl_cache_expiry_and_eviction():
+    cache = TTLCache(max_size=2, ttl=0.05)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.put("c", 3)
+    assert cache.get("a") == (False, None)
+    assert cache.get("c") == (True, 3)
+    time.sleep(0.06)
+    assert cache.get("c") == (False, None)
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2
+    # "b" expired too but is only dropped when it is looked up
+    assert stats["size"] == 1 and stats["memory_bytes"] > 0
+
+
+def test_write_primes_uid_and_image_lookups(handler):
+    inner, db = handler
+    db.save_prediction("u1", "orig.jpg", "pred.jpg", DETECTIONS)
+    primed_reads = inner.reads
+    assert db.get_prediction_by_uid("u1")["detection_objects"][0]["label"] == "cat"
+    assert db.get_predicted_image("u1") == "pred.jpg"
+    assert inner.reads == primed_reads
+    assert db.stats()["predictions"]["hits"] == 1
+    assert db.stats()["predictions"]["memory_bytes"] > 0
+
+
+def test_record_returned_by_the_write_is_cached_without_a_read(handler):
+    inner, db = handler
+    record = {"uid": "u1", "detection_objects": []}
+    inner.db.save_prediction = lambda *args: record
+    db.save_prediction("u1", "orig.jpg", "pred.jpg", [])
+    assert inner.reads == 0
+    assert db.get_prediction_by_uid("u1") is record
+
+
+def test_missing_uid_is_not_cached(handler):
+    inner, db = handler
+    with pytest.raises(HTTPException):
+        db.get_prediction_by_uid("late")
+    db.save_prediction("late", "orig.jpg", "pred.jpg", DETECTIONS)
+    assert db.get_prediction_by_uid("late")["uid"] == "late"
+
+
+def test_writes_invalidate_matching_queries(handler):
+    inner, db = handler
+    db.save_prediction("u1", "orig.jpg", "pred.jpg", DETECTIONS)
+    assert db.get_predictions_by_label("cat") == [{"uid": "u1"}]
+    assert db.get_predictions_by_score(0.5) == [{"uid": "u1"}]
+    db.get_predictions_by_label("dog")
+    reads = inner.reads
+    db.get_predictions_by_label("cat")
+    assert inner.reads == reads
+
+    db.save_prediction("u2", "orig.jpg", "pred.jpg", [("cat", 0.4, [0, 0, 1, 1])])
+    reads = inner.reads
+    assert len(db.get_predictions_by_label("cat")) == 2
+    # A 0.4 detection can't change the >= 0.5 results, and no dog was written
+    assert db.get_predictions_by_score(0.5) == [{"uid": "u1"}]
+    db.get_predictions_by_label("dog")
+    assert inner.reads == reads + 1
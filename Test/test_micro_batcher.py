@@ -0,0 +1,72 @@
+import asyncio
+import threading
+import pytest
+from micro_batcher import MicroBatcher, QueueFull
+
+
+def test_concurrent_requests_share_one_call():
+    batches = []
+
+    def double(items):
+        batches.append(len(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(double, max_batch_size=8, max_wait=0.2).start()
+
+    async def run_all():
+        return await asyncio.gather(*(batcher.run(i) for i in range(5)))
+
+    assert asyncio.run(run_all()) == [0, 2, 4, 6, 8]
+    assert batches == [5]
+
+
+def test_errors_reach_every_caller():
+    def fail(items):
+        raise RuntimeError("model crashed")
+
+    batcher = MicroBatcher(fail, max_wait=0).start()
+    with pytest.raises(RuntimeError):
+        batcher.submit(1).result(5)
+
+
+def test_rejects_when_queue_is_full():
+    release = threading.Event()
+
+    def slow(items):
+        release.wait()
+        return items
+
+    batcher = MicroBatcher(slow, max_batch_size=1, max_wait=0, queue_size=2).start()
+    first = batcher.submit(0)
+    # Wait for the worker to take the first item, then fill the queue
+    while batcher.stage.busy == 0:
+        pass
+    batcher.submit(1)
+    batcher.submit(2)
+    with pytest.raises(QueueFull):
+        batcher.submit(3)
+    assert batcher.rejected == 1
+    release.set()
+    assert first.result(5) == 0
+
+
+def test_cancelled_caller_does_not_block_its_batch():
+    seen = []
+    release = threading.Event()
+
+    def double(items):
+        seen.append(list(items))
+        return [item * 2 for item in items]
+
+    def blocker(items):
+        release.wait(5)
+        return double(items)
+
+    batcher = MicroBatcher(blocker, max_batch_size=8, max_wait=0.2).start()
+    first = batcher.submit(0)  # holds the worker until released
+    cancelled, kept = batcher.submit(1), batcher.submit(2)
+    assert cancelled.cancel()
+    release.set()
+    assert kept.result(5) == 4 and first.result(5) == 0
+    # The cancelled item never reached the model
+    assert [item for batch in seen for item in batch] == [0, 2]
@@ -0,0 +1,67 @@
+import threading
+import time
+from pipeline import Pipeline
+
+
+def test_pipeline_batches_and_forwards():
+    done = []
+    finished = threading.Event()
+    batches = []
+
+    def infer(items):
+        batches.append(len(items))
+        return [item * 2 for item in items]
+
+    def collect(item):
+        done.append(item)
+        if len(done) == 6:
+            finished.set()
+
+    pipeline = Pipeline()
+    pipeline.add_stage("Infer", infer, batch_size=4, batch_wait=0.2)
+    pipeline.add_stage("Collect", collect)
+    for i in range(6):
+        pipeline.put(i)
+    pipeline.start()
+    assert finished.wait(5)
+    assert sorted(done) == [0, 2, 4, 6, 8, 10]
+    assert max(batches) <= 4
+
+
+def test_pipeline_applies_backpressure():
+    release = threading.Event()
+
+    def slow(item):
+        release.wait()
+        return item
+
+    pipeline = Pipeline()
+    pipeline.add_stage("Slow", slow, queue_size=2)
+    pipeline.start()
+    for i in range(3):
+        pipeline.put(i)
+    time.sleep(0.1)
+    # One item is held by the worker, the queue is full again
+    assert pipeline.stages[0].free_slots() == 0
+    release.set()
+    assert pipeline.wait_for_capacity() > 0
+
+
+def test_pipeline_passes_failed_items_to_on_error():
+    failed = []
+    finished = threading.Event()
+
+    def infer(items):
+        raise RuntimeError("model crashed")
+
+    def on_error(stage, error, item):
+        failed.append((stage, str(error), item))
+        finished.set()
+
+    pipeline = Pipeline()
+    pipeline.add_stage("Infer", infer, batch_size=4, batch_wait=0.2, on_error=on_error)
+    for i in range(3):
+        pipeline.put(i)
+    pipeline.start()
+    assert finished.wait(5)
+    assert failed == [("Infer", "model crashed", [0, 1, 2])]
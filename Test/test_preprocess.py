@@ -0,0 +1,57 @@
+import io
+import numpy as np
+from PIL import Image
+from preprocess import decode_for_model, draft_factor, merge_tile_detections, scale_detections, split_tiles, tile_windows
+
+
+def encode(size, image_format="JPEG"):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (40, 80, 120)).save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def test_draft_factor_keeps_model_input_size():
+    assert draft_factor((640, 480)) == 1
+    assert draft_factor((1280, 960)) == 2
+    assert draft_factor((4032, 3024)) == 4
+    assert draft_factor((8000, 6000)) == 8
+
+
+def test_large_jpeg_is_decoded_at_reduced_size():
+    image, scale = decode_for_model(encode((4032, 3024)))
+    assert image.shape == (756, 1008, 3) and scale == 4
+    image, scale = decode_for_model(encode((4032, 3024)), draft=False)
+    assert image.shape == (3024, 4032, 3) and scale == 1
+    # Only JPEGs have a cheap reduced decode
+    image, scale = decode_for_model(encode((2000, 1500), "PNG"))
+    assert image.shape == (1500, 2000, 3) and scale == 1
+    assert decode_for_model(b"not an image") == (None, 1.0)
+
+
+def test_tiles_cover_the_image_with_overlap():
+    windows = tile_windows(3000, 1000, 1280, overlap=0.2)
+    assert windows[0] == (0, 0, 1280, 1000) and windows[-1] == (1720, 0, 3000, 1000)
+    covered = np.zeros((1000, 3000), dtype=bool)
+    for x1, y1, x2, y2 in windows:
+        covered[y1:y2, x1:x2] = True
+    assert covered.all()
+    image = np.zeros((1000, 3000, 3), dtype=np.uint8)
+    tiles = split_tiles(image, 1280)
+    assert tiles[0][0] == (0, 0) and tiles[0][1] is image
+    assert len(tiles) == len(windows) + 1
+
+
+def test_merge_shifts_boxes_and_drops_duplicates():
+    merged = merge_tile_detections([
+        ((0, 0), [("dog", 0.9, [100, 100, 300, 300])]),
+        # The same dog seen again from a tile starting at x=200, cut off at its edge
+        ((200, 0), [("dog", 0.6, [0, 100, 100, 300]), ("cat", 0.8, [0, 100, 100, 300])]),
+        ((1000, 0), [("dog", 0.7, [10, 10, 50, 50])]),
+    ])
+    assert sorted(merged) == [("cat", 0.8, [200.0, 100.0, 300.0, 300.0]),
+                              ("dog", 0.7, [1010.0, 10.0, 1050.0, 50.0]),
+                              ("dog", 0.9, [100.0, 100.0, 300.0, 300.0])]
+
+
+def test_scale_detections():
+    assert scale_detections([("dog", 0.9, [1, 2, 3, 4])], 2.0) == [("dog", 0.9, [2, 4, 6, 8])]
@@ -0,0 +1,32 @@
+from db_for_prediction import DatabaseFactory
+from result_cache import ResultCache
+
+DETECTIONS = [("cat", 0.9, [1.0, 2.0, 3.0, 4.0])]
+
+
+def test_key_depends_on_content_and_model():
+    key = ResultCache.make_key(b"image", "yolov8n.pt", "8.0")
+    assert key == ResultCache.make_key(b"image", "yolov8n.pt", "8.0")
+    assert key != ResultCache.make_key(b"other", "yolov8n.pt", "8.0")
+    assert key != ResultCache.make_key(b"image", "yolov8n.pt", "8.1")
+
+
+def test_lru_eviction_and_counters():
+    cache = ResultCache(max_size=2)
+    cache.put("a", DETECTIONS, "a.jpg", "uploads/predicted/a.jpg")
+    cache.put("b", DETECTIONS, "b.jpg", "uploads/predicted/b.jpg")
+    assert cache.get("a")["image_url"] == "a.jpg"
+    cache.put("c", DETECTIONS, "c.jpg", "uploads/predicted/c.jpg")
+    # "b" was the least recently used entry
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (2, 1, 2)
+
+
+def test_persistent_store_survives_restart(tmp_path):
+    db = DatabaseFactory.create_database("sqlite", db_path=str(tmp_path / "predictions.db"))
+    ResultCache(store=db).put("key", DETECTIONS, "a.jpg", "uploads/predicted/a.jpg")
+    entry = ResultCache(store=db).get("key")
+    assert entry["detections"] == DETECTIONS
+    assert entry["image_url"] == "a.jpg"
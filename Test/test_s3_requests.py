@@ -0,0 +1,40 @@
+import pytest
+import S3_requests
+
+moto = pytest.importorskip("moto")
+BUCKET = "test-bucket"
+
+
+@pytest.fixture(autouse=True)
+def s3_bucket(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "eu-west-1")
+    monkeypatch.setattr(S3_requests, "_s3_client", None)
+    with moto.mock_aws():
+        S3_requests.get_s3_client().create_bucket(
+            Bucket=BUCKET, CreateBucketConfiguration={"LocationConstraint": "eu-west-1"})
+        yield
+
+
+def test_client_is_reused():
+    assert S3_requests.get_s3_client() is S3_requests.get_s3_client()
+
+
+def test_bytes_round_trip():
+    assert S3_requests.upload_bytes(b"image-bytes", BUCKET, "a/b.jpg")
+    assert S3_requests.download_bytes(BUCKET, "a/b.jpg") == b"image-bytes"
+
+
+def test_file_round_trip(tmp_path):
+    source = tmp_path / "in.jpg"
+    source.write_bytes(b"file-bytes")
+    assert S3_requests.upload_file(str(source), BUCKET, "c.jpg")
+    target = tmp_path / "out.jpg"
+    assert S3_requests.download_file(BUCKET, "c.jpg", str(target)) is True
+    assert target.read_bytes() == b"file-bytes"
+    assert S3_requests.delete_file(BUCKET, "c.jpg")
+
+
+def test_download_missing_object():
+    assert S3_requests.download_bytes(BUCKET, "missing.jpg") is None
@@ -0,0 +1,142 @@
+import json
+import threading
+import time
+import pytest
+from sqs_consumer import SqsConsumer
+
+
+@pytest.fixture
+def sqs(monkeypatch):
+    moto = pytest.importorskip("moto")
+    import boto3
+
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "eu-west-1")
+    with moto.mock_aws():
+        client = boto3.client("sqs", region_name="eu-west-1")
+        yield client, client.create_queue(QueueName="test-queue")["QueueUrl"]
+
+
+class Recorder:
+    """
+    Forwards to the real client and records the calls made
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        def call(**kwargs):
+            self.calls.append((name, kwargs))
+            return getattr(self.client, name)(**kwargs)
+        return call
+
+    def named(self, name):
+        return [kwargs for call, kwargs in self.calls if call == name]
+
+
+def send(client, queue_url, count):
+    for start in range(0, count, 10):
+        client.send_message_batch(QueueUrl=queue_url, Entries=[
+            {"Id": str(i), "MessageBody": json.dumps({"n": i})} for i in range(start, min(count, start + 10))])
+
+
+def depth(client, queue_url):
+    attributes = client.get_queue_attributes(QueueUrl=queue_url, AttributeNames=["All"])["Attributes"]
+    return int(attributes["ApproximateNumberOfMessages"]), int(attributes["ApproximateNumberOfMessagesNotVisible"])
+
+
+def test_receives_ten_and_acks_in_batches(sqs):
+    client, queue_url = sqs
+    send(client, queue_url, 25)
+    recorder = Recorder(client)
+    received = []
+    consumer = SqsConsumer(recorder, queue_url, received.append, wait_time=0)
+    while len(received) < 25:
+        assert consumer.receive()
+    assert all(kwargs["MaxNumberOfMessages"] == 10 for kwargs in recorder.named("receive_message"))
+    for msg in received:
+        consumer.ack(msg)
+    consumer.flush()
+
+    assert len(recorder.named("delete_message_batch")) == 3
+    assert not recorder.named("delete_message")
+    assert depth(client, queue_url) == (0, 0)
+    assert consumer.stats()["acked"] == 25 and consumer.stats()["in_flight"] == 0
+
+
+def test_receive_respects_pipeline_capacity(sqs):
+    client, queue_url = sqs
+    send(client, queue_url, 10)
+    received = []
+    consumer = SqsConsumer(client, queue_url, received.append, wait_for_capacity=lambda: 3, wait_time=0)
+    assert consumer.receive() <= 3
+
+
+def test_heartbeat_keeps_slow_message_invisible(sqs):
+    client, queue_url = sqs
+    send(client, queue_url, 1)
+    received = []
+    consumer = SqsConsumer(client, queue_url, received.append, visibility_timeout=1, wait_time=0)
+    consumer.receive()
+    for _ in range(4):
+        time.sleep(0.5)
+        consumer.extend_visibility()
+    # Without the heartbeat it would have reappeared after 1s
+    assert depth(client, queue_url) == (0, 1)
+    assert consumer.stats()["visibility_extensions"] == 4
+
+    # Released messages are redelivered once their timeout runs out
+    consumer.release(received[0])
+    consumer.extend_visibility()
+    time.sleep(1.2)
+    assert depth(client, queue_url) == (1, 0)
+
+
+def test_heartbeat_gives_up_after_max_in_flight(sqs):
+    client, queue_url = sqs
+    send(client, queue_url, 1)
+    consumer = SqsConsumer(client, queue_url, lambda msg: None, max_in_flight=0, wait_time=0)
+    consumer.receive()
+    time.sleep(0.01)
+    consumer.extend_visibility()
+    assert consumer.stats()["in_flight"] == 0 and consumer.stats()["released"] == 1
+
+
+def test_scales_consumers_with_queue_depth(sqs):
+    client, queue_url = sqs
+    consumer = SqsConsumer(client, queue_url, lambda msg: None, min_consumers=1, max_consumers=3, wait_time=0)
+    consumer.set_consumers = lambda count: setattr(consumer, "consumers", min(3, max(1, count)))
+    assert consumer.scale() == 1
+    send(client, queue_url, 15)
+    assert consumer.scale() == 2
+    send(client, queue_url, 30)
+    assert consumer.scale() == 3
+
+
+def test_end_to_end_with_background_threads(sqs):
+    client, queue_url = sqs
+    send(client, queue_url, 30)
+    done = threading.Event()
+    received = set()
+
+    def handle(msg):
+        # Delivery is at least once, concurrent pollers may see a message twice
+        received.add(msg["MessageId"])
+        consumer.ack(msg)
+        if len(received) == 30:
+            done.set()
+
+    consumer = SqsConsumer(client, queue_url, handle, max_consumers=3, ack_wait=0.05, wait_time=1).start()
+    try:
+        assert done.wait(10)
+        deadline = time.time() + 5
+        while consumer.stats()["acked"] < 30 and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        consumer.stop()
+    assert consumer.stats()["acked"] >= 30
+    assert consumer.stats()["consumers"] == 3
+    assert depth(client, queue_url) == (0, 0)
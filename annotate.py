@@ -0,0 +1,63 @@
+import os
+import threading
+import zlib
+
+import cv2
+
+# Ultralytics' default palette (RGB hex), so rendered images look like result.plot()
+PALETTE_HEX = ("042AFF", "0BDBEB", "F3F3F3", "00DFB7", "111F68", "FF6FDD", "FF444F", "CCED00", "00F344", "BD00FF",
+               "00B4FF", "DD00BA", "00FFFF", "26C000", "01FFB3", "7D24FF", "7B0068", "FF1B6C", "FC6D2F", "A2FF0B")
+PALETTE = [(int(h[4:6], 16), int(h[2:4], 16), int(h[0:2], 16)) for h in PALETTE_HEX]  # BGR for OpenCV
+
+
+def label_color(label):
+    """
+    Stable color per label, the same on every replica and run
+    """
+    return PALETTE[zlib.crc32(label.encode()) % len(PALETTE)]
+
+
+def draw_detections(image, detections):
+    """
+    Draw (label, score, box) detections onto a BGR image in place, in the style of
+    result.plot(). OpenCV's drawing primitives run in C, so this costs about as much
+    as encoding the image, and no model or ultralytics import is needed.
+    """
+    height, width = image.shape[:2]
+    line_width = max(round((height + width) / 2 * 0.003), 2)
+    font_scale = line_width / 3
+    font_thickness = max(line_width - 1, 1)
+    for label, score, box in detections:
+        x1, y1, x2, y2 = (int(round(float(value))) for value in box)
+        color = label_color(label)
+        cv2.rectangle(image, (x1, y1), (x2, y2), color, line_width, cv2.LINE_AA)
+        text = f"{label} {float(score):.2f}"
+        (text_width, text_height), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, font_thickness)
+        # Label above the box, or inside it when the box touches the top edge
+        outside = y1 - text_height - 3 >= 0
+        top = y1 - text_height - 3 if outside else y1
+        cv2.rectangle(image, (x1, top), (x1 + text_width, top + text_height + 3), color, -1, cv2.LINE_AA)
+        text_color = (0, 0, 0) if sum(color) > 550 else (255, 255, 255)
+        cv2.putText(image, text, (x1, top + text_height + 1), cv2.FONT_HERSHEY_SIMPLEX, font_scale, text_color,
+                    font_thickness, cv2.LINE_AA)
+    return image
+
+
+def render_detections(original_path, detections, target_path):
+    """
+    Write original_path with the detections drawn on it to target_path. Returns
+    False if the original can't be read.
+    """
+    image = cv2.imread(original_path, cv2.IMREAD_COLOR)
+    if image is None:
+        return False
+    draw_detections(image, detections)
+    os.makedirs(os.path.dirname(target_path) or ".", exist_ok=True)
+    stem, ext = os.path.splitext(target_path)
+    # Written under a temporary name (keeping the extension OpenCV encodes by)
+    # so a concurrent reader never sees half a file
+    partial = f"{stem}.{threading.get_ident()}.tmp{ext}"
+    if not cv2.imwrite(partial, image):
+        return False
+    os.replace(partial, target_path)
+    return True
@@ -1,164 +1,1005 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Request
-from fastapi.responses import FileResponse, Response
-from ultralytics import YOLO
+import time
+# Measured from the top of the module, reported by /ready
+IMPORT_STARTED = time.perf_counter()
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
 from PIL import Image
+import numpy as np
+import io
+import asyncio
 import sqlite3
 import threading
 import os
 import uuid
 import shutil
 import boto3
-from S3_requests import upload_file, download_file
+from S3_requests import upload_file, download_file, upload_bytes, download_bytes, copy_file
 import requests
-# Disable GPU usage
-import torch
-import time
-from db_for_prediction import DatabaseFactory
+from concurrent.futures import ThreadPoolExecutor
+from db_for_prediction import DatabaseFactory, accepted_image_type
+from pipeline import Pipeline
+from result_cache import ResultCache
+from lookup_cache import CachedDatabaseHandler
+from image_store import ImageStore
+from image_variants import IMMUTABLE_CACHE_CONTROL, VARIANT_FORMATS, VariantCache, etag_matches, image_etag
+from callback_dispatcher import CallbackDispatcher
+from inference_pool import InferenceProcessPool, default_pool_size, extract_detections
+from inference_backends import load_backend, model_identity
+from annotate import draw_detections, render_detections
+from preprocess import decode_for_model, image_header, merge_tile_detections, scale_detections, split_tiles
+from micro_batcher import MicroBatcher, QueueFull
+from sqs_consumer import SqsConsumer
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+import metrics
 import json
 
-torch.cuda.is_available = lambda: False
 app = FastAPI()
 S3_bucket_name = os.getenv('S3_BUCKET_NAME')
 storage_type = os.getenv("STORAGE_TYPE", "sqlite")
 Queue_URL = os.getenv("QUEUE_URL")
 Polybot_url = os.getenv("POLYBOT_URL")
+# Max images per model call, and how long the infer stage waits to fill a batch
+INFERENCE_BATCH_SIZE = int(os.getenv("INFERENCE_BATCH_SIZE", "5"))
+INFERENCE_BATCH_MAX_WAIT = float(os.getenv("INFERENCE_BATCH_MAX_WAIT", "0"))
+# Worker threads per pipeline stage and the size of the queue in front of each stage
+PIPELINE_DOWNLOAD_WORKERS = int(os.getenv("PIPELINE_DOWNLOAD_WORKERS", "4"))
+PIPELINE_INFER_WORKERS = int(os.getenv("PIPELINE_INFER_WORKERS", "1"))
+PIPELINE_PERSIST_WORKERS = int(os.getenv("PIPELINE_PERSIST_WORKERS", "4"))
+PIPELINE_CALLBACK_WORKERS = int(os.getenv("PIPELINE_CALLBACK_WORKERS", "2"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "10"))
+# Runtime for the forward pass: torch, onnx or openvino (exports are cached next to the weights)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+# "thread" runs the model in this process, "process" in a pool of worker processes
+INFERENCE_WORKER_MODE = os.getenv("INFERENCE_WORKER_MODE", "thread")
+INFERENCE_PROCESSES = int(os.getenv("INFERENCE_PROCESSES", str(default_pool_size())))
+INFERENCE_THREADS_PER_PROCESS = int(os.getenv("INFERENCE_THREADS_PER_PROCESS", "0")) or None
+# Keep images in memory from S3 download to annotated upload. Local copies are
+# only written when this instance serves images from local disk.
+IN_MEMORY_IMAGES = os.getenv("IN_MEMORY_IMAGES", "false").lower() == "true"
+SERVE_LOCAL_IMAGES = os.getenv("SERVE_LOCAL_IMAGES", "true").lower() == "true"
+# Decode JPEGs much larger than the model input at 1/2, 1/4 or 1/8 scale. With
+# TILED_INFERENCE, images whose longest side is at least TILE_MIN_SIZE are decoded
+# at full size instead and run as overlapping TILE_SIZE tiles plus the whole image.
+JPEG_DRAFT_DECODE = os.getenv("JPEG_DRAFT_DECODE", "true").lower() == "true"
+TILED_INFERENCE = os.getenv("TILED_INFERENCE", "false").lower() == "true"
+TILE_MIN_SIZE = int(os.getenv("TILE_MIN_SIZE", "2560"))
+TILE_SIZE = int(os.getenv("TILE_SIZE", "1280"))
+TILE_OVERLAP = float(os.getenv("TILE_OVERLAP", "0.2"))
+# Skip drawing and uploading the annotated image in the worker. /prediction/{uid}/image
+# renders it from the original and the stored boxes the first time it is asked for.
+DEFERRED_RENDERING = os.getenv("DEFERRED_RENDERING", "false").lower() == "true"
+# Base URL Polybot reaches this service on; the callback's image_url points at
+# {PUBLIC_URL}/prediction/{uid}/image when the image isn't uploaded to S3
+PUBLIC_URL = os.getenv("PUBLIC_URL", "").rstrip("/")
+# Background Polybot callback delivery
+CALLBACK_WORKERS = int(os.getenv("CALLBACK_WORKERS", "2"))
+CALLBACK_QUEUE_SIZE = int(os.getenv("CALLBACK_QUEUE_SIZE", "100"))
+CALLBACK_TIMEOUT = float(os.getenv("CALLBACK_TIMEOUT", "5"))
+CALLBACK_MAX_RETRIES = int(os.getenv("CALLBACK_MAX_RETRIES", "3"))
+# Entries in the content-hash result cache (0 disables it), optionally backed by the DB
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_PERSISTENT = os.getenv("RESULT_CACHE_PERSISTENT", "false").lower() == "true"
+# Read-through cache for uid/image lookups (0 disables it), and a short-lived
+# cache for label/score queries that writes invalidate
+LOOKUP_CACHE_SIZE = int(os.getenv("LOOKUP_CACHE_SIZE", "4096"))
+LOOKUP_CACHE_TTL = float(os.getenv("LOOKUP_CACHE_TTL", "300"))
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "256"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "2"))
+# Local images under uploads/ are kept within this many bytes (least recently used
+# evicted first) and mirrored to S3 under IMAGE_STORE_S3_PREFIX, which is also
+# where any replica fetches images it doesn't have. An empty prefix disables S3.
+IMAGE_STORE_MAX_BYTES = int(os.getenv("IMAGE_STORE_MAX_BYTES", str(1024 ** 3)))
+IMAGE_STORE_S3_PREFIX = os.getenv("IMAGE_STORE_S3_PREFIX", "images")
+# Resized/re-encoded images served for ?w= and ?format= are rendered once and
+# kept under variants/ within this many bytes
+IMAGE_VARIANT_MAX_BYTES = int(os.getenv("IMAGE_VARIANT_MAX_BYTES", str(256 * 1024 ** 2)))
+MAX_VARIANT_WIDTH = 2048
+# POST /predict micro-batching: concurrent uploads share one model call. Requests
+# beyond PREDICT_QUEUE_SIZE waiting images get a 503.
+PREDICT_BATCH_SIZE = int(os.getenv("PREDICT_BATCH_SIZE", str(INFERENCE_BATCH_SIZE)))
+PREDICT_BATCH_MAX_WAIT = float(os.getenv("PREDICT_BATCH_MAX_WAIT", "0.01"))
+PREDICT_QUEUE_SIZE = int(os.getenv("PREDICT_QUEUE_SIZE", "32"))
+# SQS consumers: visibility of in-flight messages is extended every heartbeat
+# interval (for at most SQS_MAX_IN_FLIGHT seconds), and the number of pollers
+# follows the queue depth between the min and max
+SQS_VISIBILITY_TIMEOUT = int(os.getenv("SQS_VISIBILITY_TIMEOUT", "60"))
+SQS_HEARTBEAT_INTERVAL = float(os.getenv("SQS_HEARTBEAT_INTERVAL", "20"))
+SQS_MAX_IN_FLIGHT = float(os.getenv("SQS_MAX_IN_FLIGHT", "300"))
+SQS_MIN_CONSUMERS = int(os.getenv("SQS_MIN_CONSUMERS", "1"))
+SQS_MAX_CONSUMERS = int(os.getenv("SQS_MAX_CONSUMERS", "4"))
+SQS_SCALE_INTERVAL = float(os.getenv("SQS_SCALE_INTERVAL", "15"))
+SQS_ACK_MAX_WAIT = float(os.getenv("SQS_ACK_MAX_WAIT", "0.5"))
+# Threads the async read endpoints run their DB queries on. With SQLite each keeps
+# its own read-only connection, so this is also the size of the connection pool.
+DB_READ_WORKERS = int(os.getenv("DB_READ_WORKERS", "8"))
+MODEL_NAME = "yolov8n.pt"
+# Page sizes for the label/score query endpoints
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_PAGE_SIZE = 500
 UPLOAD_DIR = "uploads/original"
 PREDICTED_DIR = "uploads/predicted"
+VARIANT_DIR = "variants"
 DB_PATH = "predictions.db"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-os.makedirs(PREDICTED_DIR, exist_ok=True)
-sqs = boto3.client('sqs', region_name='eu-west-1')
-# Download the AI model (tiny model ~6MB)
-model = YOLO("yolov8n.pt")
 if S3_bucket_name is not None:
     ENVIRONMENT = 'dev' if 'dev' in S3_bucket_name.lower() else 'prod'
 else :
     ENVIRONMENT = 'test'
 if storage_type is None:
     storage_type = "sqlite"
-# Initialize database
-if storage_type == "sqlite":
-    # make sure DB_PATH is defined or imported from your config
-    db = DatabaseFactory.create_database("sqlite", db_path=DB_PATH)
-elif storage_type == "dynamodb":
-    # you can optionally pass a custom prefix for your Dynamo tables
-    db = DatabaseFactory.create_database(
-        "dynamodb",
-        env=ENVIRONMENT,
-        table_prefix='majd_yolo'
-    )
-else:
+if storage_type not in ("sqlite", "dynamodb"):
     raise ValueError(f"Unknown STORAGE_TYPE {storage_type!r}")
-def poll_sqs_messages():
-    while True:
-        try:
-            response = sqs.receive_message(
-                QueueUrl=Queue_URL,
-                MaxNumberOfMessages=5,
-                WaitTimeSeconds=20
-            )
-            messages = response.get('Messages', [])
-            for msg in messages:
-                msg_body = json.loads(msg['Body'])
-                s3_key = msg_body['s3_key']
-                chat_id = msg_body['chat_id']
-                file_path = msg_body['file_path']
-                uid = str(uuid.uuid4())
-                ext = '.' + s3_key.split('.')[-1]
-                original_path = os.path.join(UPLOAD_DIR, uid + ext)
-                download_file(S3_bucket_name, s3_key, original_path)
-                predicted_path = os.path.join(PREDICTED_DIR, uid + ext)
-                results = model(original_path, device="cpu")
-                annotated_frame = results[0].plot()  # NumPy image with boxes
-                annotated_image = Image.fromarray(annotated_frame)
-                annotated_image.save(predicted_path)
-
-                db.save_prediction_session(uid, original_path, predicted_path)
-                detected_labels = []
-                c = 0
-                for box in results[0].boxes:
-                    label_idx = int(box.cls[0].item())
-                    label = model.names[label_idx]
-                    score = box.conf[0].item()
-                    bbox = box.xyxy[0].tolist()
-                    db.save_detection_object(c,uid, label, score, bbox)
-                    c += 1
-                    detected_labels.append(label)
-                upload_file(predicted_path, S3_bucket_name, f'yolo_to_poly_images/{s3_key.split("/")[-1]}')
-                time.sleep(1.5)
-                # send a post request to Polybot with uid chat_id file_path as json
-                # Notify Polybot
-                print(uid)
-                payload = {
-                    "uid": uid,
-                    "chat_id": chat_id,
-                    "file_path": file_path,
-                    "image_url": f'yolo_to_poly_images/{s3_key.split("/")[-1]}'
-                }
-
-                try:
-                    polybot_response = requests.post(f'http://{Polybot_url}:8443/predictions', json=payload)
-                    polybot_response.raise_for_status()
-                except Exception as post_err:
-                    print(f"[Polybot Callback Error] {post_err}")
-                sqs.delete_message(QueueUrl=Queue_URL, ReceiptHandle=msg['ReceiptHandle'])
-            if not messages:
-                time.sleep(1)
-
-        except Exception as e:
-            print(f"[SQS Polling Error] {e}")
-            time.sleep(5)  # avoid tight retry loop
+# The model, SQS client, DB and result cache are created on first use (or by the
+# startup warm-up), so importing this module stays cheap. Use the get_*() helpers.
+model = None
+sqs = None
+db = None
+result_cache = None
+image_store = None
+variant_cache = None
+init_lock = threading.RLock()
+# Set once the startup warm-up inference has run, see /ready
+ready = threading.Event()
+startup_timings = {}
+# Started on startup when INFERENCE_WORKER_MODE=process
+inference_pool = None
+# In thread mode the SQS pipeline and POST /predict share one model instance
+model_lock = threading.Lock()
+# Created on the first POST /predict, see get_predict_batcher()
+predict_batcher = None
+predict_batcher_lock = threading.Lock()
+# Created by start_sqs_consumer() once the worker is warmed up
+sqs_consumer = None
+# Its threads, and their DB connections, only start on first use
+db_read_pool = ThreadPoolExecutor(max_workers=DB_READ_WORKERS, thread_name_prefix="db-read")
+# One on-demand render per predicted image, see render_predicted_image()
+render_locks = {}
+render_locks_lock = threading.Lock()
+callback_dispatcher = CallbackDispatcher(
+    f'http://{Polybot_url}:8443/predictions',
+    workers=CALLBACK_WORKERS,
+    queue_size=CALLBACK_QUEUE_SIZE,
+    timeout=CALLBACK_TIMEOUT,
+    max_retries=CALLBACK_MAX_RETRIES,
+    latency_observer=metrics.CALLBACK_SECONDS.observe
+)
+
+
+def get_model():
+    global model
+    if model is None:
+        with init_lock:
+            if model is None:
+                # Loads (and downloads if missing, ~6MB) the weights for the configured backend
+                model = load_backend(INFERENCE_BACKEND, MODEL_NAME)
+    return model
+
+
+def get_sqs():
+    global sqs
+    if sqs is None:
+        with init_lock:
+            if sqs is None:
+                sqs = boto3.client('sqs', region_name='eu-west-1')
+    return sqs
+
+
+def get_db():
+    global db
+    if db is None:
+        with init_lock:
+            if db is None:
+                if storage_type == "sqlite":
+                    handler = DatabaseFactory.create_database("sqlite", db_path=DB_PATH)
+                else:
+                    # you can optionally pass a custom prefix for your Dynamo tables
+                    handler = DatabaseFactory.create_database(
+                        "dynamodb",
+                        env=ENVIRONMENT,
+                        table_prefix='majd_yolo'
+                    )
+                if LOOKUP_CACHE_SIZE > 0:
+                    handler = CachedDatabaseHandler(handler, max_size=LOOKUP_CACHE_SIZE, ttl=LOOKUP_CACHE_TTL,
+                                                    query_max_size=QUERY_CACHE_SIZE, query_ttl=QUERY_CACHE_TTL)
+                db = handler
+    return db
+
+
+def get_result_cache():
+    """
+    Duplicate images (e.g. forwarded Telegram photos) skip inference on a hit.
+    None when RESULT_CACHE_SIZE is 0.
+    """
+    global result_cache
+    if result_cache is None and RESULT_CACHE_SIZE > 0:
+        with init_lock:
+            if result_cache is None:
+                result_cache = ResultCache(RESULT_CACHE_SIZE, store=get_db() if RESULT_CACHE_PERSISTENT else None)
+    return result_cache
+
+
+def get_image_store():
+    global image_store
+    if image_store is None:
+        with init_lock:
+            if image_store is None:
+                image_store = ImageStore("uploads", max_bytes=IMAGE_STORE_MAX_BYTES, bucket=S3_bucket_name,
+                                         s3_prefix=IMAGE_STORE_S3_PREFIX)
+    return image_store
+
+
+def get_variant_cache():
+    global variant_cache
+    if variant_cache is None:
+        with init_lock:
+            if variant_cache is None:
+                variant_cache = VariantCache(VARIANT_DIR, max_bytes=IMAGE_VARIANT_MAX_BYTES)
+    return variant_cache
+
+
+def preprocess_image(job, data):
+    """
+    Decode the job's image bytes for the model into job["image"], at reduced size
+    for large JPEGs (job["scale"] maps boxes back), or split into job["tiles"]
+    for very large images in tiled mode. Returns False if they aren't an image.
+    """
+    _, size = image_header(data)
+    tiled = TILED_INFERENCE and size is not None and max(size) >= TILE_MIN_SIZE
+    image, job["scale"] = decode_for_model(data, draft=JPEG_DRAFT_DECODE and not tiled)
+    if image is None:
+        return False
+    job["image"] = image
+    if tiled:
+        job["tiles"] = split_tiles(image, TILE_SIZE, TILE_OVERLAP)
+    return True
+
+
+def encode_image(frame, ext):
+    """
+    Encode an annotated frame the same way the disk path saves it, into bytes
+    """
+    buffer = io.BytesIO()
+    image_format = Image.registered_extensions().get(ext.lower(), "JPEG")
+    Image.fromarray(frame).save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def download_message(msg):
+    """
+    Download the image referenced by an SQS message and return its job dict
+    """
+    msg_body = json.loads(msg['Body'])
+    s3_key = msg_body['s3_key']
+    uid = str(uuid.uuid4())
+    ext = '.' + s3_key.split('.')[-1]
+    original_path = os.path.join(UPLOAD_DIR, uid + ext)
+    job = {
+        "msg": msg,
+        "uid": uid,
+        "s3_key": s3_key,
+        "ext": ext,
+        "chat_id": msg_body['chat_id'],
+        "file_path": msg_body['file_path'],
+        "original_path": original_path,
+        "predicted_path": os.path.join(PREDICTED_DIR, uid + ext),
+    }
+    if IN_MEMORY_IMAGES:
+        with metrics.S3_DOWNLOAD_SECONDS.time():
+            data = download_bytes(S3_bucket_name, s3_key)
+        if data is None:
+            print(f"[S3 Download Error] {s3_key}")
+            metrics.ERRORS.labels("s3_download").inc()
+            release_message(msg)
+            return None
+        if not preprocess_image(job, data):
+            print(f"[Image Decode Error] {s3_key}")
+            release_message(msg)
+            return None
+        if SERVE_LOCAL_IMAGES:
+            with open(original_path, "wb") as f:
+                f.write(data)
+    else:
+        with metrics.S3_DOWNLOAD_SECONDS.time():
+            downloaded = download_file(S3_bucket_name, s3_key, original_path)
+        if downloaded is not True:
+            print(f"[S3 Download Error] {s3_key}: {downloaded}")
+            metrics.ERRORS.labels("s3_download").inc()
+            release_message(msg)
+            return None
+        with open(original_path, "rb") as f:
+            data = f.read()
+        if not preprocess_image(job, data):
+            print(f"[Image Decode Error] {s3_key}")
+            release_message(msg)
+            return None
+    cache = get_result_cache()
+    if cache is not None:
+        # From the config, so the API process never loads a model just for its name
+        job["cache_key"] = ResultCache.make_key(data, *model_identity(INFERENCE_BACKEND, MODEL_NAME))
+        cached = cache.get(job["cache_key"])
+        # Entries written with deferred rendering have no annotated image to reuse
+        if cached is not None and (DEFERRED_RENDERING or cached["image_url"] is not None):
+            job["cached"] = cached
+            job.pop("image", None)
+            job.pop("tiles", None)
+    return job
+
+
+def run_batch(jobs):
+    """
+    Run one model call over all the jobs and attach each result to its job.
+    A tiled job puts all its tiles into the call.
+    """
+    # Cache hits skip the model and go straight to persistence
+    to_infer = [job for job in jobs if "cached" not in job]
+    if to_infer:
+        sources, owners, plot = [], [], []
+        for job in to_infer:
+            for offset, source in job.get("tiles") or [((0, 0), job["image"])]:
+                sources.append(source)
+                owners.append((job, offset))
+                # Tiles are never plotted, the merged boxes are drawn onto the whole image below
+                plot.append("tiles" not in job)
+        metrics.BATCH_SIZE.observe(len(sources))
+        if inference_pool is not None:
+            # Worker processes also plot, so the annotated frame comes back with the detections
+            outputs = inference_pool.infer(sources, plot=plot)
+            for output in outputs:
+                if output["annotated_frame"] is not None:
+                    metrics.PLOT_SECONDS.observe(output["plot_seconds"])
+        else:
+            model = get_model()
+            with model_lock:
+                results = model(sources, device="cpu")
+            outputs = [{"detections": extract_detections(result, model.names), "result": result,
+                        "speed": result.speed} for result in results]
+        outputs_by_job = {}
+        for (job, offset), output in zip(owners, outputs):
+            outputs_by_job.setdefault(id(job), []).append((offset, output))
+        for job in to_infer:
+            job_outputs = outputs_by_job[id(job)]
+            if "tiles" in job:
+                job["detections"] = merge_tile_detections(
+                    [(offset, output["detections"]) for offset, output in job_outputs])
+                job["speed"] = {stage: sum(output["speed"][stage] for _, output in job_outputs)
+                                for stage in ("preprocess", "inference")}
+                if not DEFERRED_RENDERING:
+                    # Per-tile plots are no use, draw the merged boxes onto the whole image
+                    with metrics.PLOT_SECONDS.time():
+                        job["annotated_frame"] = draw_detections(job["image"], job["detections"])
+            else:
+                output = job_outputs[0][1]
+                # Boxes of a reduced decode are stored in original-image coordinates
+                job["detections"] = scale_detections(output["detections"], job["scale"])
+                job["speed"] = output["speed"]
+                if "result" in output:
+                    job["result"] = output["result"]
+                else:
+                    job["annotated_frame"] = output["annotated_frame"]
+            job.pop("image", None)
+            job.pop("tiles", None)
+            # YOLO already times each image (ms); reuse that instead of timing again
+            metrics.PREPROCESS_SECONDS.observe(job["speed"]["preprocess"] / 1000)
+            metrics.INFERENCE_SECONDS.observe(job["speed"]["inference"] / 1000)
+    return jobs
+
+
+def render_result(job, in_memory=False):
+    """
+    Render the annotated image and save it under predicted_path. With in_memory,
+    returns the encoded image for upload and only writes the local copy when
+    SERVE_LOCAL_IMAGES is set.
+    """
+    annotated_frame = job.pop("annotated_frame", None)
+    if annotated_frame is None:
+        with metrics.PLOT_SECONDS.time():
+            annotated_frame = job.pop("result").plot()  # NumPy image with boxes
+    if in_memory:
+        annotated_bytes = encode_image(annotated_frame, job["ext"])
+        if SERVE_LOCAL_IMAGES:
+            with open(job["predicted_path"], "wb") as f:
+                f.write(annotated_bytes)
+        return annotated_bytes
+    annotated_image = Image.fromarray(annotated_frame)
+    annotated_image.save(job["predicted_path"])
+    return None
+
+
+def save_result(job, in_memory=False):
+    """
+    Render the annotated image (unless DEFERRED_RENDERING) and persist the
+    detections. Returns the encoded image with in_memory, see render_result().
+    """
+    if DEFERRED_RENDERING:
+        job.pop("result", None)
+        annotated_bytes = None
+    else:
+        annotated_bytes = render_result(job, in_memory)
+
+    metrics.DETECTIONS.inc(len(job["detections"]))
+    with metrics.DB_WRITE_SECONDS.time():
+        get_db().save_prediction(job["uid"], job["original_path"], job["predicted_path"], job["detections"])
+    return annotated_bytes
+
+
+def persist_job(job):
+    """
+    Save the annotated image, persist the detections and upload to S3.
+    The job is only handed to the callback stage once the upload succeeded.
+    """
+    if "cached" in job:
+        return persist_cached_job(job)
+    uid = job["uid"]
+    annotated_bytes = save_result(job, in_memory=IN_MEMORY_IMAGES)
+    detections = job["detections"]
+    if DEFERRED_RENDERING:
+        # Nothing to upload, the image is rendered when someone asks for it
+        job["image_url"] = None
+    else:
+        job["image_url"] = f'yolo_to_poly_images/{job["s3_key"].split("/")[-1]}'
+        with metrics.S3_UPLOAD_SECONDS.time():
+            if IN_MEMORY_IMAGES:
+                uploaded = upload_bytes(annotated_bytes, S3_bucket_name, job["image_url"])
+            else:
+                uploaded = upload_file(job["predicted_path"], S3_bucket_name, job["image_url"])
+        if not uploaded:
+            print(f"[S3 Upload Error] {uid}: not notifying Polybot")
+            metrics.ERRORS.labels("s3_upload").inc()
+            release_message(job["msg"])
+            return None
+    if get_result_cache() is not None:
+        result_cache.put(job["cache_key"], detections, job["image_url"], job["predicted_path"])
+    store_job_images(job)
+    return job
+
+
+def persist_cached_job(job):
+    """
+    Record a new prediction for a duplicate image from the cached detections, and
+    copy the cached annotated image instead of rendering it again
+    """
+    uid = job["uid"]
+    cached = job["cached"]
+    job["image_url"] = None if DEFERRED_RENDERING else f'yolo_to_poly_images/{job["s3_key"].split("/")[-1]}'
+    if (SERVE_LOCAL_IMAGES or not IN_MEMORY_IMAGES) and os.path.exists(cached["predicted_path"]):
+        shutil.copyfile(cached["predicted_path"], job["predicted_path"])
+    metrics.DETECTIONS.inc(len(cached["detections"]))
+    with metrics.DB_WRITE_SECONDS.time():
+        get_db().save_prediction(uid, job["original_path"], job["predicted_path"], cached["detections"])
+    if job["image_url"] is not None and job["image_url"] != cached["image_url"]:
+        with metrics.S3_UPLOAD_SECONDS.time():
+            copied = copy_file(S3_bucket_name, cached["image_url"], job["image_url"])
+        if not copied:
+            print(f"[S3 Copy Error] {uid}: not notifying Polybot")
+            metrics.ERRORS.labels("s3_upload").inc()
+            release_message(job["msg"])
+            return None
+    store_job_images(job)
+    return job
+
+
+def store_job_images(job):
+    """
+    Hand the job's images to the image store. Both are already in the bucket,
+    so mirroring them is a server-side copy. A deferred predicted image is
+    added once it is rendered.
+    """
+    store = get_image_store()
+    store.added(job["original_path"], s3_source=job["s3_key"])
+    if job["image_url"] is not None:
+        store.added(job["predicted_path"], s3_source=job["image_url"])
+
+
+def notify_and_ack(job):
+    """
+    Hand the Polybot notification to the callback dispatcher and delete the SQS message,
+    or release it if the dispatcher drops the notification.
+    With DEFERRED_RENDERING nothing is uploaded, so image_url is the route that renders it.
+    """
+    print(job["uid"])
+    payload = {
+        "uid": job["uid"],
+        "chat_id": job["chat_id"],
+        "file_path": job["file_path"],
+        "image_url": job["image_url"] or f'{PUBLIC_URL}/prediction/{job["uid"]}/image'
+    }
+    if not callback_dispatcher.submit(payload):
+        # Dispatcher queue full: let SQS redeliver rather than lose the notification
+        release_message(job["msg"])
+        metrics.ERRORS.labels("callback").inc()
+        return
+    sqs_consumer.ack(job["msg"])
+    metrics.MESSAGES_PROCESSED.inc()
+
+
+def release_message(msg):
+    """
+    Give up on a message: SQS redelivers it once its visibility timeout runs out
+    """
+    if sqs_consumer is not None:
+        sqs_consumer.release(msg)
+
+
+def record_stage_error(stage, error, item):
+    """
+    Count a failed stage and release the messages of the jobs it dropped, so
+    SQS redelivers them after the visibility timeout instead of the heartbeat
+    holding them for SQS_MAX_IN_FLIGHT
+    """
+    metrics.ERRORS.labels(stage.lower()).inc()
+    # The download stage gets raw messages, later stages jobs; the infer stage gets a batch
+    for entry in item if isinstance(item, list) else [item]:
+        release_message(entry.get("msg", entry))
+
+
+def build_pipeline():
+    """
+    download -> infer -> persist/upload -> callback/ack, linked by bounded queues
+    """
+    pipeline = Pipeline()
+    pipeline.add_stage("Download", download_message, on_error=record_stage_error,
+                       workers=PIPELINE_DOWNLOAD_WORKERS, queue_size=PIPELINE_QUEUE_SIZE)
+    # In process mode, one infer thread per worker process keeps every process busy
+    infer_workers = max(PIPELINE_INFER_WORKERS, inference_pool.processes) if inference_pool else PIPELINE_INFER_WORKERS
+    pipeline.add_stage("Infer", run_batch, on_error=record_stage_error,
+                       workers=infer_workers, queue_size=PIPELINE_QUEUE_SIZE,
+                       batch_size=INFERENCE_BATCH_SIZE, batch_wait=INFERENCE_BATCH_MAX_WAIT)
+    pipeline.add_stage("Persist", persist_job, on_error=record_stage_error,
+                       workers=PIPELINE_PERSIST_WORKERS, queue_size=PIPELINE_QUEUE_SIZE)
+    pipeline.add_stage("Callback", notify_and_ack, on_error=record_stage_error,
+                       workers=PIPELINE_CALLBACK_WORKERS, queue_size=PIPELINE_QUEUE_SIZE)
+    for stage in pipeline.stages:
+        # Evaluated at scrape time, nothing to update on the hot path
+        metrics.STAGE_IN_FLIGHT.labels(stage.name.lower()).set_function(stage.in_flight)
+    return pipeline.start()
+
+
+def start_sqs_consumer(pipeline):
+    """
+    Start receiving SQS messages into the pipeline, only as many as its download queue can take
+    """
+    global sqs_consumer
+
+    def enqueue(msg):
+        metrics.MESSAGES_RECEIVED.inc()
+        pipeline.put(msg)
+
+    sqs_consumer = SqsConsumer(
+        get_sqs(), Queue_URL, enqueue,
+        wait_for_capacity=pipeline.wait_for_capacity,
+        visibility_timeout=SQS_VISIBILITY_TIMEOUT,
+        heartbeat_interval=SQS_HEARTBEAT_INTERVAL,
+        max_in_flight=SQS_MAX_IN_FLIGHT,
+        min_consumers=SQS_MIN_CONSUMERS,
+        max_consumers=SQS_MAX_CONSUMERS,
+        scale_interval=SQS_SCALE_INTERVAL,
+        ack_wait=SQS_ACK_MAX_WAIT,
+        on_error=lambda kind, error: metrics.ERRORS.labels("sqs_" + kind.lower().replace(" ", "_")).inc()
+    ).start()
+    metrics.SQS_CONSUMERS.set_function(lambda: sqs_consumer.consumers)
+    return sqs_consumer
+
+
+def get_predict_batcher():
+    """
+    Start the POST /predict micro-batcher on first use, with one worker per
+    inference process so every process gets batches
+    """
+    global predict_batcher
+    with predict_batcher_lock:
+        if predict_batcher is None:
+            predict_batcher = MicroBatcher(
+                run_batch,
+                max_batch_size=PREDICT_BATCH_SIZE,
+                max_wait=PREDICT_BATCH_MAX_WAIT,
+                queue_size=PREDICT_QUEUE_SIZE,
+                workers=inference_pool.processes if inference_pool else 1,
+                name="Predict"
+            ).start()
+            metrics.STAGE_IN_FLIGHT.labels("predict").set_function(predict_batcher.in_flight)
+    return predict_batcher
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    metrics.HTTP_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        metrics.HTTP_IN_FLIGHT.dec()
+    # Label by route template so /prediction/{uid} is one series, not one per uid
+    route = request.scope.get("route")
+    metrics.HTTP_REQUEST_SECONDS.labels(
+        request.method, route.path if route else "unmatched", response.status_code
+    ).observe(time.perf_counter() - start)
+    return response
+
+
+def warm_up():
+    """
+    Create the DB, SQS client and model and run one inference on a blank image,
+    so the first real request doesn't pay for loading or the first-call overhead
+    """
+    start = time.perf_counter()
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    os.makedirs(PREDICTED_DIR, exist_ok=True)
+    get_image_store()
+    get_db()
+    get_sqs()
+    blank = np.zeros((640, 640, 3), dtype=np.uint8)
+    if inference_pool is not None:
+        # One batch per process in parallel, so every process runs its first call
+        threads = [threading.Thread(target=inference_pool.infer, args=([blank],))
+                   for _ in range(inference_pool.processes)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    else:
+        model = get_model()
+        with model_lock:
+            model(blank, device="cpu", verbose=False)
+    startup_timings["warmup_seconds"] = round(time.perf_counter() - start, 3)
+    ready.set()
+
+
+def start_worker():
+    """
+    Warm up, then start the callback dispatcher and the SQS poller
+    """
+    try:
+        warm_up()
+    except Exception as e:
+        print(f"[Warm-up Error] {e}")
+        metrics.ERRORS.labels("warmup").inc()
+        return
+    print(f"Warm-up done in {startup_timings['warmup_seconds']}s, starting SQS consumers...")
+    callback_dispatcher.start()
+    start_sqs_consumer(build_pipeline())
 
 
 @app.on_event("startup")
 def start_sqs_polling():
-    print("Starting SQS polling thread...")
-    thread = threading.Thread(target=poll_sqs_messages, daemon=True)
-    thread.start()
+    global inference_pool
+    if DEFERRED_RENDERING and not PUBLIC_URL:
+        # The callback's image_url would be a path Polybot can't resolve
+        raise RuntimeError("DEFERRED_RENDERING requires PUBLIC_URL")
+    if INFERENCE_WORKER_MODE == "process":
+        print(f"Starting {INFERENCE_PROCESSES} inference worker processes...")
+        inference_pool = InferenceProcessPool(
+            MODEL_NAME,
+            backend=INFERENCE_BACKEND,
+            processes=INFERENCE_PROCESSES,
+            threads_per_process=INFERENCE_THREADS_PER_PROCESS,
+            plot=not DEFERRED_RENDERING
+        ).start()
+    # Warm up in the background so /health answers while the model loads
+    threading.Thread(target=start_worker, name="warm-up", daemon=True).start()
+
+@app.post("/predict")
+async def predict(file: UploadFile = File(...)):
+    """
+    Predict objects in an image. Concurrent uploads are batched into one model call.
+    """
+    data = await file.read()
+    ext = os.path.splitext(file.filename or "")[1] or ".jpg"
+    uid = str(uuid.uuid4())
+    job = {
+        "uid": uid,
+        "ext": ext,
+        "original_path": os.path.join(UPLOAD_DIR, uid + ext),
+        "predicted_path": os.path.join(PREDICTED_DIR, uid + ext),
+    }
+    if not await run_in_threadpool(preprocess_image, job, data):
+        raise HTTPException(status_code=400, detail="Invalid image")
+    try:
+        await get_predict_batcher().run(job)
+    except QueueFull:
+        metrics.ERRORS.labels("predict_rejected").inc()
+        raise HTTPException(status_code=503, detail="Inference queue is full, retry later",
+                            headers={"Retry-After": "1"})
+
+    def persist():
+        with open(job["original_path"], "wb") as f:
+            f.write(data)
+        save_result(job)
+        store = get_image_store()
+        store.added(job["original_path"])
+        store.added(job["predicted_path"])
+
+    await run_in_threadpool(persist)
+    return {
+        "prediction_uid": uid,
+        "detection_count": len(job["detections"]),
+        "labels": [label for label, _, _ in job["detections"]]
+    }
+
+
+async def read_db(query):
+    """
+    Await query() on the DB read pool without blocking the event loop
+    """
+    return await asyncio.get_running_loop().run_in_executor(db_read_pool, query)
+
 
 @app.get("/prediction/{uid}")
-def get_prediction_by_uid(uid: str):
+async def get_prediction_by_uid(uid: str):
     """
     Get prediction session by uid with all detected objects
     """
-    return db.get_prediction_by_uid(uid)
+    prediction = await read_db(lambda: get_db().get_prediction_by_uid(uid))
+    # Clients usually ask for the image next, start fetching it if this replica lacks it
+    get_image_store().prefetch(prediction["predicted_image"])
+    return prediction
+
+
+def stream_pages(fetch_page):
+    """
+    Yield every item of a paginated query as NDJSON, one page in memory at a time
+    """
+    cursor = None
+    while True:
+        items, cursor = fetch_page(STREAM_PAGE_SIZE, cursor)
+        for item in items:
+            yield json.dumps(jsonable_encoder(item)) + "\n"
+        if cursor is None:
+            break
 
 
 @app.get("/predictions/label/{label}")
-def get_predictions_by_label(label: str):
+async def get_predictions_by_label(label: str, response: Response,
+                             limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+                             cursor: Optional[str] = None):
+    """
+    Get prediction sessions containing objects with specified label.
+    With limit/cursor, returns one page and the next cursor in the X-Next-Cursor header.
+    """
+    if limit is None and cursor is None:
+        return await read_db(lambda: get_db().get_predictions_by_label(label))
+    items, next_cursor = await read_db(
+        lambda: get_db().get_predictions_by_label_page(label, limit or DEFAULT_PAGE_SIZE, cursor))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
+
+
+@app.get("/predictions/label/{label}/stream")
+def stream_predictions_by_label(label: str):
     """
-    Get prediction sessions containing objects with specified label
+    Stream all prediction sessions containing objects with specified label as NDJSON
     """
-    return db.get_predictions_by_label(label)
+    return StreamingResponse(
+        stream_pages(lambda limit, cursor: get_db().get_predictions_by_label_page(label, limit, cursor)),
+        media_type="application/x-ndjson"
+    )
 
 
 @app.get("/predictions/score/{min_score}")
-def get_predictions_by_score(min_score: float):
+async def get_predictions_by_score(min_score: float, response: Response,
+                             limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+                             cursor: Optional[str] = None):
+    """
+    Get prediction sessions containing objects with score >= min_score.
+    With limit/cursor, returns one page and the next cursor in the X-Next-Cursor header.
+    """
+    if limit is None and cursor is None:
+        return await read_db(lambda: get_db().get_predictions_by_score(min_score))
+    items, next_cursor = await read_db(
+        lambda: get_db().get_predictions_by_score_page(min_score, limit or DEFAULT_PAGE_SIZE, cursor))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
+
+
+@app.get("/predictions/score/{min_score}/stream")
+def stream_predictions_by_score(min_score: float):
+    """
+    Stream all prediction sessions containing objects with score >= min_score as NDJSON
+    """
+    return StreamingResponse(
+        stream_pages(lambda limit, cursor: get_db().get_predictions_by_score_page(min_score, limit, cursor)),
+        media_type="application/x-ndjson"
+    )
+
+
+def parse_region(region):
+    """
+    "x1,y1,x2,y2" -> tuple of floats
+    """
+    try:
+        values = tuple(float(value) for value in region.split(","))
+    except ValueError:
+        values = ()
+    if len(values) != 4 or values[0] > values[2] or values[1] > values[3]:
+        raise HTTPException(status_code=400, detail="region must be x1,y1,x2,y2 with x1 <= x2 and y1 <= y2")
+    return values
+
+
+@app.get("/detections/label/{label}")
+async def get_detections_by_label(label: str, response: Response,
+                            min_area: Optional[float] = Query(None, ge=0),
+                            region: Optional[str] = None,
+                            limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                            cursor: Optional[str] = None):
     """
-    Get prediction sessions containing objects with score >= min_score
+    Get detections with specified label, optionally with area >= min_area and/or
+    a box overlapping region=x1,y1,x2,y2. The next cursor is in the X-Next-Cursor header.
     """
-    return db.get_predictions_by_score(min_score)
+    region = parse_region(region) if region else None
+    items, next_cursor = await read_db(lambda: get_db().get_detections(label, min_area, region, limit, cursor))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
+
+
+@app.get("/stats")
+async def get_stats(days: int = Query(7, ge=1, le=366)):
+    """
+    Sessions and detections per day, overall and per label, for the last `days` days
+    """
+    return {"days": await read_db(lambda: get_db().get_stats(days))}
+
+
+@app.get("/stats/scores/{label}")
+async def get_score_histogram(label: str):
+    """
+    Score distribution of the detections with specified label
+    """
+    return {"label": label, "buckets": await read_db(lambda: get_db().get_score_histogram(label))}
+
+
+def render_predicted_image(uid):
+    """
+    Draw the stored boxes of a prediction onto its original image and keep the
+    result as its predicted image, for predictions saved with DEFERRED_RENDERING.
+    Returns the local path, or None if the original image is gone too.
+    """
+    prediction = get_db().get_prediction_by_uid(uid)
+    store = get_image_store()
+    with render_locks_lock:
+        lock = render_locks.setdefault(uid, threading.Lock())
+    # Concurrent requests for the same image wait for one render and share it
+    with lock:
+        try:
+            path = store.get(prediction["predicted_image"])
+            if path is not None:
+                return path
+            original = store.get(prediction["original_image"])
+            if original is None:
+                return None
+            detections = [(obj["label"], obj["score"], obj["box"])
+                          for obj in prediction["detection_objects"] if obj["box"] is not None]
+            with metrics.PLOT_SECONDS.time():
+                rendered = render_detections(original, detections, prediction["predicted_image"])
+            if not rendered:
+                return None
+            # Registered (and mirrored to S3) like any other image, so it is rendered once
+            store.added(prediction["predicted_image"])
+            return store.get(prediction["predicted_image"])
+        finally:
+            with render_locks_lock:
+                render_locks.pop(uid, None)
+
+
+def image_response(request: Request, image_path, w=None, format=None, media_type=None, headers=None,
+                   render=None):
+    """
+    Serve an image from the image store with long-lived cache headers, or its
+    w/format variant. A client that already has it gets a 304 without the variant
+    being rendered. render() is called for images that exist in neither place.
+    """
+    if format is not None and format not in VARIANT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {sorted(VARIANT_FORMATS)}")
+    # Looked up before the ETag check, so If-None-Match: * can't get a 304 for a missing image
+    path = get_image_store().get(image_path)
+    if path is None and render is not None:
+        path = render()
+    if path is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    name = os.path.relpath(image_path, "uploads")
+    etag = image_etag(name, w, format)
+    headers = {**(headers or {}), "ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    if w is not None or format is not None:
+        path = get_variant_cache().get(path, name, w, format)
+        if format is not None:
+            media_type = VARIANT_FORMATS[format][1]
+    return FileResponse(path, media_type=media_type, headers=headers)
 
 
 @app.get("/image/{type}/{filename}")
-def get_image(type: str, filename: str):
+def get_image(type: str, filename: str, request: Request,
+              w: Optional[int] = Query(None, ge=1, le=MAX_VARIANT_WIDTH),
+              format: Optional[str] = None):
     """
-    Get image by type and filename
+    Get image by type and filename, optionally at most w pixels wide and/or
+    re-encoded as format (jpeg, png or webp)
     """
     if type not in ["original", "predicted"]:
         raise HTTPException(status_code=400, detail="Invalid image type")
-    path = os.path.join("uploads", type, filename)
-    if not os.path.exists(path):
-        raise HTTPException(status_code=404, detail="Image not found")
-    return FileResponse(path)
+    # Predicted images are named after their uid, and may not be rendered yet
+    render = (lambda: render_predicted_image(os.path.splitext(filename)[0])) if type == "predicted" else None
+    return image_response(request, os.path.join("uploads", type, filename), w, format, render=render)
 
 
 @app.get("/prediction/{uid}/image")
-def get_prediction_image(uid: str, request: Request):
+def get_prediction_image(uid: str, request: Request,
+                         w: Optional[int] = Query(None, ge=1, le=MAX_VARIANT_WIDTH),
+                         format: Optional[str] = None):
+    """
+    Get prediction image by uid, optionally at most w pixels wide and/or
+    re-encoded as format (jpeg, png or webp)
+    """
+    image_path = get_db().get_predicted_image(uid)
+    if image_path is None:
+        raise HTTPException(status_code=404, detail="Prediction not found")
+    render = lambda: render_predicted_image(uid)
+    if format is not None:
+        return image_response(request, image_path, w, format, render=render)
+    # Without format the content type follows the Accept header
+    return image_response(request, image_path, w, media_type=accepted_image_type(request),
+                          headers={"Vary": "Accept"}, render=render)
+
+
+@app.get("/cache/stats")
+def get_cache_stats():
     """
-    Get prediction image by uid
+    Hit and miss counters of the content-hash result cache
     """
-    return db.get_prediction_image(uid,request)
+    if get_result_cache() is None:
+        return {"enabled": False}
+    return {"enabled": True, **result_cache.stats()}
+
+
+@app.get("/cache/lookup/stats")
+def get_lookup_cache_stats():
+    """
+    Hit ratio and memory use of the prediction lookup and query caches
+    """
+    handler = get_db()
+    if not isinstance(handler, CachedDatabaseHandler):
+        return {"enabled": False}
+    return {"enabled": True, **handler.stats()}
+
+
+@app.get("/cache/images/stats")
+def get_image_store_stats():
+    """
+    Disk use, hit ratio, S3 fetches and evictions of the local image store and
+    of the resized/re-encoded variants
+    """
+    return {**get_image_store().stats(), "variants": get_variant_cache().stats()}
+
+
+@app.get("/callback/stats")
+def get_callback_stats():
+    """
+    Delivery counters and latency of the Polybot callback dispatcher
+    """
+    return callback_dispatcher.stats()
+
+
+@app.get("/sqs/stats")
+def get_sqs_stats():
+    """
+    Pollers, in-flight messages, visibility extensions and batched acks of the SQS consumer
+    """
+    if sqs_consumer is None:
+        return {"running": False}
+    return {"running": True, **sqs_consumer.stats()}
+
+
+@app.get("/metrics")
+def get_metrics():
+    """
+    Prometheus metrics for the worker stages and API routes
+    """
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 
 @app.get("/health")
@@ -169,6 +1010,20 @@ def health():
     return {"status": "ok", "message": "Service is running"}
 
 
+@app.get("/ready")
+def readiness(response: Response):
+    """
+    Readiness check: 503 until the model is loaded and warmed up
+    """
+    if not ready.is_set():
+        response.status_code = 503
+        return {"status": "warming_up", **startup_timings}
+    return {"status": "ready", **startup_timings}
+
+
+startup_timings["import_seconds"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8080)
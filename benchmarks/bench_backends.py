@@ -0,0 +1,55 @@
+"""
+Latency comparison of the inference backends (torch, onnx, openvino) on CPU.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_backends.py --backends torch onnx openvino --batch-sizes 1 4
+"""
+import argparse
+import glob
+import importlib.util
+import itertools
+import time
+
+from inference_backends import load_backend
+
+RUNTIMES = {"onnx": "onnxruntime", "openvino": "openvino"}
+
+
+def sample_images(count):
+    paths = sorted(glob.glob("images/*.jpg")) + ["Test/test_image.jpg", "beatles.jpeg"]
+    return list(itertools.islice(itertools.cycle(paths), count))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "openvino"])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'backend':<10} {'batch':>6} {'ms/batch p50':>13} {'ms/batch p95':>13} {'images/sec':>11} {'load s':>8}")
+    for backend_name in args.backends:
+        runtime = RUNTIMES.get(backend_name)
+        if runtime and importlib.util.find_spec(runtime) is None:
+            print(f"{backend_name:<10} skipped, {runtime} is not installed")
+            continue
+        start = time.perf_counter()
+        backend = load_backend(backend_name, args.model)
+        load_seconds = time.perf_counter() - start
+        for batch_size in args.batch_sizes:
+            images = sample_images(batch_size)
+            backend(images, verbose=False)  # warm-up
+            samples = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                backend(images, verbose=False)
+                samples.append(time.perf_counter() - start)
+            samples.sort()
+            p50, p95 = samples[len(samples) // 2], samples[min(len(samples) - 1, int(0.95 * len(samples)))]
+            print(f"{backend_name:<10} {batch_size:>6} {1000 * p50:>13.1f} {1000 * p95:>13.1f}"
+                  f" {batch_size / p50:>11.2f} {load_seconds:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Throughput vs. batch size for the YOLO model used by the SQS worker.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_batch_inference.py --images 32 --batch-sizes 1 2 4 8 16
+"""
+import argparse
+import glob
+import itertools
+import time
+
+import torch
+from ultralytics import YOLO
+
+torch.cuda.is_available = lambda: False
+
+
+def sample_images(count):
+    paths = sorted(glob.glob("images/*.jpg")) + ["Test/test_image.jpg", "beatles.jpeg"]
+    return list(itertools.islice(itertools.cycle(paths), count))
+
+
+def run(model, images, batch_size):
+    start = time.perf_counter()
+    for i in range(0, len(images), batch_size):
+        model(images[i:i + batch_size], device="cpu", verbose=False)
+    elapsed = time.perf_counter() - start
+    return len(images) / elapsed, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--images", type=int, default=32)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    model = YOLO(args.model)
+    images = sample_images(args.images)
+    # Warm-up so the first measurement doesn't pay for lazy init
+    model(images[0], device="cpu", verbose=False)
+
+    print(f"{'batch':>6} {'images/sec':>12} {'total s':>10}")
+    for batch_size in args.batch_sizes:
+        throughput, elapsed = run(model, images, batch_size)
+        print(f"{batch_size:>6} {throughput:>12.2f} {elapsed:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+DynamoDB round trips and latency per prediction, per-row writes vs. save_prediction,
+against a moto stand-in (no AWS access needed).
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_dynamodb_round_trips.py --predictions 50 --detections 30
+"""
+import argparse
+import os
+import time
+from collections import Counter
+
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+
+from moto import mock_aws
+
+from db_for_prediction import DatabaseFactory
+
+
+def per_row(db, uid, detections):
+    db.save_prediction_session(uid, "original.jpg", "predicted.jpg")
+    for c, (label, score, box) in enumerate(detections):
+        db.save_detection_object(c, uid, label, score, box)
+
+
+def bulk(db, uid, detections):
+    db.save_prediction(uid, "original.jpg", "predicted.jpg", detections)
+
+
+def run(name, write, db, calls, predictions, detections):
+    rows = [("person", 0.5 + (i % 50) / 100, [1.0 * i, 2.0, 3.0, 4.0]) for i in range(detections)]
+    calls.clear()
+    start = time.perf_counter()
+    for i in range(predictions):
+        write(db, f"{name}-{i}", rows)
+    write_elapsed = time.perf_counter() - start
+    write_calls = sum(calls.values())
+
+    calls.clear()
+    start = time.perf_counter()
+    for i in range(predictions):
+        db.get_prediction_by_uid(f"{name}-{i}")
+    read_elapsed = time.perf_counter() - start
+    read_calls = sum(calls.values())
+    print(f"{name:<8} {write_calls / predictions:>13.1f} {1000 * write_elapsed / predictions:>12.2f}"
+          f" {read_calls / predictions:>12.1f} {1000 * read_elapsed / predictions:>11.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--predictions", type=int, default=50)
+    parser.add_argument("--detections", type=int, default=30)
+    args = parser.parse_args()
+
+    with mock_aws():
+        db = DatabaseFactory.create_database("dynamodb", env="bench", table_prefix="majd_yolo")
+        db.create_tables()
+        calls = Counter()
+        db.dynamodb.meta.client.meta.events.register(
+            "before-call.dynamodb", lambda model, **kwargs: calls.update([model.name]))
+
+        print(f"{'path':<8} {'write calls':>13} {'write ms':>12} {'read calls':>12} {'read ms':>11}  (per prediction)")
+        run("per-row", per_row, db, calls, args.predictions, args.detections)
+        run("bulk", bulk, db, calls, args.predictions, args.detections)
+
+
+if __name__ == "__main__":
+    main()
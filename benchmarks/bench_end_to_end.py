@@ -0,0 +1,320 @@
+"""
+Offline end-to-end benchmark of the SQS worker and the query endpoints.
+
+SQS, S3 and DynamoDB are replaced by moto and Polybot by a local HTTP stub, so
+no network access is needed (only the yolov8n.pt weights must be present).
+The sample images in images/ and Test/test_image.jpg are scaled up with random
+crops, flips and resizes so every message carries a distinct image.
+
+Reports images/sec, p50/p95/p99 per stage (from the /metrics histograms) and
+end to end, and query latency against DBs with 10^4-10^6 detections. Results
+are written as JSON so runs can be compared against a saved baseline.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_end_to_end.py --images 200 --output benchmarks/results/baseline.json
+    PYTHONPATH=. python benchmarks/bench_end_to_end.py --compare benchmarks/results/baseline.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ.setdefault("AWS_DEFAULT_REGION", "eu-west-1")
+os.environ.setdefault("S3_BUCKET_NAME", "bench-bucket")
+os.environ.setdefault("POLYBOT_URL", "127.0.0.1")
+# Every synthetic image is distinct, the result cache would only add noise
+os.environ.setdefault("RESULT_CACHE_SIZE", "0")
+
+from moto import mock_aws
+from PIL import Image, ImageEnhance
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_IMAGES = [os.path.join(REPO_ROOT, path) for path in ("images/file_0.jpg", "images/file_1.jpg", "Test/test_image.jpg")]
+STAGES = ["s3_download", "preprocess", "inference", "plot", "db_write", "s3_upload", "callback"]
+LABELS = ["person", "car", "dog", "cat", "bicycle", "bus", "truck", "bird"]
+
+
+def percentiles(samples):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return {"p50_ms": 1000 * pick(0.5), "p95_ms": 1000 * pick(0.95), "p99_ms": 1000 * pick(0.99),
+            "count": len(samples)}
+
+
+def histogram_percentiles(histogram, stage):
+    """
+    Estimate quantiles from a Prometheus histogram the way histogram_quantile() does
+    """
+    buckets = []
+    for metric in histogram.collect():
+        for sample in metric.samples:
+            if sample.name.endswith("_bucket") and sample.labels.get("stage") == stage:
+                buckets.append((float(sample.labels["le"]), sample.value))
+    buckets.sort()
+    total = buckets[-1][1] if buckets else 0
+    if not total:
+        return None
+
+    def quantile(q):
+        rank = q * total
+        lower_bound, lower_count = 0.0, 0.0
+        for bound, count in buckets:
+            if count >= rank:
+                if bound == float("inf"):
+                    return lower_bound
+                return lower_bound + (bound - lower_bound) * (rank - lower_count) / max(count - lower_count, 1e-9)
+            lower_bound, lower_count = bound, count
+        return lower_bound
+
+    return {"p50_ms": 1000 * quantile(0.5), "p95_ms": 1000 * quantile(0.95), "p99_ms": 1000 * quantile(0.99),
+            "count": int(total)}
+
+
+def synthetic_images(count, seed=0):
+    """
+    Yield `count` distinct JPEGs derived from the sample images
+    """
+    rng = random.Random(seed)
+    sources = [Image.open(path).convert("RGB") for path in SOURCE_IMAGES]
+    for i in range(count):
+        image = sources[i % len(sources)]
+        w, h = image.size
+        crop_w, crop_h = int(w * rng.uniform(0.6, 1.0)), int(h * rng.uniform(0.6, 1.0))
+        left, top = rng.randint(0, w - crop_w), rng.randint(0, h - crop_h)
+        variant = image.crop((left, top, left + crop_w, top + crop_h))
+        scale = rng.uniform(0.5, 1.5)
+        variant = variant.resize((max(32, int(crop_w * scale)), max(32, int(crop_h * scale))))
+        if rng.random() < 0.5:
+            variant = variant.transpose(Image.FLIP_LEFT_RIGHT)
+        variant = ImageEnhance.Brightness(variant).enhance(rng.uniform(0.7, 1.3))
+        buffer = io.BytesIO()
+        variant.save(buffer, format="JPEG", quality=90)
+        yield buffer.getvalue()
+
+
+class PolybotStub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.delivered[payload["file_path"]] = time.perf_counter()
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def start_polybot_stub():
+    # app.py always calls Polybot on port 8443
+    server = ThreadingHTTPServer(("127.0.0.1", 8443), PolybotStub)
+    server.delivered = {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_db(storage, db_path, env):
+    from db_for_prediction import DatabaseFactory
+    if storage == "sqlite":
+        return DatabaseFactory.create_database("sqlite", db_path=db_path)
+    db = DatabaseFactory.create_database("dynamodb", env=env, table_prefix="majd_yolo")
+    db.create_tables()
+    return db
+
+
+def bench_worker(app, args, workdir):
+    import boto3
+    import metrics
+
+    s3 = boto3.client("s3", region_name="eu-west-1")
+    bucket = os.environ["S3_BUCKET_NAME"]
+    s3.create_bucket(Bucket=bucket, CreateBucketConfiguration={"LocationConstraint": "eu-west-1"})
+    sqs = boto3.client("sqs", region_name="eu-west-1")
+    queue_url = sqs.create_queue(QueueName="bench-queue")["QueueUrl"]
+    app.sqs = sqs
+    app.Queue_URL = queue_url
+    app.db = make_db(args.storage, os.path.join(workdir, "worker.db"), "benchworker")
+
+    print(f"Uploading {args.images} synthetic images...")
+    for i, data in enumerate(synthetic_images(args.images)):
+        s3.put_object(Bucket=bucket, Key=f"bench/{i}.jpg", Body=data)
+
+    polybot = start_polybot_stub()
+    app.callback_dispatcher.start()
+    pipeline = app.build_pipeline()
+    app.start_sqs_consumer(pipeline)
+
+    # Load and warm the model outside the measured window
+    app.warm_up()
+
+    sent = {}
+    start = time.perf_counter()
+    for i in range(args.images):
+        sent[str(i)] = time.perf_counter()
+        sqs.send_message(QueueUrl=queue_url, MessageBody=json.dumps(
+            {"s3_key": f"bench/{i}.jpg", "chat_id": 0, "file_path": str(i)}))
+    deadline = start + args.timeout
+    while len(polybot.delivered) < args.images and time.perf_counter() < deadline:
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    polybot.shutdown()
+    polybot.server_close()
+
+    delivered = dict(polybot.delivered)
+    if len(delivered) < args.images:
+        print(f"Timed out: {len(delivered)}/{args.images} images delivered", file=sys.stderr)
+    return {
+        "images": args.images,
+        "delivered": len(delivered),
+        "elapsed_s": elapsed,
+        "images_per_sec": len(delivered) / elapsed,
+        "end_to_end": percentiles([delivered[k] - sent[k] for k in delivered]),
+        "stages": {stage: histogram_percentiles(metrics.STAGE_SECONDS, stage) for stage in STAGES},
+    }
+
+
+def populate(db, detections, per_session=5, seed=0):
+    from concurrent.futures import ThreadPoolExecutor
+    rng = random.Random(seed)
+
+    def write(i):
+        rows = [(rng.choice(LABELS), rng.random(), [rng.uniform(0, 600) for _ in range(4)])
+                for _ in range(per_session)]
+        db.save_prediction(f"s{i:08d}", f"original/{i}.jpg", f"predicted/{i}.jpg", rows)
+
+    # Concurrent writers share commits on SQLite
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        list(pool.map(write, range(detections // per_session)))
+
+
+def time_requests(client, path, repeat, **params):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(path, params=params)
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 200, (path, response.status_code)
+    return percentiles(samples)
+
+
+def bench_queries(app, args, workdir):
+    from fastapi.testclient import TestClient
+    client = TestClient(app.app)
+    results = {}
+    for size in args.db_sizes:
+        print(f"Populating {args.storage} with {size} detections...")
+        app.db = make_db(args.storage, os.path.join(workdir, f"query_{size}.db"), f"benchquery{size}")
+        populate(app.db, size)
+        uid = f"s{(size // 10):08d}"
+        results[str(size)] = {
+            "prediction_by_uid": time_requests(client, f"/prediction/{uid}", args.repeat),
+            "label_page": time_requests(client, "/predictions/label/person", args.repeat, limit=100),
+            "score_page": time_requests(client, "/predictions/score/0.9", args.repeat, limit=100),
+        }
+        if args.full_queries:
+            results[str(size)]["label_full"] = time_requests(client, "/predictions/label/person", 3)
+        if hasattr(app.db, "close"):
+            app.db.close()
+    return results
+
+
+def print_report(results, baseline=None):
+    def delta(path, value):
+        node = baseline
+        for key in path:
+            node = node.get(key) if isinstance(node, dict) else None
+        if not isinstance(node, (int, float)) or not node:
+            return ""
+        return f" ({100 * (value - node) / node:+.0f}%)"
+
+    worker = results.get("worker")
+    if worker:
+        print(f"\nWorker: {worker['images_per_sec']:.2f} images/sec"
+              f"{delta(['worker', 'images_per_sec'], worker['images_per_sec'])}"
+              f" ({worker['delivered']}/{worker['images']} in {worker['elapsed_s']:.1f}s)")
+        print(f"{'stage':<14} {'p50 ms':>14} {'p95 ms':>14} {'p99 ms':>14}")
+        rows = dict(worker["stages"], end_to_end=worker["end_to_end"])
+        for stage, stats in rows.items():
+            if not stats:
+                continue
+            path = ["worker", "end_to_end"] if stage == "end_to_end" else ["worker", "stages", stage]
+            cells = [f"{stats[k]:.1f}{delta(path + [k], stats[k])}" for k in ("p50_ms", "p95_ms", "p99_ms")]
+            print(f"{stage:<14} {cells[0]:>14} {cells[1]:>14} {cells[2]:>14}")
+    for size, queries in results.get("queries", {}).items():
+        print(f"\nQueries, {size} detections:")
+        for name, stats in queries.items():
+            path = ["queries", size, name]
+            cells = [f"{stats[k]:.2f}{delta(path + [k], stats[k])}" for k in ("p50_ms", "p95_ms", "p99_ms")]
+            print(f"{name:<18} {cells[0]:>14} {cells[1]:>14} {cells[2]:>14}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=100)
+    parser.add_argument("--storage", choices=["sqlite", "dynamodb"], default="sqlite")
+    parser.add_argument("--db-sizes", type=int, nargs="*", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--full-queries", action="store_true", help="also time the unpaginated label query")
+    parser.add_argument("--skip-worker", action="store_true")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--output", help="write results as JSON, e.g. benchmarks/results/baseline.json")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    repo_root = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="yolo-bench-")
+    with mock_aws():
+        import app
+        # The model loads lazily, after the chdir below
+        app.MODEL_NAME = os.path.join(REPO_ROOT, app.MODEL_NAME)
+        # Keep uploads/ and the DBs of the run out of the repo
+        os.chdir(workdir)
+        os.makedirs(app.UPLOAD_DIR, exist_ok=True)
+        os.makedirs(app.PREDICTED_DIR, exist_ok=True)
+        results = {
+            "config": {
+                "images": args.images,
+                "storage": args.storage,
+                "python": platform.python_version(),
+                "cpu_count": os.cpu_count(),
+                "env": {k: v for k, v in os.environ.items()
+                        if k.startswith(("INFERENCE_", "PIPELINE_", "IN_MEMORY", "RESULT_CACHE", "CALLBACK_", "IMAGE_STORE_",
+                                         "DEFERRED_"))},
+            }
+        }
+        try:
+            if not args.skip_worker:
+                results["worker"] = bench_worker(app, args, workdir)
+            results["queries"] = bench_queries(app, args, workdir)
+        finally:
+            os.chdir(repo_root)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(results, baseline)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+HTTP load test of the read endpoints against a real uvicorn server.
+
+The server runs in a separate process on a fresh SQLite DB populated with
+--sessions prediction sessions (5 detections each). Clients keep --concurrency
+requests in flight for --duration seconds over a mix of uid lookups, label
+and score pages, detection queries and /stats, with random uids and labels.
+The lookup cache is off by default so the DB read path is what gets measured.
+
+Requests go through a minimal keep-alive HTTP/1.1 client on asyncio streams,
+so the load generator costs far less CPU than the server even on a small
+machine. Reports requests/sec and p50/p99 latency per endpoint and overall,
+optionally as JSON so runs can be compared.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_load.py --sessions 20000 --concurrency 64 --duration 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LABELS = ["person", "car", "dog", "cat", "bicycle", "bus", "truck", "bird"]
+
+
+def populate(workdir, sessions, seed=0):
+    sys.path.insert(0, REPO_ROOT)
+    from concurrent.futures import ThreadPoolExecutor
+    from db_for_prediction import DatabaseFactory
+
+    rng = random.Random(seed)
+    db = DatabaseFactory.create_database("sqlite", db_path=os.path.join(workdir, "predictions.db"))
+
+    def write(i):
+        rows = [(rng.choice(LABELS), rng.random(), [rng.uniform(0, 600) for _ in range(4)]) for _ in range(5)]
+        db.save_prediction(f"s{i:08d}", f"uploads/original/{i}.jpg", f"uploads/predicted/{i}.jpg", rows)
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        list(pool.map(write, range(sessions)))
+    db.close()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workdir, port, lookup_cache):
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT, LOOKUP_CACHE_SIZE=str(lookup_cache),
+               AWS_DEFAULT_REGION="eu-west-1", IMAGE_STORE_S3_PREFIX="")
+    weights = os.path.join(REPO_ROOT, "yolov8n.pt")
+    if os.path.exists(weights) and not os.path.exists(os.path.join(workdir, "yolov8n.pt")):
+        os.symlink(weights, os.path.join(workdir, "yolov8n.pt"))
+    return subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+                            cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_ready(base_url, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base_url}/ready", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError("server did not become ready")
+
+
+def make_request(rng, sessions):
+    kind = rng.choice(["uid", "label_page", "score_page", "detections", "stats"])
+    if kind == "uid":
+        return kind, f"/prediction/s{rng.randrange(sessions):08d}"
+    if kind == "label_page":
+        return kind, f"/predictions/label/{rng.choice(LABELS)}?limit=50"
+    if kind == "score_page":
+        return kind, f"/predictions/score/{rng.uniform(0.5, 0.99):.2f}?limit=50"
+    if kind == "detections":
+        return kind, f"/detections/label/{rng.choice(LABELS)}?limit=50&min_area={rng.uniform(0, 50000):.0f}"
+    return kind, f"/stats?days={rng.randint(1, 30)}"
+
+
+async def get(reader, writer, path):
+    """
+    One GET over a kept-alive connection. Returns the status code.
+    """
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    headers = dict(line.lower().split(": ", 1) for line in lines[1:] if line)
+    await reader.readexactly(int(headers.get("content-length", 0)))
+    return int(lines[0].split()[1])
+
+
+async def run_load(port, sessions, concurrency, duration, seed=0):
+    rng = random.Random(seed)
+    latencies = {}
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            while time.perf_counter() < deadline:
+                kind, path = make_request(rng, sessions)
+                start = time.perf_counter()
+                status = await get(reader, writer, path)
+                elapsed = time.perf_counter() - start
+                if status != 200:
+                    errors += 1
+                latencies.setdefault(kind, []).append(elapsed)
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def summarize(samples, elapsed):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return {"requests": len(samples), "rps": len(samples) / elapsed,
+            "p50_ms": 1000 * pick(0.5), "p99_ms": 1000 * pick(0.99)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--lookup-cache", type=int, default=0, help="LOOKUP_CACHE_SIZE for the server (0 disables)")
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"Populating SQLite with {args.sessions} sessions...")
+        populate(workdir, args.sessions)
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        server = start_server(workdir, port, args.lookup_cache)
+        try:
+            wait_ready(base_url)
+            # A short warm-up so every connection and thread exists before measuring
+            asyncio.run(run_load(port, args.sessions, args.concurrency, 2, seed=1))
+            latencies, errors, elapsed = asyncio.run(
+                run_load(port, args.sessions, args.concurrency, args.duration))
+        finally:
+            server.terminate()
+            server.wait()
+
+    results = {kind: summarize(samples, elapsed) for kind, samples in sorted(latencies.items())}
+    results["all"] = summarize([s for samples in latencies.values() for s in samples], elapsed)
+    print(f"\n{args.concurrency} concurrent clients for {elapsed:.1f}s, {errors} errors")
+    print(f"{'endpoint':<12} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for kind, row in results.items():
+        print(f"{kind:<12} {row['rps']:>9.1f} {row['p50_ms']:>9.2f} {row['p99_ms']:>9.2f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "errors": errors, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
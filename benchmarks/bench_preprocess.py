@@ -0,0 +1,98 @@
+"""
+Cost of large images in front of the model: full decode vs reduced JPEG decode
+vs tiled inference.
+
+images/file_1.jpg is resized to each --sizes longest side and saved as a JPEG.
+For every size, reports decode time, the size of the decoded array and the
+tracemalloc peak for a full and a reduced decode (decode_for_model with and
+without draft), then model latency and detection count for the full decode,
+the reduced decode and tiled inference (whole image plus tiles, one batch).
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_preprocess.py --sizes 640 1280 2048 4032 6000 --runs 5
+"""
+import argparse
+import io
+import statistics
+import time
+import tracemalloc
+
+import torch
+from PIL import Image
+from ultralytics import YOLO
+
+from inference_pool import extract_detections
+from preprocess import decode_for_model, merge_tile_detections, split_tiles
+
+torch.cuda.is_available = lambda: False
+
+
+def make_jpeg(longest, source="images/file_1.jpg"):
+    with Image.open(source) as image:
+        ratio = longest / max(image.size)
+        resized = image.convert("RGB").resize((round(image.width * ratio), round(image.height * ratio)))
+    buffer = io.BytesIO()
+    resized.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def median_seconds(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def decode_stats(data, draft, runs):
+    decode_seconds = median_seconds(lambda: decode_for_model(data, draft=draft), runs)
+    tracemalloc.start()
+    image, scale = decode_for_model(data, draft=draft)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return image, {"decode_ms": 1000 * decode_seconds, "array_mb": image.nbytes / 2 ** 20,
+                   "peak_mb": peak / 2 ** 20, "shape": f"{image.shape[1]}x{image.shape[0]}"}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[640, 1280, 2048, 4032, 6000])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--tile-size", type=int, default=1280)
+    parser.add_argument("--tile-overlap", type=float, default=0.2)
+    args = parser.parse_args()
+
+    model = YOLO(args.model)
+    # Warm-up so the first measurement doesn't pay for lazy init
+    model(decode_for_model(make_jpeg(640))[0], device="cpu", verbose=False)
+
+    def infer(sources):
+        return [extract_detections(result, model.names)
+                for result in model(sources, device="cpu", verbose=False)]
+
+    print(f"{'size':>6} {'mode':<8} {'decoded':>10} {'decode ms':>10} {'array MB':>9} {'peak MB':>8} "
+          f"{'model ms':>9} {'objects':>8}")
+    for longest in args.sizes:
+        data = make_jpeg(longest)
+        full, full_stats = decode_stats(data, False, args.runs)
+        reduced, reduced_stats = decode_stats(data, True, args.runs)
+        tiles = split_tiles(full, args.tile_size, args.tile_overlap)
+        sources = [tile for _, tile in tiles]
+        rows = [
+            ("full", full_stats, lambda: infer([full])[0]),
+            ("reduced", reduced_stats, lambda: infer([reduced])[0]),
+            (f"tiled/{len(tiles)}", full_stats,
+             lambda: merge_tile_detections([(offset, detections) for (offset, _), detections
+                                            in zip(tiles, infer(sources))])),
+        ]
+        for mode, stats, run in rows:
+            model_seconds = median_seconds(run, args.runs)
+            print(f"{longest:>6} {mode:<8} {stats['shape']:>10} {stats['decode_ms']:>10.1f} "
+                  f"{stats['array_mb']:>9.1f} {stats['peak_mb']:>8.1f} {1000 * model_seconds:>9.1f} "
+                  f"{len(run()):>8}")
+
+
+if __name__ == "__main__":
+    main()
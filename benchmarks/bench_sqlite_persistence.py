@@ -0,0 +1,57 @@
+"""
+Rows/sec of the per-row SQLite persistence path vs. the bulk save_prediction path.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_sqlite_persistence.py --predictions 200 --detections 30 --threads 8
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from db_for_prediction import SQLiteDatabaseHandler
+
+
+def make_detections(count):
+    return [("person", 0.5 + (i % 50) / 100, [1.0 * i, 2.0 * i, 3.0 * i, 4.0 * i]) for i in range(count)]
+
+
+def per_row(db, uid, detections):
+    db.save_prediction_session(uid, "original.jpg", "predicted.jpg")
+    for c, (label, score, box) in enumerate(detections):
+        db.save_detection_object(c, uid, label, score, box)
+
+
+def bulk(db, uid, detections):
+    db.save_prediction(uid, "original.jpg", "predicted.jpg", detections)
+
+
+def run(name, write, predictions, detections, threads):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = SQLiteDatabaseHandler(os.path.join(tmp, "bench.db"))
+        rows = make_detections(detections)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(lambda i: write(db, f"{name}-{i}", rows), range(predictions)))
+        elapsed = time.perf_counter() - start
+        db.close()
+    total_rows = predictions * (detections + 1)
+    print(f"{name:<10} {threads:>7} {total_rows / elapsed:>12.0f} {elapsed:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--predictions", type=int, default=200)
+    parser.add_argument("--detections", type=int, default=30)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{'path':<10} {'threads':>7} {'rows/sec':>12} {'total s':>10}")
+    for threads in sorted({1, args.threads}):
+        run("per-row", per_row, args.predictions, args.detections, threads)
+        run("bulk", bulk, args.predictions, args.detections, threads)
+
+
+if __name__ == "__main__":
+    main()
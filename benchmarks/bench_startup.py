@@ -0,0 +1,67 @@
+"""
+Startup cost of the service, each run in a fresh interpreter:
+import time of app.py, warm-up time, and time to the first POST /predict
+response with and without the warm-up.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_startup.py --runs 3
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, os, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+warmup = 0.0
+if sys.argv[1] == "warm":
+    app.warm_up()
+    warmup = time.perf_counter() - imported
+client = TestClient(app.app)
+os.makedirs(app.UPLOAD_DIR, exist_ok=True)
+os.makedirs(app.PREDICTED_DIR, exist_ok=True)
+before = time.perf_counter()
+with open(sys.argv[2], "rb") as f:
+    resp = client.post("/predict", files={"file": ("image.jpg", f, "image/jpeg")})
+assert resp.status_code == 200, resp.text
+done = time.perf_counter()
+print(json.dumps({"import": imported - start, "warmup": warmup,
+                  "first_predict": done - before, "total": done - start}))
+"""
+
+
+def run_once(mode, workdir):
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    # Reuse the repo's weights, but keep the DB and uploads out of the repo
+    weights = os.path.join(REPO_ROOT, "yolov8n.pt")
+    if os.path.exists(weights) and not os.path.exists(os.path.join(workdir, "yolov8n.pt")):
+        os.symlink(weights, os.path.join(workdir, "yolov8n.pt"))
+    output = subprocess.run([sys.executable, "-c", CHILD, mode, os.path.join(REPO_ROOT, "Test/test_image.jpg")],
+                            cwd=workdir, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'mode':<8} {'import s':>9} {'warm-up s':>10} {'first predict s':>16} {'total s':>8}")
+    for mode in ("cold", "warm"):
+        with tempfile.TemporaryDirectory() as workdir:
+            runs = [run_once(mode, workdir) for _ in range(args.runs)]
+        median = {key: sorted(run[key] for run in runs)[len(runs) // 2] for key in runs[0]}
+        print(f"{mode:<8} {median['import']:>9.2f} {median['warmup']:>10.2f}"
+              f" {median['first_predict']:>16.3f} {median['total']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import queue
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class CallbackDispatcher:
+    """
+    Delivers Polybot notifications from background threads so a slow or dead
+    Polybot never stalls inference.
+
+    Payloads go through a bounded queue to `workers` threads sharing one pooled,
+    keep-alive requests.Session. Each POST has a timeout and is retried with
+    exponential backoff on connection errors, 5xx and 429 responses.
+    """
+
+    def __init__(self, url, workers=2, queue_size=100, timeout=5, max_retries=3, backoff=0.5,
+                 latency_observer=None):
+        self.url = url
+        self.workers = workers
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        # Delivery latency (including retries) of the most recent callbacks
+        self.latencies = deque(maxlen=1000)
+        # Optional callable fed each delivery latency in seconds, e.g. a metrics histogram
+        self.latency_observer = latency_observer
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"callback-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def submit(self, payload, block_timeout=5):
+        """
+        Queue a payload for delivery. Blocks for at most block_timeout seconds
+        when the queue is full, then drops the payload and returns False.
+        """
+        try:
+            self.queue.put(payload, timeout=block_timeout)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            print(f"[Polybot Callback Error] queue full, dropped {payload.get('uid')}")
+            return False
+        return True
+
+    def _work(self):
+        while True:
+            payload = self.queue.get()
+            if payload is None:
+                break
+            start = time.perf_counter()
+            delivered = self._deliver(payload)
+            latency = time.perf_counter() - start
+            with self._lock:
+                if delivered:
+                    self.sent += 1
+                    self.latencies.append(latency)
+                else:
+                    self.failed += 1
+            if delivered and self.latency_observer is not None:
+                self.latency_observer(latency)
+
+    def _deliver(self, payload):
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(self.url, json=payload, timeout=self.timeout)
+                if response.status_code < 500 and response.status_code != 429:
+                    response.raise_for_status()
+                    return True
+                error = f"HTTP {response.status_code}"
+            except requests.HTTPError as e:
+                # Other 4xx: retrying won't help
+                print(f"[Polybot Callback Error] {e}")
+                return False
+            except requests.RequestException as e:
+                error = e
+            if attempt < self.max_retries:
+                time.sleep(self.backoff * 2 ** attempt)
+        print(f"[Polybot Callback Error] {payload.get('uid')} after {self.max_retries + 1} attempts: {error}")
+        return False
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            stats = {
+                "sent": self.sent,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "queued": self.queue.qsize()
+            }
+        for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+            stats[f"latency_{name}_ms"] = 1000 * latencies[int(q * (len(latencies) - 1))] if latencies else None
+        return stats
+
+    def close(self, timeout=None):
+        """
+        Deliver what is already queued, then stop the worker threads
+        """
+        for _ in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self.session.close()
@@ -1,11 +1,146 @@
 from abc import ABC, abstractmethod
+import base64
+import json
+import queue
+import re
 import sqlite3
+import threading
+import time
+import weakref
+import zlib
 import boto3
-from datetime import datetime
-from botocore.exceptions import ClientError
-from boto3.dynamodb.conditions import Key
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+from boto3.dynamodb.conditions import Attr, Key
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
 DB_PATH = "predictions.db"
+# BatchWriteItem accepts at most 25 put requests per call
+BATCH_WRITE_LIMIT = 25
+BATCH_WRITE_MAX_RETRIES = 5
+BATCH_WRITE_BACKOFF = 0.05
+# TransactWriteItems accepts at most 100 actions per call
+TRANSACT_WRITE_LIMIT = 100
+TRANSACT_WRITE_MAX_RETRIES = 8
+# The daily total counter is split over this many items so concurrent writes
+# don't all conflict on one; get_stats sums them
+TOTAL_COUNTER_SHARDS = 8
+# "counted" markers only need to outlive retries of their write
+COUNTED_MARKER_TTL = 7 * 24 * 3600
+# Shared by every DynamoDB call of a handler: enough pooled keep-alive connections
+# for the API's request threads plus the handler's own read pool
+DYNAMODB_CONFIG = Config(
+    max_pool_connections=64,
+    tcp_keepalive=True,
+    retries={'max_attempts': 5, 'mode': 'adaptive'}
+)
+# Score histograms use SCORE_BUCKETS equal-width buckets over [0, 1]
+SCORE_BUCKETS = 10
 from fastapi import FastAPI, UploadFile, File, HTTPException, Request
+import metrics
+
+
+def encode_cursor(position):
+    """
+    Turn a backend-specific position dict into an opaque URL-safe cursor
+    """
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from e
+    if not isinstance(position, dict):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return position
+
+
+def box_columns(box):
+    """
+    (x1, y1, x2, y2, area) floats for a [x1, y1, x2, y2] box
+    """
+    x1, y1, x2, y2 = (float(coord) for coord in box)
+    # Normalise the corners: the R*Tree rejects boxes with x1 > x2 or y1 > y2
+    x1, x2 = min(x1, x2), max(x1, x2)
+    y1, y2 = min(y1, y2), max(y1, y2)
+    return x1, y1, x2, y2, (x2 - x1) * (y2 - y1)
+
+
+def parse_box(text):
+    """
+    Read a box stored by older versions as text: a list repr, or a list of
+    Decimal('...') reprs on DynamoDB
+    """
+    numbers = re.findall(r"-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?", text or "")
+    return [float(number) for number in numbers[:4]] if len(numbers) >= 4 else None
+
+
+def score_bucket(score):
+    return min(max(int(float(score) * SCORE_BUCKETS), 0), SCORE_BUCKETS - 1)
+
+
+def aggregate_counts(sessions):
+    """
+    What a group of sessions adds to the aggregates. sessions is a list of
+    detection lists of (label, score, ...) tuples. Returns label -> (sessions,
+    detections) and (label, score bucket) -> detections.
+    """
+    sessions_per_label = Counter()
+    detections_per_label = Counter()
+    histogram = Counter()
+    for detections in sessions:
+        sessions_per_label.update({detection[0] for detection in detections})
+        detections_per_label.update(detection[0] for detection in detections)
+        histogram.update((detection[0], score_bucket(detection[1])) for detection in detections)
+    labels = {label: (sessions_per_label[label], count) for label, count in detections_per_label.items()}
+    return labels, histogram
+
+
+def histogram_response(counts):
+    """
+    [{min, max, count}] for every bucket, from a {bucket: count} dict
+    """
+    return [{
+        "min": round(bucket / SCORE_BUCKETS, 4),
+        "max": round((bucket + 1) / SCORE_BUCKETS, 4),
+        "count": counts.get(bucket, 0)
+    } for bucket in range(SCORE_BUCKETS)]
+
+
+def recent_days(days):
+    today = datetime.utcnow().date()
+    return [(today - timedelta(days=i)).isoformat() for i in range(days)]
+
+
+def accepted_image_type(request: Request):
+    """
+    Media type to label a predicted image with, from the client's Accept header
+    """
+    accept = request.headers.get("accept", "")
+    if "image/png" in accept:
+        return "image/png"
+    elif "image/jpeg" in accept or "image/jpg" in accept:
+        return "image/jpeg"
+    # If the client doesn't accept image, respond with 406 Not Acceptable
+    raise HTTPException(status_code=406, detail="Client does not accept an image format")
+
+
+def predicted_image_response(image_path, request: Request, headers=None):
+    """
+    Serve a predicted image in the format the client accepts
+    """
+    import os
+    from fastapi.responses import FileResponse
+    if not os.path.exists(image_path):
+        raise HTTPException(status_code=404, detail="Predicted image file not found")
+    return FileResponse(image_path, media_type=accepted_image_type(request), headers=headers)
+
+
 # === Abstract Base Class ===
 class BaseDatabaseHandler(ABC):
     @abstractmethod
@@ -19,6 +154,29 @@ class BaseDatabaseHandler(ABC):
     @abstractmethod
     def save_detection_object(self,c,prediction_uid, label, score, box):
         pass
+
+    def save_prediction(self, uid, original_image, predicted_image, detections):
+        """
+        Save a prediction session together with all its detections.
+        detections is a list of (label, score, box) tuples.
+        Backends override this to write everything in as few round trips as possible,
+        and may return the stored record as get_prediction_by_uid would; None means
+        it has to be read back.
+        """
+        self.save_prediction_session(uid, original_image, predicted_image)
+        for c, (label, score, box) in enumerate(detections):
+            self.save_detection_object(c, uid, label, score, box)
+
+    def get_cached_result(self, cache_key):
+        """
+        Look up a persisted inference result by content-hash key, see result_cache.py.
+        Returns a dict with detections, image_url and predicted_path, or None.
+        """
+        return None
+
+    def save_cached_result(self, cache_key, detections, image_url, predicted_path):
+        pass
+
     @abstractmethod
     def get_predicted_image(self, uid):
         pass
@@ -32,24 +190,64 @@ class BaseDatabaseHandler(ABC):
     def get_predictions_by_score(self,min_score: float):
         pass
     @abstractmethod
+    def get_predictions_by_label_page(self, label: str, limit: int, cursor=None):
+        """
+        One page of get_predictions_by_label. Returns (items, next_cursor);
+        next_cursor is an opaque string, or None on the last page.
+        """
+        pass
+    @abstractmethod
+    def get_predictions_by_score_page(self, min_score: float, limit: int, cursor=None):
+        pass
+    @abstractmethod
+    def get_detections(self, label: str, min_area=None, region=None, limit: int = 100, cursor=None):
+        """
+        Detections with the given label, optionally only those with area >= min_area
+        and/or overlapping region (x1, y1, x2, y2). Returns (items, next_cursor).
+        """
+        pass
+    @abstractmethod
+    def get_stats(self, days: int = 7):
+        """
+        Sessions and detections per day, overall and per label, for the last `days`
+        UTC days (newest first), read from the aggregate tables
+        """
+        pass
+    @abstractmethod
+    def get_score_histogram(self, label: str):
+        pass
+    @abstractmethod
     def get_prediction_image(self,uid: str, request: Request):
         pass
 
 
 # === SQLite Implementation ===
 class SQLiteDatabaseHandler(BaseDatabaseHandler):
+    # Max save_prediction calls grouped into one transaction by the writer thread
+    MAX_GROUP_SIZE = 64
+
     def __init__(self, db_path):
         self.db_path = db_path
+        self._write_queue = queue.Queue()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        # One read-only connection per live reading thread, see _read_connection()
+        self._readers = threading.local()
+        self._read_connections = set()
         self.init_db()
 
     def init_db(self):
         with sqlite3.connect(self.db_path) as conn:
+            # WAL lets readers keep going while the writer thread commits
+            conn.execute("PRAGMA journal_mode=WAL")
+            existing_tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS prediction_sessions (
                     uid TEXT PRIMARY KEY,
                     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
                     original_image TEXT,
-                    predicted_image TEXT
+                    predicted_image TEXT,
+                    max_score REAL
                 )
             """)
             conn.execute("""
@@ -59,12 +257,168 @@ class SQLiteDatabaseHandler(BaseDatabaseHandler):
                     label TEXT,
                     score REAL,
                     box TEXT,
+                    x1 REAL,
+                    y1 REAL,
+                    x2 REAL,
+                    y2 REAL,
+                    area REAL,
                     FOREIGN KEY (prediction_uid) REFERENCES prediction_sessions (uid)
                 )
             """)
+            self._migrate_boxes(conn)
             conn.execute("CREATE INDEX IF NOT EXISTS idx_prediction_uid ON detection_objects (prediction_uid)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_label ON detection_objects (label)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_score ON detection_objects (score)")
+            # Keyset pagination walks these in uid order without sorting
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_label_uid ON detection_objects (label, prediction_uid)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_label_area ON detection_objects (label, area)")
+            # Score queries read prediction_sessions.max_score instead
+            conn.execute("DROP INDEX IF EXISTS idx_uid_score")
+            self._migrate_aggregates(conn, existing_tables)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS result_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    detections TEXT,
+                    image_url TEXT,
+                    predicted_path TEXT,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+    def _migrate_aggregates(self, conn, existing_tables):
+        """
+        Summary tables kept up to date by every write: sessions/detections per
+        day and per label per day, score histograms per label, and each session's
+        max score. Built from the existing rows the first time.
+        """
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(prediction_sessions)")}
+        if "max_score" not in columns:
+            conn.execute("ALTER TABLE prediction_sessions ADD COLUMN max_score REAL")
+            conn.execute("""
+                UPDATE prediction_sessions SET max_score =
+                    (SELECT MAX(score) FROM detection_objects WHERE prediction_uid = prediction_sessions.uid)
+            """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_session_max_score ON prediction_sessions (max_score)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS daily_counts (
+                day TEXT PRIMARY KEY,
+                sessions INTEGER NOT NULL DEFAULT 0,
+                detections INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS label_daily_counts (
+                day TEXT,
+                label TEXT,
+                sessions INTEGER NOT NULL DEFAULT 0,
+                detections INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, label)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS label_score_histogram (
+                label TEXT,
+                bucket INTEGER,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (label, bucket)
+            )
+        """)
+        if "daily_counts" not in existing_tables:
+            conn.execute("""
+                INSERT INTO daily_counts (day, sessions, detections)
+                SELECT date(ps.timestamp), COUNT(DISTINCT ps.uid), COUNT(d.id)
+                FROM prediction_sessions ps LEFT JOIN detection_objects d ON d.prediction_uid = ps.uid
+                GROUP BY date(ps.timestamp)
+            """)
+            conn.execute("""
+                INSERT INTO label_daily_counts (day, label, sessions, detections)
+                SELECT date(ps.timestamp), d.label, COUNT(DISTINCT ps.uid), COUNT(*)
+                FROM detection_objects d JOIN prediction_sessions ps ON ps.uid = d.prediction_uid
+                GROUP BY date(ps.timestamp), d.label
+            """)
+            conn.execute(f"""
+                INSERT INTO label_score_histogram (label, bucket, count)
+                SELECT label, MAX(MIN(CAST(score * {SCORE_BUCKETS} AS INTEGER), {SCORE_BUCKETS - 1}), 0), COUNT(*)
+                FROM detection_objects GROUP BY 1, 2
+            """)
+
+    def _add_aggregates(self, conn, day, sessions, labels, histogram):
+        """
+        Add to the summary tables in the caller's transaction. labels maps
+        label -> (sessions, detections), histogram maps (label, bucket) -> count.
+        """
+        conn.execute("""
+            INSERT INTO daily_counts (day, sessions, detections) VALUES (?, ?, ?)
+            ON CONFLICT (day) DO UPDATE SET
+                sessions = sessions + excluded.sessions, detections = detections + excluded.detections
+        """, (day, sessions, sum(count for _, count in labels.values())))
+        conn.executemany("""
+            INSERT INTO label_daily_counts (day, label, sessions, detections) VALUES (?, ?, ?, ?)
+            ON CONFLICT (day, label) DO UPDATE SET
+                sessions = sessions + excluded.sessions, detections = detections + excluded.detections
+        """, [(day, label, label_sessions, count) for label, (label_sessions, count) in labels.items()])
+        conn.executemany("""
+            INSERT INTO label_score_histogram (label, bucket, count) VALUES (?, ?, ?)
+            ON CONFLICT (label, bucket) DO UPDATE SET count = count + excluded.count
+        """, [(label, bucket, count) for (label, bucket), count in histogram.items()])
+
+    def _migrate_boxes(self, conn):
+        """
+        Move boxes from the old `box` TEXT column into numeric columns and keep an
+        R*Tree of them for region queries. Safe to run on every start.
+        """
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(detection_objects)")}
+        for column in ("x1", "y1", "x2", "y2", "area"):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE detection_objects ADD COLUMN {column} REAL")
+        rows = conn.execute("SELECT id, box FROM detection_objects WHERE x1 IS NULL AND box IS NOT NULL").fetchall()
+        updates = []
+        for detection_id, text in rows:
+            box = parse_box(text)
+            if box is not None:
+                updates.append((*box_columns(box), detection_id))
+        conn.executemany("""
+            UPDATE detection_objects SET x1 = ?, y1 = ?, x2 = ?, y2 = ?, area = ?, box = NULL WHERE id = ?
+        """, updates)
+        conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS detection_boxes USING rtree(id, x1, x2, y1, y2)
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS detection_boxes_insert AFTER INSERT ON detection_objects
+            WHEN NEW.x1 IS NOT NULL BEGIN
+                INSERT INTO detection_boxes VALUES (NEW.id, NEW.x1, NEW.x2, NEW.y1, NEW.y2);
+            END
+        """)
+        conn.execute("""
+            INSERT INTO detection_boxes
+            SELECT id, x1, x2, y1, y2 FROM detection_objects
+            WHERE x1 IS NOT NULL AND id NOT IN (SELECT id FROM detection_boxes)
+        """)
+
+    def _read_connection(self):
+        """
+        This thread's read-only connection, opened on first use and reused for
+        every later read, so queries skip connection setup. WAL lets them run
+        alongside the writer thread. Closed when the thread exits, since request
+        worker threads come and go.
+        """
+        conn = getattr(self._readers, "conn", None)
+        if conn is None:
+            # Only ever used by this thread; close() or the finalizer may close it from another
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA query_only = ON")
+            conn.execute("PRAGMA mmap_size = 268435456")
+            self._readers.conn = conn
+            with self._writer_lock:
+                self._read_connections.add(conn)
+            weakref.finalize(threading.current_thread(), self._close_read_connection, conn)
+        conn.row_factory = None
+        return conn
+
+    def _close_read_connection(self, conn):
+        with self._writer_lock:
+            self._read_connections.discard(conn)
+        conn.close()
 
     def save_prediction_session(self,uid, original_image, predicted_image):
         with sqlite3.connect(self.db_path) as conn:
@@ -72,16 +426,137 @@ class SQLiteDatabaseHandler(BaseDatabaseHandler):
                 INSERT INTO prediction_sessions (uid, original_image, predicted_image)
                 VALUES (?, ?, ?)
             """, (uid, original_image, predicted_image))
+            day = conn.execute("SELECT date(timestamp) FROM prediction_sessions WHERE uid = ?", (uid,)).fetchone()[0]
+            self._add_aggregates(conn, day, 1, {}, {})
 
     def save_detection_object(self,c,prediction_uid, label, score, box):
+        with sqlite3.connect(self.db_path) as conn:
+            # Count the session for this label only on its first detection with the label
+            first_of_label = conn.execute("""
+                SELECT NOT EXISTS (SELECT 1 FROM detection_objects WHERE prediction_uid = ? AND label = ?)
+            """, (prediction_uid, label)).fetchone()[0]
+            conn.execute("""
+                INSERT INTO detection_objects (prediction_uid, label, score, x1, y1, x2, y2, area)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (prediction_uid, label, score, *box_columns(box)))
+            conn.execute("""
+                UPDATE prediction_sessions SET max_score = MAX(COALESCE(max_score, ?), ?) WHERE uid = ?
+            """, (float(score), float(score), prediction_uid))
+            day = conn.execute("SELECT COALESCE((SELECT date(timestamp) FROM prediction_sessions WHERE uid = ?), "
+                               "date('now'))", (prediction_uid,)).fetchone()[0]
+            self._add_aggregates(conn, day, 0, {label: (int(first_of_label), 1)},
+                                 {(label, score_bucket(score)): 1})
+
+    def save_prediction(self, uid, original_image, predicted_image, detections):
+        """
+        Queue the session and its detections for the writer thread and wait until
+        they are committed. Concurrent callers share a single commit.
+        """
+        rows = [(uid, label, score, *box_columns(box)) for label, score, box in detections]
+        max_score = max((float(score) for _, score, _ in detections), default=None)
+        request = {"session": (uid, original_image, predicted_image, max_score), "detections": rows,
+                   "done": threading.Event(), "error": None}
+        self._start_writer()
+        self._write_queue.put(request)
+        request["done"].wait()
+        if request["error"] is not None:
+            raise request["error"]
+
+    def _start_writer(self):
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="sqlite-writer", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        # The writer thread owns the only long-lived connection, opened lazily on first write
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        while True:
+            requests = [self._write_queue.get()]
+            if requests[0] is None:
+                break
+            while len(requests) < self.MAX_GROUP_SIZE:
+                try:
+                    request = self._write_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._write_queue.put(None)
+                    break
+                requests.append(request)
+            try:
+                self._write_requests(conn, requests)
+            except Exception:
+                # Don't let one bad request fail the whole group
+                for request in requests:
+                    try:
+                        self._write_requests(conn, [request])
+                    except Exception as e:
+                        request["error"] = e
+            for request in requests:
+                request["done"].set()
+        conn.close()
+
+    def _write_requests(self, conn, requests):
+        try:
+            conn.execute("BEGIN")
+            conn.executemany("""
+                INSERT INTO prediction_sessions (uid, original_image, predicted_image, max_score)
+                VALUES (?, ?, ?, ?)
+            """, [request["session"] for request in requests])
+            conn.executemany("""
+                INSERT INTO detection_objects (prediction_uid, label, score, x1, y1, x2, y2, area)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, [row for request in requests for row in request["detections"]])
+            # The summary tables are updated in the same transaction as the rows
+            labels, histogram = aggregate_counts(
+                [[row[1:3] for row in request["detections"]] for request in requests])
+            day = datetime.utcnow().date().isoformat()
+            self._add_aggregates(conn, day, len(requests), labels, histogram)
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        """
+        Stop the writer thread and close every connection
+        """
+        with self._writer_lock:
+            if self._writer is not None:
+                self._write_queue.put(None)
+                self._writer.join()
+                self._writer = None
+            for conn in self._read_connections:
+                conn.close()
+            self._read_connections = set()
+        self._readers = threading.local()
+
+    def get_cached_result(self, cache_key):
+        with self._read_connection() as conn:
+            row = conn.execute("""
+                SELECT detections, image_url, predicted_path FROM result_cache WHERE cache_key = ?
+            """, (cache_key,)).fetchone()
+        if not row:
+            return None
+        return {
+            "detections": [tuple(detection) for detection in json.loads(row[0])],
+            "image_url": row[1],
+            "predicted_path": row[2]
+        }
+
+    def save_cached_result(self, cache_key, detections, image_url, predicted_path):
         with sqlite3.connect(self.db_path) as conn:
             conn.execute("""
-                INSERT INTO detection_objects (prediction_uid, label, score, box)
+                INSERT OR REPLACE INTO result_cache (cache_key, detections, image_url, predicted_path)
                 VALUES (?, ?, ?, ?)
-            """, (prediction_uid, label, score, str(box)))
+            """, (cache_key, json.dumps(detections), image_url, predicted_path))
 
     def get_predicted_image(self, uid):
-        with sqlite3.connect(self.db_path) as conn:
+        with self._read_connection() as conn:
             cursor = conn.execute("""
                 SELECT predicted_image FROM prediction_sessions WHERE uid = ?
             """, (uid,))
@@ -92,7 +567,7 @@ class SQLiteDatabaseHandler(BaseDatabaseHandler):
         """
         Get prediction session by uid with all detected objects
         """
-        with sqlite3.connect(DB_PATH) as conn:
+        with self._read_connection() as conn:
             conn.row_factory = sqlite3.Row
             # Get prediction session
             session = conn.execute("SELECT * FROM prediction_sessions WHERE uid = ?", (uid,)).fetchone()
@@ -114,7 +589,8 @@ class SQLiteDatabaseHandler(BaseDatabaseHandler):
                         "id": obj["id"],
                         "label": obj["label"],
                         "score": obj["score"],
-                        "box": obj["box"]
+                        # None for legacy boxes the migration couldn't parse
+                        "box": [obj["x1"], obj["y1"], obj["x2"], obj["y2"]] if obj["x1"] is not None else None
                     } for obj in objects
                 ]
             }
@@ -123,7 +599,7 @@ class SQLiteDatabaseHandler(BaseDatabaseHandler):
         """
         Get prediction sessions containing objects with specified label
         """
-        with sqlite3.connect(DB_PATH) as conn:
+        with self._read_connection() as conn:
             conn.row_factory = sqlite3.Row
             rows = conn.execute("""
                 SELECT DISTINCT ps.uid, ps.timestamp
@@ -137,79 +613,526 @@ class SQLiteDatabaseHandler(BaseDatabaseHandler):
         """
         Get prediction sessions containing objects with score >= min_score
         """
-        with sqlite3.connect(DB_PATH) as conn:
+        with self._read_connection() as conn:
             conn.row_factory = sqlite3.Row
+            # A session has a detection >= min_score exactly when its max score is
             rows = conn.execute("""
-                SELECT DISTINCT ps.uid, ps.timestamp
-                FROM prediction_sessions ps
-                JOIN detection_objects do ON ps.uid = do.prediction_uid
-                WHERE do.score >= ?
+                SELECT uid FROM prediction_sessions WHERE max_score >= ?
             """, (min_score,)).fetchall()
             return [{"uid": row["uid"]} for row in rows]
 
+    def get_predictions_by_label_page(self, label: str, limit: int, cursor=None):
+        """
+        Keyset-paginated get_predictions_by_label, ordered by uid
+        """
+        after = str(decode_cursor(cursor).get("uid", "")) if cursor else ""
+        with self._read_connection() as conn:
+            rows = conn.execute("""
+                SELECT DISTINCT prediction_uid
+                FROM detection_objects
+                WHERE label = ? AND prediction_uid > ?
+                ORDER BY prediction_uid
+                LIMIT ?
+            """, (label, after, limit)).fetchall()
+        return self._uid_page(rows, limit)
+
+    def get_predictions_by_score_page(self, min_score: float, limit: int, cursor=None):
+        """
+        Keyset-paginated get_predictions_by_score, ordered by uid
+        """
+        after = str(decode_cursor(cursor).get("uid", "")) if cursor else ""
+        with self._read_connection() as conn:
+            rows = conn.execute("""
+                SELECT uid
+                FROM prediction_sessions
+                WHERE uid > ? AND max_score >= ?
+                ORDER BY uid
+                LIMIT ?
+            """, (after, min_score, limit)).fetchall()
+        return self._uid_page(rows, limit)
+
+    def get_detections(self, label: str, min_area=None, region=None, limit: int = 100, cursor=None):
+        """
+        Keyset-paginated by id. Region queries go through the detection_boxes R*Tree,
+        the others through idx_label_area.
+        """
+        after = int(decode_cursor(cursor).get("id", 0)) if cursor else 0
+        columns = "d.id, d.prediction_uid, d.label, d.score, d.x1, d.y1, d.x2, d.y2, d.area"
+        if region is not None:
+            rx1, ry1, rx2, ry2 = region
+            query = f"""
+                SELECT {columns} FROM detection_boxes b JOIN detection_objects d ON d.id = b.id
+                WHERE b.x1 <= ? AND b.x2 >= ? AND b.y1 <= ? AND b.y2 >= ? AND b.id > ?
+                AND d.label = ? AND d.area >= ?
+                ORDER BY b.id LIMIT ?
+            """
+            params = (rx2, rx1, ry2, ry1, after, label, min_area or 0, limit)
+        else:
+            query = f"""
+                SELECT {columns} FROM detection_objects d
+                WHERE d.label = ? AND d.area >= ? AND d.id > ?
+                ORDER BY d.id LIMIT ?
+            """
+            params = (label, min_area or 0, after, limit)
+        with self._read_connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+        items = [{
+            "uid": row[1],
+            "label": row[2],
+            "score": row[3],
+            "box": list(row[4:8]),
+            "area": row[8]
+        } for row in rows]
+        next_cursor = encode_cursor({"id": rows[-1][0]}) if len(rows) == limit else None
+        return items, next_cursor
+
+    def get_stats(self, days: int = 7):
+        """
+        Reads at most `days` rows of daily_counts and `days * labels` of label_daily_counts
+        """
+        since = recent_days(days)[-1]
+        with self._read_connection() as conn:
+            totals = conn.execute("""
+                SELECT day, sessions, detections FROM daily_counts WHERE day >= ? ORDER BY day DESC
+            """, (since,)).fetchall()
+            per_label = conn.execute("""
+                SELECT day, label, sessions, detections FROM label_daily_counts WHERE day >= ?
+            """, (since,)).fetchall()
+        stats = [{"day": day, "sessions": sessions, "detections": detections, "labels": {}}
+                 for day, sessions, detections in totals]
+        by_day = {entry["day"]: entry for entry in stats}
+        for day, label, sessions, detections in per_label:
+            if day in by_day:
+                by_day[day]["labels"][label] = {"sessions": sessions, "detections": detections}
+        return stats
+
+    def get_score_histogram(self, label: str):
+        with self._read_connection() as conn:
+            rows = conn.execute("SELECT bucket, count FROM label_score_histogram WHERE label = ?", (label,)).fetchall()
+        return histogram_response(dict(rows))
+
+    def _uid_page(self, rows, limit):
+        items = [{"uid": row[0]} for row in rows]
+        next_cursor = encode_cursor({"uid": items[-1]["uid"]}) if len(items) == limit else None
+        return items, next_cursor
+
     def get_prediction_image(self,uid: str, request: Request):
         """
         Get prediction image by uid
         """
-        import os
-        from fastapi.responses import FileResponse
-        accept = request.headers.get("accept", "")
-        with sqlite3.connect(DB_PATH) as conn:
+        with self._read_connection() as conn:
             row = conn.execute("SELECT predicted_image FROM prediction_sessions WHERE uid = ?", (uid,)).fetchone()
             if not row:
                 raise HTTPException(status_code=404, detail="Prediction not found")
             image_path = row[0]
+        return predicted_image_response(image_path, request)
 
-        if not os.path.exists(image_path):
-            raise HTTPException(status_code=404, detail="Predicted image file not found")
+# === DynamoDB Implementation ===
+class ClientTable:
+    """
+    The parts of a boto3 Table the handler uses, on the resource's low-level
+    client. Resource objects aren't thread-safe but clients are, so every
+    thread (API requests, the read pool) shares one client and its
+    connection pool. The resource's client still takes and returns plain
+    Python values and Key/Attr conditions.
+    """
+
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def load(self):
+        self.client.describe_table(TableName=self.name)
+
+    def get_item(self, **kwargs):
+        return self.client.get_item(TableName=self.name, **kwargs)
+
+    def put_item(self, **kwargs):
+        return self.client.put_item(TableName=self.name, **kwargs)
+
+    def update_item(self, **kwargs):
+        return self.client.update_item(TableName=self.name, **kwargs)
+
+    def query(self, **kwargs):
+        return self.client.query(TableName=self.name, **kwargs)
+
+    def scan(self, **kwargs):
+        return self.client.scan(TableName=self.name, **kwargs)
 
-        if "image/png" in accept:
-            return FileResponse(image_path, media_type="image/png")
-        elif "image/jpeg" in accept or "image/jpg" in accept:
-            return FileResponse(image_path, media_type="image/jpeg")
-        else:
-            # If the client doesn't accept image, respond with 406 Not Acceptable
-            raise HTTPException(status_code=406, detail="Client does not accept an image format")
 
-# === DynamoDB Implementation ===
 class DynamoDBDatabaseHandler(BaseDatabaseHandler):
+    LABEL_AREA_INDEX = {
+        'IndexName': 'label-area-index',
+        'KeySchema': [
+            {'AttributeName': 'label', 'KeyType': 'HASH'},
+            {'AttributeName': 'area', 'KeyType': 'RANGE'}
+        ],
+        'Projection': {'ProjectionType': 'ALL'}
+    }
+    # Sessions with at least one detection, by max_score; what score queries read
+    SESSION_SCORE_INDEX = {
+        'IndexName': 'score_partition-max_score-index',
+        'KeySchema': [
+            {'AttributeName': 'score_partition', 'KeyType': 'HASH'},
+            {'AttributeName': 'max_score', 'KeyType': 'RANGE'}
+        ],
+        'Projection': {'ProjectionType': 'KEYS_ONLY'}
+    }
+
     def __init__(self, env='dev', project_prefix='majd_yolo'):
-        self.dynamodb = boto3.resource('dynamodb', region_name='eu-west-1')
+        self.dynamodb = boto3.resource('dynamodb', region_name='eu-west-1', config=DYNAMODB_CONFIG)
         # Compose full prefix using environment + project prefix
         self.prefix = f"{env}_{project_prefix}"  # e.g. "dev_majd_yolo" or "prod_majd_yolo"
 
-        self.prediction_sessions_table = self.dynamodb.Table(f"{self.prefix}_prediction_sessions")
-        self.detection_objects_table = self.dynamodb.Table(f"{self.prefix}_detection_objects")
+        client = self.dynamodb.meta.client
+        self.prediction_sessions_table = ClientTable(client, f"{self.prefix}_prediction_sessions")
+        self.detection_objects_table = ClientTable(client, f"{self.prefix}_detection_objects")
+        self.result_cache_table = ClientTable(client, f"{self.prefix}_result_cache")
+        # Counters for /stats: pk "day#<day>" with sk "total#<shard>" or "label#<label>",
+        # and pk "scores#<label>" with one sk per score bucket. pk "counted#<key>"
+        # items mark writes already counted, so a retried write isn't counted twice;
+        # they expire through the table's TTL on expires_at.
+        self.stats_table = ClientTable(client, f"{self.prefix}_prediction_stats")
+        self._read_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="dynamodb-read")
 
     def init_db(self):
         # Optional: Validate tables exist
         try:
             self.prediction_sessions_table.load()
             self.detection_objects_table.load()
+            self.stats_table.load()
         except ClientError as e:
             raise RuntimeError("One or more DynamoDB tables do not exist") from e
 
-    def save_prediction_session(self, uid, original_image, predicted_image):
-        self.prediction_sessions_table.put_item(Item={
+    def create_tables(self):
+        """
+        Create both tables with their indexes. Used against local DynamoDB stand-ins
+        (moto, dynamodb-local); the real tables are provisioned outside the app.
+        """
+        client = self.dynamodb.meta.client
+        client.create_table(
+            TableName=self.prediction_sessions_table.name,
+            KeySchema=[{'AttributeName': 'uid', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[
+                {'AttributeName': 'uid', 'AttributeType': 'S'},
+                {'AttributeName': 'score_partition', 'AttributeType': 'S'},
+                {'AttributeName': 'max_score', 'AttributeType': 'N'}
+            ],
+            GlobalSecondaryIndexes=[self.SESSION_SCORE_INDEX],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        client.create_table(
+            TableName=self.detection_objects_table.name,
+            KeySchema=[
+                {'AttributeName': 'prediction_uid', 'KeyType': 'HASH'},
+                {'AttributeName': 'score', 'KeyType': 'RANGE'}
+            ],
+            AttributeDefinitions=[
+                {'AttributeName': 'prediction_uid', 'AttributeType': 'S'},
+                {'AttributeName': 'score', 'AttributeType': 'S'},
+                {'AttributeName': 'label', 'AttributeType': 'S'},
+                {'AttributeName': 'score_partition', 'AttributeType': 'S'},
+                {'AttributeName': 'label_score', 'AttributeType': 'N'},
+                {'AttributeName': 'area', 'AttributeType': 'N'}
+            ],
+            GlobalSecondaryIndexes=[
+                {
+                    'IndexName': 'label-index',
+                    'KeySchema': [{'AttributeName': 'label', 'KeyType': 'HASH'}],
+                    'Projection': {'ProjectionType': 'ALL'}
+                },
+                {
+                    'IndexName': 'score_partition-score-index',
+                    'KeySchema': [
+                        {'AttributeName': 'score_partition', 'KeyType': 'HASH'},
+                        {'AttributeName': 'label_score', 'KeyType': 'RANGE'}
+                    ],
+                    'Projection': {'ProjectionType': 'ALL'}
+                },
+                self.LABEL_AREA_INDEX
+            ],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        client.create_table(
+            TableName=self.result_cache_table.name,
+            KeySchema=[{'AttributeName': 'cache_key', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'cache_key', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        client.create_table(
+            TableName=self.stats_table.name,
+            KeySchema=[
+                {'AttributeName': 'pk', 'KeyType': 'HASH'},
+                {'AttributeName': 'sk', 'KeyType': 'RANGE'}
+            ],
+            AttributeDefinitions=[
+                {'AttributeName': 'pk', 'AttributeType': 'S'},
+                {'AttributeName': 'sk', 'AttributeType': 'S'}
+            ],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        client.update_time_to_live(
+            TableName=self.stats_table.name,
+            TimeToLiveSpecification={'Enabled': True, 'AttributeName': 'expires_at'}
+        )
+
+    def migrate_boxes(self):
+        """
+        One-off migration for tables written by older versions: add the
+        label-area-index and rewrite items whose box is a string with numeric
+        x1/y1/x2/y2/area attributes. Scans the detections table.
+        """
+        client = self.dynamodb.meta.client
+        description = client.describe_table(TableName=self.detection_objects_table.name)['Table']
+        indexes = {index['IndexName'] for index in description.get('GlobalSecondaryIndexes', [])}
+        if self.LABEL_AREA_INDEX['IndexName'] not in indexes:
+            client.update_table(
+                TableName=self.detection_objects_table.name,
+                AttributeDefinitions=[
+                    {'AttributeName': 'label', 'AttributeType': 'S'},
+                    {'AttributeName': 'area', 'AttributeType': 'N'}
+                ],
+                GlobalSecondaryIndexUpdates=[{'Create': self.LABEL_AREA_INDEX}]
+            )
+        migrated = 0
+        kwargs = {'FilterExpression': Attr('x1').not_exists() & Attr('box').exists()}
+        while True:
+            response = self.detection_objects_table.scan(**kwargs)
+            writes = []
+            for item in response['Items']:
+                box = parse_box(item.pop('box'))
+                if box is None:
+                    continue
+                item.update(self._box_attributes(box))
+                writes.append({'PutRequest': {'Item': item}})
+            for i in range(0, len(writes), BATCH_WRITE_LIMIT):
+                self._batch_write({self.detection_objects_table.name: writes[i:i + BATCH_WRITE_LIMIT]})
+            migrated += len(writes)
+            if 'LastEvaluatedKey' not in response:
+                return migrated
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def migrate_max_score(self):
+        """
+        One-off migration for tables written by older versions: add the session
+        score index and set max_score on sessions that lack it, from their
+        detections. Scans the sessions table.
+        """
+        client = self.dynamodb.meta.client
+        description = client.describe_table(TableName=self.prediction_sessions_table.name)['Table']
+        indexes = {index['IndexName'] for index in description.get('GlobalSecondaryIndexes', [])}
+        if self.SESSION_SCORE_INDEX['IndexName'] not in indexes:
+            client.update_table(
+                TableName=self.prediction_sessions_table.name,
+                AttributeDefinitions=[
+                    {'AttributeName': 'score_partition', 'AttributeType': 'S'},
+                    {'AttributeName': 'max_score', 'AttributeType': 'N'}
+                ],
+                GlobalSecondaryIndexUpdates=[{'Create': self.SESSION_SCORE_INDEX}]
+            )
+        migrated = 0
+        kwargs = {'FilterExpression': Attr('score_partition').not_exists(), 'ProjectionExpression': 'uid'}
+        while True:
+            response = self.prediction_sessions_table.scan(**kwargs)
+            for item in response['Items']:
+                scores = [detection['label_score'] for detection in self._query_all(
+                    self.detection_objects_table, KeyConditionExpression=Key('prediction_uid').eq(item['uid']))]
+                if scores:
+                    self._raise_max_score(item['uid'], max(scores))
+                    migrated += 1
+            if 'LastEvaluatedKey' not in response:
+                return migrated
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def _raise_max_score(self, uid, score):
+        """
+        Set the session's max_score to score unless it already is at least that
+        """
+        try:
+            self.prediction_sessions_table.update_item(
+                Key={'uid': uid},
+                UpdateExpression='SET max_score = :score, score_partition = :partition',
+                ConditionExpression='attribute_exists(uid) AND (attribute_not_exists(max_score) OR max_score < :score)',
+                ExpressionAttributeValues={':score': Decimal(str(score)), ':partition': 'score'}
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+
+    def _box_attributes(self, box):
+        # Go through str so floats become exact decimals DynamoDB accepts
+        return {name: Decimal(str(value))
+                for name, value in zip(("x1", "y1", "x2", "y2", "area"), box_columns(box))}
+
+    @staticmethod
+    def _item_box(item):
+        if 'x1' in item:
+            return [float(item[name]) for name in ("x1", "y1", "x2", "y2")]
+        return parse_box(item.get('box'))
+
+    def _session_item(self, uid, original_image, predicted_image, max_score=None):
+        item = {
             'uid': uid,
             'timestamp': datetime.utcnow().isoformat(),
             'original_image': original_image,
             'predicted_image': predicted_image
-        })
+        }
+        if max_score is not None:
+            item['max_score'] = Decimal(str(max_score))
+            item['score_partition'] = 'score'
+        return item
 
-    def save_detection_object(self,c,prediction_uid, label, score, box):
-        from decimal import Decimal
-        score = Decimal(score)
-        box = [Decimal(coord) for coord in box]
-        self.detection_objects_table.put_item(Item={
+    def _detection_item(self, c, prediction_uid, label, score, box):
+        # Go through str so floats become exact decimals DynamoDB accepts
+        score = Decimal(str(score))
+        return {
             'prediction_uid': prediction_uid,
             'score': f'{score}_{c}',
             'label': label,
             'score_partition' : 'score',
             'label_score': score,
-            'box': str(box)
+            **self._box_attributes(box)
+        }
+
+    def save_prediction_session(self, uid, original_image, predicted_image):
+        self.prediction_sessions_table.put_item(Item=self._session_item(uid, original_image, predicted_image))
+        self._count_write(f"session#{uid}", 1, {}, {})
+
+    def save_detection_object(self,c,prediction_uid, label, score, box):
+        # Count the session for this label only on its first detection with the label
+        first_of_label = not self._query_all(self.detection_objects_table,
+                                             KeyConditionExpression=Key('prediction_uid').eq(prediction_uid),
+                                             FilterExpression=Attr('label').eq(label))
+        self.detection_objects_table.put_item(Item=self._detection_item(c, prediction_uid, label, score, box))
+        self._raise_max_score(prediction_uid, score)
+        self._count_write(f"detection#{prediction_uid}#{c}", 0, {label: (int(first_of_label), 1)},
+                          {(label, score_bucket(score)): 1})
+
+    def _count_write(self, write_key, sessions, labels, histogram):
+        """
+        Add a stored write to the /stats counters. The write itself already
+        succeeded, so a counter failure is logged and counted instead of raised.
+        """
+        try:
+            self._add_aggregates(write_key, sessions, labels, histogram)
+        except (ClientError, BotoCoreError) as e:
+            print(f"[DynamoDB Stats Error] {write_key}: {e}")
+            metrics.ERRORS.labels("stats").inc()
+
+    def _add_aggregates(self, write_key, sessions, labels, histogram):
+        """
+        ADD the counts of the write identified by write_key to today's counters.
+        Each TransactWriteItems call also creates a "counted" marker for
+        write_key, conditional on it not existing yet, so retrying a write that
+        was already counted changes nothing and a failed call counts nothing.
+        """
+        day = datetime.utcnow().date().isoformat()
+        shard = zlib.crc32(write_key.encode()) % TOTAL_COUNTER_SHARDS
+        counters = [({'pk': f'day#{day}', 'sk': f'total#{shard}'},
+                     {'sessions': sessions, 'detections': sum(count for _, count in labels.values())})]
+        counters += [({'pk': f'day#{day}', 'sk': f'label#{label}'}, {'sessions': label_sessions, 'detections': count})
+                     for label, (label_sessions, count) in labels.items()]
+        counters += [({'pk': f'scores#{label}', 'sk': f'{bucket:02d}'}, {'count': count})
+                     for (label, bucket), count in histogram.items()]
+        table = self.stats_table.name
+        # One marker per transaction, for the rare write with more counters than fit in one
+        chunk_size = TRANSACT_WRITE_LIMIT - 1
+        for chunk, start in enumerate(range(0, len(counters), chunk_size)):
+            marker = {'Put': {
+                'TableName': table,
+                'Item': {'pk': f'counted#{write_key}', 'sk': str(chunk),
+                         'expires_at': int(time.time()) + COUNTED_MARKER_TTL},
+                'ConditionExpression': 'attribute_not_exists(pk)'
+            }}
+            updates = [{'Update': {
+                'TableName': table,
+                'Key': key,
+                'UpdateExpression': 'ADD ' + ', '.join(f'#{name} :{name}' for name in values),
+                'ExpressionAttributeNames': {f'#{name}': name for name in values},
+                'ExpressionAttributeValues': {f':{name}': value for name, value in values.items()}
+            }} for key, values in counters[start:start + chunk_size]]
+            self._transact_write([marker] + updates)
+
+    def _transact_write(self, items):
+        """
+        Run one transaction whose first item is a "counted" marker. Returns
+        without writing if the marker exists; retries conflicts with other
+        transactions on the same hot counters.
+        """
+        client = self.dynamodb.meta.client
+        for attempt in range(TRANSACT_WRITE_MAX_RETRIES + 1):
+            try:
+                client.transact_write_items(TransactItems=items)
+                return
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'TransactionCanceledException':
+                    raise
+                reasons = [reason.get('Code') for reason in e.response.get('CancellationReasons', [])]
+                if reasons and reasons[0] == 'ConditionalCheckFailed':
+                    return  # already counted
+                if 'TransactionConflict' not in reasons or attempt == TRANSACT_WRITE_MAX_RETRIES:
+                    raise
+            time.sleep(min(BATCH_WRITE_BACKOFF * 2 ** attempt, 2))
+
+    def save_prediction(self, uid, original_image, predicted_image, detections):
+        """
+        Write the session and its detections with BatchWriteItem, 25 items per request.
+        Returns the record built from the written items, so callers needn't read it back.
+        """
+        max_score = max((float(score) for _, score, _ in detections), default=None)
+        session = self._session_item(uid, original_image, predicted_image, max_score)
+        objects = [self._detection_item(c, uid, label, score, box) for c, (label, score, box) in enumerate(detections)]
+        writes = [(self.prediction_sessions_table.name, session)]
+        writes += [(self.detection_objects_table.name, item) for item in objects]
+        for i in range(0, len(writes), BATCH_WRITE_LIMIT):
+            request_items = {}
+            for table_name, item in writes[i:i + BATCH_WRITE_LIMIT]:
+                request_items.setdefault(table_name, []).append({'PutRequest': {'Item': item}})
+            self._batch_write(request_items)
+        self._count_write(f"session#{uid}", 1, *aggregate_counts([detections]))
+        # In sort key order, as a query returns them
+        return self._prediction_record(session, sorted(objects, key=lambda item: item['score']))
+
+    def _batch_write(self, request_items):
+        client = self.dynamodb.meta.client
+        for attempt in range(BATCH_WRITE_MAX_RETRIES + 1):
+            response = client.batch_write_item(RequestItems=request_items)
+            request_items = response.get('UnprocessedItems')
+            if not request_items:
+                return
+            # Throttled: back off before retrying what DynamoDB didn't process
+            time.sleep(min(BATCH_WRITE_BACKOFF * 2 ** attempt, 2))
+        raise RuntimeError(f"DynamoDB left {sum(len(v) for v in request_items.values())} items unprocessed")
+
+    def get_cached_result(self, cache_key):
+        item = self.result_cache_table.get_item(Key={'cache_key': cache_key}).get('Item')
+        if not item:
+            return None
+        return {
+            "detections": [tuple(detection) for detection in json.loads(item['detections'])],
+            "image_url": item.get('image_url'),
+            "predicted_path": item.get('predicted_path')
+        }
+
+    def save_cached_result(self, cache_key, detections, image_url, predicted_path):
+        # Detections are kept as a JSON string so floats don't need Decimal conversion
+        self.result_cache_table.put_item(Item={
+            'cache_key': cache_key,
+            'detections': json.dumps(detections),
+            'image_url': image_url,
+            'predicted_path': predicted_path,
+            'timestamp': datetime.utcnow().isoformat()
         })
 
+    def _query_all(self, table, **kwargs):
+        items = []
+        while True:
+            response = table.query(**kwargs)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                return items
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
     def get_predicted_image(self, uid):
         response = self.prediction_sessions_table.get_item(Key={'uid': uid})
         item = response.get('Item')
@@ -219,25 +1142,29 @@ class DynamoDBDatabaseHandler(BaseDatabaseHandler):
         """
         Get prediction session by uid with all detected objects
         """
-        # 1. Fetch prediction session
+        # Fetch the session and its detection objects concurrently
+        session_future = self._read_pool.submit(self.prediction_sessions_table.get_item, Key={'uid': uid})
+        objects_future = self._read_pool.submit(self._query_all, self.detection_objects_table,
+                                                KeyConditionExpression=Key('prediction_uid').eq(uid))
+
+        # 1. Prediction session
         try:
-            response = self.prediction_sessions_table.get_item(Key={'uid': uid})
-            session = response.get('Item')
-            if not session:
-                raise HTTPException(status_code=404, detail="Prediction not found")
+            session = session_future.result().get('Item')
         except ClientError as e:
             raise HTTPException(status_code=500, detail="Failed to fetch prediction session") from e
+        if not session:
+            raise HTTPException(status_code=404, detail="Prediction not found")
 
-        # 2. Fetch detection objects
+        # 2. Detection objects
         try:
-            response = self.detection_objects_table.query(
-                KeyConditionExpression=Key('prediction_uid').eq(uid)
-            )
-            objects = response.get('Items', [])
+            objects = objects_future.result()
         except ClientError as e:
             raise HTTPException(status_code=500, detail="Failed to fetch detection objects") from e
 
         # 3. Format and return result
+        return self._prediction_record(session, objects)
+
+    def _prediction_record(self, session, objects):
         return {
             "uid": session["uid"],
             "timestamp": session.get("timestamp"),
@@ -247,34 +1174,114 @@ class DynamoDBDatabaseHandler(BaseDatabaseHandler):
                 {
                     "label": obj.get("label"),
                     "score": obj.get("label_score", 0),
-                    "box": obj.get("box", [])
+                    "box": self._item_box(obj)
                 } for obj in objects
             ]
         }
 
     def get_predictions_by_label(self,label: str):
-        response = self.detection_objects_table.query(
-            IndexName='label-index',
-            KeyConditionExpression=Key('label').eq(label)
-        )
-        return response['Items']
+        return self._query_all(self.detection_objects_table, **self._label_query(label))
 
     def get_predictions_by_score(self,min_score: float):
-        from decimal import Decimal
-        min_score = Decimal(min_score)
-        response = self.detection_objects_table.query(
-            IndexName='score_partition-score-index',
-            KeyConditionExpression=Key('score_partition').eq('score') & Key('label_score').gte(min_score)
-        )
-        return response['Items']
+        # A session has a detection >= min_score exactly when its max score is
+        items = self._query_all(self.prediction_sessions_table, **self._score_query(min_score))
+        return [{"uid": item["uid"]} for item in items]
+
+    def get_predictions_by_label_page(self, label: str, limit: int, cursor=None):
+        """
+        Pages over label-index, which holds detections: a session with several
+        detections of the label is listed once per page, but may show up again
+        on a later page.
+        """
+        items, next_cursor = self._query_page(self._label_query(label), limit, cursor)
+        uids = dict.fromkeys(item["prediction_uid"] for item in items)
+        return [{"uid": uid} for uid in uids], next_cursor
+
+    def get_predictions_by_score_page(self, min_score: float, limit: int, cursor=None):
+        items, next_cursor = self._query_page(self._score_query(min_score), limit, cursor,
+                                              table=self.prediction_sessions_table)
+        return [{"uid": item["uid"]} for item in items], next_cursor
+
+    def get_detections(self, label: str, min_area=None, region=None, limit: int = 100, cursor=None):
+        """
+        Queries label-area-index, so only this label's detections with area >= min_area
+        are read. DynamoDB has no 2D index: region overlap is a filter on that range,
+        so a page may hold fewer than `limit` items while a next cursor is still returned.
+        """
+        query = {
+            'IndexName': self.LABEL_AREA_INDEX['IndexName'],
+            'KeyConditionExpression': Key('label').eq(label) & Key('area').gte(Decimal(str(min_area or 0)))
+        }
+        if region is not None:
+            rx1, ry1, rx2, ry2 = (Decimal(str(value)) for value in region)
+            query['FilterExpression'] = (Attr('x1').lte(rx2) & Attr('x2').gte(rx1)
+                                         & Attr('y1').lte(ry2) & Attr('y2').gte(ry1))
+        items, next_cursor = self._query_page(query, limit, cursor)
+        return [{
+            "uid": item["prediction_uid"],
+            "label": item["label"],
+            "score": float(item["label_score"]),
+            "box": self._item_box(item),
+            "area": float(item["area"])
+        } for item in items], next_cursor
+
+    def get_stats(self, days: int = 7):
+        """
+        One query per day against the counters table, run in parallel
+        """
+        day_list = recent_days(days)
+        futures = [self._read_pool.submit(self._query_all, self.stats_table,
+                                          KeyConditionExpression=Key('pk').eq(f'day#{day}'))
+                   for day in day_list]
+        stats = []
+        for day, future in zip(day_list, futures):
+            entry = {"day": day, "sessions": 0, "detections": 0, "labels": {}}
+            items = future.result()
+            for item in items:
+                counts = {"sessions": int(item.get('sessions', 0)), "detections": int(item.get('detections', 0))}
+                if item['sk'].startswith('total'):
+                    # "total#<shard>", or "total" from before sharding
+                    entry["sessions"] += counts["sessions"]
+                    entry["detections"] += counts["detections"]
+                else:
+                    entry["labels"][item['sk'][len('label#'):]] = counts
+            if items:
+                stats.append(entry)
+        return stats
+
+    def get_score_histogram(self, label: str):
+        items = self._query_all(self.stats_table, KeyConditionExpression=Key('pk').eq(f'scores#{label}'))
+        return histogram_response({int(item['sk']): int(item['count']) for item in items})
+
+    def _label_query(self, label):
+        return {
+            'IndexName': 'label-index',
+            'KeyConditionExpression': Key('label').eq(label)
+        }
+
+    def _score_query(self, min_score):
+        min_score = Decimal(str(min_score))
+        return {
+            'IndexName': self.SESSION_SCORE_INDEX['IndexName'],
+            'KeyConditionExpression': Key('score_partition').eq('score') & Key('max_score').gte(min_score)
+        }
+
+    def _query_page(self, query, limit, cursor, table=None):
+        # Cursors carry LastEvaluatedKey in DynamoDB JSON so Decimal keys survive the round trip
+        if cursor:
+            deserializer = TypeDeserializer()
+            query['ExclusiveStartKey'] = {k: deserializer.deserialize(v) for k, v in decode_cursor(cursor).items()}
+        response = (table or self.detection_objects_table).query(Limit=limit, **query)
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return response['Items'], None
+        serializer = TypeSerializer()
+        return response['Items'], encode_cursor({k: serializer.serialize(v) for k, v in last_key.items()})
 
     def get_prediction_image(self, uid: str, request: Request):
         """
         Get prediction image by uid
         """
-        import os
-        from fastapi.responses import FileResponse
-        accept = request.headers.get("accept", "")
         try:
             response = self.prediction_sessions_table.get_item(Key={'uid': uid})
             item = response.get('Item')
@@ -283,17 +1290,7 @@ class DynamoDBDatabaseHandler(BaseDatabaseHandler):
             image_path = item['predicted_image']
         except ClientError as e:
             raise HTTPException(status_code=500, detail="Failed to fetch prediction image") from e
-
-        if not os.path.exists(image_path):
-            raise HTTPException(status_code=404, detail="Predicted image file not found")
-
-        if "image/png" in accept:
-            return FileResponse(image_path, media_type="image/png")
-        elif "image/jpeg" in accept or "image/jpg" in accept:
-            return FileResponse(image_path, media_type="image/jpeg")
-        else:
-            # If the client doesn't accept image, respond with 406 Not Acceptable
-            raise HTTPException(status_code=406, detail="Client does not accept an image format")
+        return predicted_image_response(image_path, request)
 
 # === Factory Method ===
 class DatabaseFactory:
@@ -0,0 +1,167 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from S3_requests import copy_file, download_file, upload_file
+
+
+class ImageStore:
+    """
+    Local image files under `root` kept within `max_bytes`, backed by S3.
+
+    Every image this instance writes is registered with added(), which mirrors
+    it to `{s3_prefix}/<path under root>` in the bucket. Local files are evicted
+    least recently used first once the budget is exceeded. get() serves the
+    local file, or downloads the mirrored object on a miss, so any replica can
+    serve any image. Without a bucket the store only bounds local disk use, and
+    evicted images are gone.
+    """
+
+    def __init__(self, root="uploads", max_bytes=1024 ** 3, bucket=None, s3_prefix="images", prefetch_workers=2):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.bucket = bucket if s3_prefix else None
+        self.s3_prefix = s3_prefix
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.s3_fetches = 0
+        self.evictions = 0
+        self._files = OrderedDict()  # absolute path -> size, least recently used first
+        self._lock = threading.Lock()
+        self._fetch_locks = {}
+        self._prefetch_pool = ThreadPoolExecutor(max_workers=prefetch_workers, thread_name_prefix="image-prefetch")
+        self._scan()
+
+    def _scan(self):
+        # Index what a previous run left behind, oldest access first
+        files = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_atime, path, stat.st_size))
+        with self._lock:
+            for _, path, size in sorted(files):
+                self._files[path] = size
+                self.bytes += size
+            self._evict()
+
+    def _resolve(self, path):
+        """
+        Absolute path of an image under root, or None for anything outside it
+        """
+        path = os.path.abspath(path)
+        if os.path.commonpath([path, self.root]) != self.root or path == self.root:
+            return None
+        return path
+
+    def key_for(self, path):
+        relative = os.path.relpath(os.path.abspath(path), self.root)
+        return f"{self.s3_prefix}/{relative.replace(os.sep, '/')}"
+
+    def added(self, path, s3_source=None):
+        """
+        Register an image that was just saved under root, and mirror it to S3:
+        a server-side copy from s3_source when the bucket already has it,
+        otherwise an upload of the local file. Returns False if mirroring failed.
+        """
+        resolved = self._resolve(path)
+        if resolved is None:
+            raise ValueError(f"{path} is not under {self.root}")
+        path = resolved
+        mirrored = True
+        if self.bucket is not None:
+            if s3_source is not None:
+                mirrored = copy_file(self.bucket, s3_source, self.key_for(path))
+            elif os.path.exists(path):
+                mirrored = upload_file(path, self.bucket, self.key_for(path))
+            if not mirrored:
+                print(f"[Image Store Error] could not mirror {path} to S3")
+        if os.path.exists(path):
+            self._remember(path, os.path.getsize(path))
+        return mirrored
+
+    def _remember(self, path, size):
+        with self._lock:
+            self.bytes += size - self._files.pop(path, 0)
+            self._files[path] = size
+            self._evict(keep=path)
+
+    def _evict(self, keep=None):
+        while self.bytes > self.max_bytes and self._files:
+            path, size = next(iter(self._files.items()))
+            if path == keep:
+                break
+            del self._files[path]
+            self.bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def get(self, path):
+        """
+        Local path of the image, fetched from S3 on a local miss. None if it
+        exists in neither place.
+        """
+        path = self._resolve(path)
+        if path is None:
+            return None
+        with self._lock:
+            if path in self._files and os.path.exists(path):
+                self._files.move_to_end(path)
+                self.hits += 1
+                return path
+            self.misses += 1
+            fetch_lock = self._fetch_locks.setdefault(path, threading.Lock())
+        # One download per path, concurrent requests for it wait and share the file
+        with fetch_lock:
+            try:
+                if not os.path.exists(path):
+                    if self.bucket is None:
+                        return None
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    if download_file(self.bucket, self.key_for(path), path) is not True:
+                        return None
+                    with self._lock:
+                        self.s3_fetches += 1
+                self._remember(path, os.path.getsize(path))
+                return path
+            finally:
+                with self._lock:
+                    self._fetch_locks.pop(path, None)
+
+    def is_local(self, path):
+        path = self._resolve(path)
+        with self._lock:
+            return path in self._files
+
+    def prefetch(self, path):
+        """
+        Start fetching an image in the background, e.g. when a client is likely to
+        ask for it next. Returns a Future of get(path), or None if it is already local.
+        """
+        if self._resolve(path) is None or self.is_local(path):
+            return None
+        return self._prefetch_pool.submit(self.get, path)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "files": len(self._files),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "s3_fetches": self.s3_fetches,
+                "evictions": self.evictions,
+                "s3_backed": self.bucket is not None
+            }
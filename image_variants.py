@@ -0,0 +1,107 @@
+import hashlib
+import os
+import threading
+
+from PIL import Image
+
+from image_store import ImageStore
+
+# format query value -> (PIL format, media type, file extension)
+VARIANT_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg", ".jpg"),
+    "png": ("PNG", "image/png", ".png"),
+    "webp": ("WEBP", "image/webp", ".webp"),
+}
+# Images never change once written, so caches may keep them for a year
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def image_etag(name, width=None, image_format=None):
+    """
+    Strong ETag for an image and variant. Derived from the name alone, since an
+    image never changes once written, so every replica hands out the same tag.
+    """
+    digest = hashlib.md5(f"{name}:{width or ''}:{image_format or ''}".encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(request, etag):
+    """
+    True when the request's If-None-Match lists etag (weak tags compare equal)
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def render_variant(source, target, width=None, image_format=None):
+    """
+    Write source resized to at most `width` pixels wide and/or re-encoded as
+    image_format to target. Images are never scaled up.
+    """
+    with Image.open(source) as image:
+        pil_format = VARIANT_FORMATS[image_format][0] if image_format else image.format
+        if width and width < image.width:
+            height = max(1, round(image.height * width / image.width))
+            # Lets the JPEG decoder skip straight to a nearby scale instead of decoding full size
+            image.draft("RGB", (width, height))
+            image = image.resize((width, height), Image.LANCZOS)
+        if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # Written under a temporary name so a concurrent reader never sees half a file
+        partial = f"{target}.{threading.get_ident()}.tmp"
+        image.save(partial, format=pil_format, quality=80)
+    os.replace(partial, target)
+
+
+class VariantCache:
+    """
+    Resized and re-encoded copies of images, rendered on first request and kept
+    on disk under `root` within `max_bytes`, least recently used evicted first.
+    Variants are cheap to render again, so they are never mirrored to S3.
+    """
+
+    def __init__(self, root="variants", max_bytes=256 * 1024 ** 2):
+        self.store = ImageStore(root, max_bytes=max_bytes, bucket=None)
+        self.renders = 0
+        self._lock = threading.Lock()
+        self._render_locks = {}
+
+    def path_for(self, name, width=None, image_format=None):
+        stem, ext = os.path.splitext(name)
+        if image_format:
+            ext = VARIANT_FORMATS[image_format][2]
+        return os.path.join(self.store.root, f"{stem}.w{width or 0}{ext}")
+
+    def get(self, source, name, width=None, image_format=None):
+        """
+        Local path of the variant of source, stored as `name` relative to root,
+        rendering it on a miss
+        """
+        path = self.path_for(name, width, image_format)
+        cached = self.store.get(path)
+        if cached is not None:
+            return cached
+        with self._lock:
+            render_lock = self._render_locks.setdefault(path, threading.Lock())
+        # One render per variant, concurrent requests for it wait and share the file
+        with render_lock:
+            try:
+                if not os.path.exists(path):
+                    render_variant(source, path, width, image_format)
+                    with self._lock:
+                        self.renders += 1
+                self.store.added(path)
+                return path
+            finally:
+                with self._lock:
+                    self._render_locks.pop(path, None)
+
+    def stats(self):
+        stats = self.store.stats()
+        stats.pop("s3_fetches")
+        stats.pop("s3_backed")
+        return {**stats, "renders": self.renders}
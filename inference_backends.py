@@ -0,0 +1,161 @@
+"""
+Inference backends for the YOLO model. Every backend returns the same
+ultralytics Results objects, so plotting and extract_detections() work
+unchanged whichever runtime does the forward pass.
+
+    torch     - eager PyTorch (the .pt weights as-is)
+    onnx      - ONNX Runtime, exported once with dynamic batch size
+    openvino  - Intel OpenVINO, optional (pip install openvino)
+
+Exports are written next to the weights and reused on later starts. They are
+built in a temporary directory under a file lock and moved into place, so
+processes starting together export once and never load a half-written file.
+torch and ultralytics are only imported when a backend is loaded, since
+importing them takes seconds.
+"""
+import fcntl
+import importlib.metadata
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+
+def _yolo(*args, **kwargs):
+    import torch
+    from ultralytics import YOLO
+
+    torch.cuda.is_available = lambda: False
+    return YOLO(*args, **kwargs)
+
+
+@contextmanager
+def _file_lock(path):
+    """
+    Exclusive lock across processes, held while the block runs
+    """
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def model_identity(backend_name, model_name):
+    """
+    (name, version) of a model as it would be loaded, without loading it.
+    Reads the ultralytics version from package metadata, not by importing it.
+    """
+    return f"{model_name}/{backend_name}", importlib.metadata.version("ultralytics")
+
+
+class InferenceBackend:
+    """
+    Callable like a YOLO model: backend(sources, **kwargs) -> list of Results
+    """
+    backend_name = None
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.model = self.load()
+
+    @property
+    def name(self):
+        return model_identity(self.backend_name, self.model_name)[0]
+
+    @property
+    def names(self):
+        return self.model.names
+
+    @property
+    def version(self):
+        return model_identity(self.backend_name, self.model_name)[1]
+
+    def load(self):
+        raise NotImplementedError
+
+    def __call__(self, sources, **kwargs):
+        kwargs.setdefault("device", "cpu")
+        return self.model(sources, **kwargs)
+
+
+class TorchBackend(InferenceBackend):
+    backend_name = "torch"
+
+    def load(self):
+        return _yolo(self.model_name)
+
+
+class ExportedBackend(InferenceBackend):
+    """
+    Exports the .pt weights to `export_format` on first use and loads the export
+    """
+    export_format = None
+
+    @classmethod
+    def export_path(cls, model_name):
+        raise NotImplementedError
+
+    @classmethod
+    def export(cls, model_name):
+        """
+        Export model_name unless the export already exists, and return its path
+        """
+        path = cls.export_path(model_name)
+        with _file_lock(path + ".lock"):
+            if not os.path.exists(path):
+                print(f"Exporting {model_name} to {cls.export_format}...")
+                weights = _yolo(model_name).ckpt_path  # downloads the weights if missing
+                with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path))) as tmp:
+                    copy = shutil.copy(weights, os.path.join(tmp, os.path.basename(weights)))
+                    os.replace(_yolo(copy).export(format=cls.export_format, dynamic=True), path)
+        return path
+
+    def load(self):
+        return _yolo(self.export(self.model_name), task="detect")
+
+
+class OnnxBackend(ExportedBackend):
+    backend_name = "onnx"
+    export_format = "onnx"
+
+    @classmethod
+    def export_path(cls, model_name):
+        return os.path.splitext(model_name)[0] + ".onnx"
+
+
+class OpenVinoBackend(ExportedBackend):
+    backend_name = "openvino"
+    export_format = "openvino"
+
+    @classmethod
+    def export_path(cls, model_name):
+        return os.path.splitext(model_name)[0] + "_openvino_model"
+
+
+BACKENDS = {
+    "torch": TorchBackend,
+    "onnx": OnnxBackend,
+    "openvino": OpenVinoBackend,
+}
+
+
+def backend_class(backend_name):
+    if backend_name not in BACKENDS:
+        raise ValueError(f"Unknown INFERENCE_BACKEND {backend_name!r}, use one of {sorted(BACKENDS)}")
+    return BACKENDS[backend_name]
+
+
+def prepare_backend(backend_name, model_name):
+    """
+    Do the one-off export for backend_name, so processes loading it afterwards
+    only read the finished export
+    """
+    backend = backend_class(backend_name)
+    if issubclass(backend, ExportedBackend):
+        backend.export(model_name)
+
+
+def load_backend(backend_name, model_name):
+    return backend_class(backend_name)(model_name)
@@ -0,0 +1,184 @@
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+def default_pool_size():
+    """
+    Leave one core for the API process and give every worker at least two torch threads
+    """
+    return max(1, ((os.cpu_count() or 1) - 1) // 2)
+
+
+def default_threads_per_process(processes):
+    return max(1, ((os.cpu_count() or 1) - 1) // processes)
+
+
+def extract_detections(result, names):
+    """
+    Turn one YOLO result into (label, score, box) tuples, the shape save_prediction takes
+    """
+    detections = []
+    for box in result.boxes:
+        label_idx = int(box.cls[0].item())
+        label = names[label_idx]
+        score = box.conf[0].item()
+        bbox = box.xyxy[0].tolist()
+        detections.append((label, score, bbox))
+    return detections
+
+
+def _worker_main(model_name, backend, threads, tasks, results, current, plot=True):
+    import torch
+    from inference_backends import load_backend
+
+    torch.set_num_threads(threads)
+    model = load_backend(backend, model_name)
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        task_id, sources, plot_sources = task
+        # Lets the parent fail this task right away if the process dies on it
+        current.value = task_id
+        try:
+            outputs = []
+            for result, plot_source in zip(model(sources, verbose=False), plot_sources):
+                start = time.perf_counter()
+                annotated_frame = result.plot() if plot and plot_source else None
+                outputs.append({
+                    "detections": extract_detections(result, model.names),
+                    "annotated_frame": annotated_frame,
+                    "speed": result.speed,
+                    "plot_seconds": time.perf_counter() - start
+                })
+            results.put((task_id, outputs, None))
+        except Exception as e:
+            results.put((task_id, None, repr(e)))
+        current.value = -1
+
+
+class InferenceProcessPool:
+    """
+    N processes that each load the model, fed through a bounded local queue.
+
+    infer() can be called from several threads at once (the pipeline's infer
+    stage workers); each call blocks until a process has handled its batch.
+    Processes plot the annotated frame themselves (unless plot is False), so
+    only detections, the frame and YOLO's timings come back to the parent.
+    A process that dies is replaced, and the batch it was running fails at once
+    instead of waiting out the timeout.
+    """
+    # Seconds between checks for dead processes while no results come in
+    WATCHDOG_INTERVAL = 1
+
+    def __init__(self, model_name, backend="torch", processes=None, threads_per_process=None, queue_size=None,
+                 timeout=300, plot=True):
+        self.model_name = model_name
+        self.backend = backend
+        self.processes = processes or default_pool_size()
+        self.threads_per_process = threads_per_process or default_threads_per_process(self.processes)
+        self.queue_size = queue_size or 2 * self.processes
+        self.timeout = timeout
+        self.plot = plot
+        self._ids = itertools.count()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._workers = []
+        # Per process: shared id of the task it is running, -1 when idle
+        self._current = []
+        self._closing = False
+
+    def start(self):
+        from inference_backends import prepare_backend
+
+        # Export once here rather than in every worker at the same time
+        prepare_backend(self.backend, self.model_name)
+        # spawn: forking a parent that already runs torch/boto threads isn't safe
+        self._ctx = mp.get_context("spawn")
+        self._tasks = self._ctx.Queue(maxsize=self.queue_size)
+        self._results = self._ctx.Queue()
+        for _ in range(self.processes):
+            self._workers.append(None)
+            self._current.append(None)
+            self._spawn(len(self._workers) - 1)
+        threading.Thread(target=self._collect, name="inference-pool-results", daemon=True).start()
+        return self
+
+    def _spawn(self, index):
+        current = self._ctx.Value("q", -1)
+        worker = self._ctx.Process(target=_worker_main, daemon=True,
+                                   args=(self.model_name, self.backend, self.threads_per_process,
+                                         self._tasks, self._results, current, self.plot))
+        worker.start()
+        self._workers[index] = worker
+        self._current[index] = current
+
+    def _collect(self):
+        while not self._closing:
+            try:
+                task_id, outputs, error = self._results.get(timeout=self.WATCHDOG_INTERVAL)
+            except queue.Empty:
+                self._replace_dead_workers()
+                continue
+            self._finish(task_id, outputs, error)
+            self._replace_dead_workers()
+
+    def _finish(self, task_id, outputs, error):
+        with self._lock:
+            future = self._pending.pop(task_id, None)
+        if future is None:
+            return
+        if error is not None:
+            future.set_exception(RuntimeError(f"Inference worker failed: {error}"))
+        else:
+            future.set_result(outputs)
+
+    def _replace_dead_workers(self):
+        with self._lock:
+            if self._closing:
+                return
+            dead = [index for index, worker in enumerate(self._workers) if not worker.is_alive()]
+            for index in dead:
+                worker, task_id = self._workers[index], self._current[index].value
+                print(f"[Inference Pool Error] worker {worker.pid} exited with code {worker.exitcode}, restarting it")
+                self._spawn(index)
+                future = self._pending.pop(task_id, None) if task_id >= 0 else None
+                if future is not None:
+                    future.set_exception(RuntimeError(f"Inference worker exited with code {worker.exitcode}"))
+
+    def infer(self, sources, plot=None):
+        """
+        Run one batch on the next free process. Returns one dict per source with
+        detections, annotated_frame, speed and plot_seconds. plot, one flag per
+        source, turns off plotting for sources whose frame isn't needed.
+        """
+        task_id = next(self._ids)
+        future = Future()
+        with self._lock:
+            self._pending[task_id] = future
+        self._tasks.put((task_id, sources, plot or [True] * len(sources)))
+        try:
+            return future.result(timeout=self.timeout)
+        finally:
+            with self._lock:
+                self._pending.pop(task_id, None)
+
+    def alive(self):
+        return sum(worker.is_alive() for worker in self._workers)
+
+    def close(self):
+        with self._lock:
+            # Workers exiting from here on aren't replaced
+            self._closing = True
+            workers = self._workers
+        for _ in workers:
+            self._tasks.put(None)
+        for worker in workers:
+            worker.join(5)
+        self._workers = []
+        self._current = []
@@ -0,0 +1,212 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException, Request
+
+from db_for_prediction import BaseDatabaseHandler, predicted_image_response
+
+
+def deep_size(obj):
+    """
+    Approximate memory held by a cached value: containers plus what they reference
+    """
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k) + deep_size(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(deep_size(item) for item in obj)
+    return size
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire `ttl` seconds after they were stored
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value, size)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns (True, value) on a hit and (False, None) on a miss or expired entry
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, entry[1]
+                self._drop(key)
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        size = deep_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value, size)
+            self.bytes += size
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, predicate):
+        """
+        Drop every entry whose key matches predicate(key)
+        """
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                self._drop(key)
+
+    def _drop(self, key):
+        self.bytes -= self._entries.pop(key)[2]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "memory_bytes": self.bytes
+            }
+
+
+class CachedDatabaseHandler(BaseDatabaseHandler):
+    """
+    Read-through cache in front of another database handler.
+
+    Prediction sessions never change once written, so get_prediction_by_uid and
+    get_predicted_image are cached for `ttl` seconds and primed by
+    save_prediction. Label and score queries are cached for `query_ttl` seconds
+    and dropped as soon as a write adds a matching detection. Not-found results
+    are never cached, since a uid that is polled before it is written will exist
+    shortly after.
+
+    Writes by other instances only show up once the TTL expires.
+    """
+
+    def __init__(self, db, max_size=4096, ttl=300, query_max_size=256, query_ttl=2):
+        self.db = db
+        self.predictions = TTLCache(max_size, ttl)
+        self.images = TTLCache(max_size, ttl)
+        self.queries = TTLCache(query_max_size, query_ttl)
+
+    def __getattr__(self, name):
+        # Backend-specific extras (close, db_path, tables...) go straight to the wrapped handler
+        return getattr(self.db, name)
+
+    def init_db(self):
+        self.db.init_db()
+
+    def save_prediction_session(self, uid, original_image, predicted_image):
+        self.db.save_prediction_session(uid, original_image, predicted_image)
+        self.images.put(uid, predicted_image)
+        self.queries.invalidate(lambda key: key[0] == "stats")
+
+    def save_detection_object(self, c, prediction_uid, label, score, box):
+        self.db.save_detection_object(c, prediction_uid, label, score, box)
+        self.predictions.invalidate(lambda key: key == prediction_uid)
+        self._invalidate_queries([(label, score, box)])
+
+    def save_prediction(self, uid, original_image, predicted_image, detections):
+        record = self.db.save_prediction(uid, original_image, predicted_image, detections)
+        self.images.put(uid, predicted_image)
+        self._invalidate_queries(detections)
+        self._prime(uid, record)
+
+    def _prime(self, uid, record=None):
+        # Cache the record the backend wrote, or read it back once here, so
+        # polling clients hit the cache
+        if record is not None:
+            self.predictions.put(uid, record)
+            return
+        try:
+            self.predictions.put(uid, self.db.get_prediction_by_uid(uid))
+        except Exception as e:
+            print(f"[Lookup Cache Error] priming {uid}: {e}")
+
+    def _invalidate_queries(self, detections):
+        labels = {label for label, _, _ in detections}
+        max_score = max((float(score) for _, score, _ in detections), default=float("-inf"))
+        self.queries.invalidate(
+            lambda key: key[0] == "stats"
+            or (key[0] == "label" and key[1] in labels)
+            or (key[0] == "score" and key[1] <= max_score)
+        )
+
+    def get_cached_result(self, cache_key):
+        return self.db.get_cached_result(cache_key)
+
+    def save_cached_result(self, cache_key, detections, image_url, predicted_path):
+        self.db.save_cached_result(cache_key, detections, image_url, predicted_path)
+
+    def _cached(self, cache, key, load):
+        hit, value = cache.get(key)
+        if hit:
+            return value
+        value = load()
+        cache.put(key, value)
+        return value
+
+    def get_predicted_image(self, uid):
+        hit, value = self.images.get(uid)
+        if hit:
+            return value
+        value = self.db.get_predicted_image(uid)
+        if value is not None:
+            self.images.put(uid, value)
+        return value
+
+    def get_prediction_by_uid(self, uid):
+        return self._cached(self.predictions, uid, lambda: self.db.get_prediction_by_uid(uid))
+
+    def get_predictions_by_label(self, label: str):
+        return self._cached(self.queries, ("label", label), lambda: self.db.get_predictions_by_label(label))
+
+    def get_predictions_by_score(self, min_score: float):
+        return self._cached(self.queries, ("score", min_score), lambda: self.db.get_predictions_by_score(min_score))
+
+    def get_predictions_by_label_page(self, label: str, limit: int, cursor=None):
+        return self._cached(self.queries, ("label", label, limit, cursor),
+                            lambda: self.db.get_predictions_by_label_page(label, limit, cursor))
+
+    def get_predictions_by_score_page(self, min_score: float, limit: int, cursor=None):
+        return self._cached(self.queries, ("score", min_score, limit, cursor),
+                            lambda: self.db.get_predictions_by_score_page(min_score, limit, cursor))
+
+    def get_detections(self, label: str, min_area=None, region=None, limit: int = 100, cursor=None):
+        # Keyed by label first, so a write with this label invalidates it
+        return self._cached(self.queries, ("label", label, "detections", min_area, region, limit, cursor),
+                            lambda: self.db.get_detections(label, min_area, region, limit, cursor))
+
+    def get_stats(self, days: int = 7):
+        return self._cached(self.queries, ("stats", days), lambda: self.db.get_stats(days))
+
+    def get_score_histogram(self, label: str):
+        return self._cached(self.queries, ("label", label, "histogram"), lambda: self.db.get_score_histogram(label))
+
+    def get_prediction_image(self, uid: str, request: Request):
+        image_path = self.get_predicted_image(uid)
+        if image_path is None:
+            raise HTTPException(status_code=404, detail="Prediction not found")
+        return predicted_image_response(image_path, request)
+
+    def stats(self):
+        return {
+            "predictions": self.predictions.stats(),
+            "images": self.images.stats(),
+            "queries": self.queries.stats()
+        }
@@ -0,0 +1,41 @@
+"""
+Prometheus metrics for the YOLO worker and the API, served at /metrics and
+scraped by the otelcol prometheus receiver (docker-compose-files/otelcol-config.yaml).
+
+Label children are resolved once at import, so the hot path only pays for an
+observe()/inc() call.
+"""
+from prometheus_client import Counter, Gauge, Histogram
+
+# Seconds, from fast in-memory work up to slow uploads and callbacks
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+STAGE_SECONDS = Histogram(
+    "yolo_stage_seconds", "Time spent per image in each processing stage",
+    ["stage"], buckets=LATENCY_BUCKETS
+)
+S3_DOWNLOAD_SECONDS = STAGE_SECONDS.labels("s3_download")
+PREPROCESS_SECONDS = STAGE_SECONDS.labels("preprocess")
+INFERENCE_SECONDS = STAGE_SECONDS.labels("inference")
+PLOT_SECONDS = STAGE_SECONDS.labels("plot")
+DB_WRITE_SECONDS = STAGE_SECONDS.labels("db_write")
+S3_UPLOAD_SECONDS = STAGE_SECONDS.labels("s3_upload")
+CALLBACK_SECONDS = STAGE_SECONDS.labels("callback")
+
+BATCH_SIZE = Histogram(
+    "yolo_inference_batch_size", "Images per model call",
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+MESSAGES = Counter("yolo_messages", "SQS messages by outcome", ["status"])
+MESSAGES_RECEIVED = MESSAGES.labels("received")
+MESSAGES_PROCESSED = MESSAGES.labels("processed")
+DETECTIONS = Counter("yolo_detections", "Detected objects")
+ERRORS = Counter("yolo_errors", "Errors by pipeline stage", ["stage"])
+SQS_CONSUMERS = Gauge("yolo_sqs_consumers", "SQS poller threads, scaled with the queue depth")
+STAGE_IN_FLIGHT = Gauge("yolo_stage_in_flight", "Messages queued or being processed per pipeline stage", ["stage"])
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "FastAPI request latency per route",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being served")
@@ -0,0 +1,68 @@
+import asyncio
+import queue
+from concurrent.futures import Future
+
+from pipeline import Stage
+
+
+class QueueFull(Exception):
+    pass
+
+
+class MicroBatcher:
+    """
+    Gathers concurrent requests into one call of `func(items) -> results`.
+
+    A worker takes the first queued item, waits at most `max_wait` seconds for
+    up to `max_batch_size - 1` more, and resolves every caller's future with
+    its own result. submit() never blocks: when `queue_size` items are already
+    waiting it raises QueueFull so the caller can shed load.
+    """
+
+    def __init__(self, func, max_batch_size=8, max_wait=0.01, queue_size=32, workers=1, name="MicroBatch"):
+        self.func = func
+        self.stage = Stage(name, self._run, workers=workers, queue_size=queue_size,
+                           batch_size=max_batch_size, batch_wait=max_wait)
+        self.rejected = 0
+
+    def start(self):
+        self.stage.start()
+        return self
+
+    def _run(self, entries):
+        # Callers that went away (e.g. a client disconnect cancelled the
+        # future) are dropped; the others can no longer be cancelled
+        entries = [(item, future) for item, future in entries if future.set_running_or_notify_cancel()]
+        if not entries:
+            return None
+        items = [item for item, _ in entries]
+        try:
+            results = self.func(items)
+        except Exception as e:
+            for _, future in entries:
+                future.set_exception(e)
+            return None
+        for (_, future), result in zip(entries, results):
+            future.set_result(result)
+        return None
+
+    def submit(self, item):
+        """
+        Queue one item and return a concurrent Future for its result
+        """
+        future = Future()
+        try:
+            self.stage.queue.put_nowait((item, future))
+        except queue.Full:
+            self.rejected += 1
+            raise QueueFull(f"{self.stage.name} queue is full ({self.stage.queue.maxsize} waiting)")
+        return future
+
+    async def run(self, item):
+        """
+        Await the result of one item without blocking the event loop
+        """
+        return await asyncio.wrap_future(self.submit(item))
+
+    def in_flight(self):
+        return self.stage.in_flight()
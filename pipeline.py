@@ -0,0 +1,124 @@
+import queue
+import threading
+import time
+
+
+class Stage:
+    """
+    One step of the pipeline: a bounded input queue served by `workers` threads.
+
+    `func` gets one item (or a list of up to `batch_size` items when batching)
+    and returns the item(s) to hand to the next stage. Returning None drops
+    the item. A full output queue blocks the worker, so back-pressure
+    propagates upstream all the way to the producer.
+
+    If func raises, the item (or batch) is dropped and passed to
+    on_error(name, error, item) so the caller can clean up after it.
+    """
+
+    def __init__(self, name, func, workers=1, queue_size=10, batch_size=None, batch_wait=0, on_error=None):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.on_error = on_error
+        self.next_stage = None
+        self.threads = []
+        self.busy = 0
+        self._busy_lock = threading.Lock()
+
+    def put(self, item):
+        self.queue.put(item)
+
+    def free_slots(self):
+        return max(0, self.queue.maxsize - self.queue.qsize())
+
+    def in_flight(self):
+        """
+        Items waiting in the queue plus items the workers are processing
+        """
+        return self.queue.qsize() + self.busy
+
+    def _get_batch(self):
+        items = [self.queue.get()]
+        deadline = time.time() + self.batch_wait
+        while len(items) < self.batch_size:
+            remaining = deadline - time.time()
+            try:
+                if remaining > 0:
+                    items.append(self.queue.get(timeout=remaining))
+                else:
+                    items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _forward(self, output):
+        if output is None or self.next_stage is None:
+            return
+        if self.batch_size is not None:
+            for item in output:
+                if item is not None:
+                    self.next_stage.put(item)
+        else:
+            self.next_stage.put(output)
+
+    def _work(self):
+        while True:
+            item = self._get_batch() if self.batch_size is not None else self.queue.get()
+            size = len(item) if self.batch_size is not None else 1
+            with self._busy_lock:
+                self.busy += size
+            try:
+                output = self.func(item)
+            except Exception as e:
+                print(f"[{self.name} Stage Error] {e}")
+                if self.on_error is not None:
+                    self.on_error(self.name, e, item)
+                output = None
+            finally:
+                with self._busy_lock:
+                    self.busy -= size
+            self._forward(output)
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+
+class Pipeline:
+    """
+    Stages linked by bounded queues, so slow network stages overlap with inference
+    """
+
+    def __init__(self):
+        self.stages = []
+
+    def add_stage(self, name, func, **kwargs):
+        stage = Stage(name, func, **kwargs)
+        if self.stages:
+            self.stages[-1].next_stage = stage
+        self.stages.append(stage)
+        return stage
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+        return self
+
+    def put(self, item):
+        self.stages[0].put(item)
+
+    def wait_for_capacity(self, poll_interval=0.1):
+        """
+        Block until the first stage can take more items and return how many
+        """
+        while True:
+            free = self.stages[0].free_slots()
+            if free:
+                return free
+            time.sleep(poll_interval)
@@ -0,0 +1,138 @@
+"""
+Image preprocessing in front of the model.
+
+YOLO letterboxes every image down to MODEL_INPUT_SIZE, so a 12 MP phone photo
+is decoded at full size only to be thrown away. decode_for_model() decodes
+large JPEGs at 1/2, 1/4 or 1/8 scale straight from the DCT coefficients,
+keeping the longest side at least MODEL_INPUT_SIZE, and returns the factor to
+map boxes back to original-image coordinates.
+
+For very large images, where small objects vanish at MODEL_INPUT_SIZE,
+split_tiles() cuts overlapping tiles that run as one batch together with the
+whole image, and merge_tile_detections() shifts the boxes back to full-image
+coordinates and drops the duplicates found in several tiles.
+"""
+import io
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# YOLO's default imgsz
+MODEL_INPUT_SIZE = 640
+# OpenCV flags that decode a JPEG at a reduced scale
+REDUCED_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+def image_header(data):
+    """
+    (format, (width, height)) from the image header alone, or (None, None)
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            return image.format, image.size
+    except Exception:
+        return None, None
+
+
+def draft_factor(size, target=MODEL_INPUT_SIZE):
+    """
+    Largest JPEG reduction (1, 2, 4 or 8) that keeps the longest side >= target
+    """
+    longest = max(size)
+    for factor in (8, 4, 2):
+        if longest / factor >= target:
+            return factor
+    return 1
+
+
+def decode_for_model(data, target=MODEL_INPUT_SIZE, draft=True):
+    """
+    Decode image bytes into the BGR array YOLO expects. With draft, JPEGs at
+    least twice as large as target are decoded at a reduced size.
+    Returns (image, scale), where multiplying a box by scale gives original-image
+    coordinates, or (None, 1.0) if the bytes aren't an image.
+    """
+    buffer = np.frombuffer(data, np.uint8)
+    image_format, size = image_header(data) if draft else (None, None)
+    factor = draft_factor(size, target) if image_format == "JPEG" else 1
+    image = cv2.imdecode(buffer, REDUCED_FLAGS[factor] if factor > 1 else cv2.IMREAD_COLOR)
+    if image is None:
+        return None, 1.0
+    # Longest sides, so EXIF rotation applied by the decoder doesn't matter
+    return image, (max(size) / max(image.shape[:2]) if factor > 1 else 1.0)
+
+
+def tile_windows(width, height, tile_size, overlap=0.2):
+    """
+    (x1, y1, x2, y2) windows of at most tile_size covering the image, with
+    neighbours overlapping by `overlap` of tile_size
+    """
+    stride = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        positions = list(range(0, length - tile_size, stride))
+        return positions + [length - tile_size]
+
+    return [(x, y, min(x + tile_size, width), min(y + tile_size, height))
+            for y in starts(height) for x in starts(width)]
+
+
+def split_tiles(image, tile_size, overlap=0.2):
+    """
+    [((x, y), tile)] for the whole image (offset 0, 0) followed by its tiles.
+    Tiles are views into image, nothing is copied. The whole image catches
+    objects larger than a tile.
+    """
+    height, width = image.shape[:2]
+    return [((0, 0), image)] + [((x1, y1), image[y1:y2, x1:x2])
+                                for x1, y1, x2, y2 in tile_windows(width, height, tile_size, overlap)]
+
+
+def overlap_ratios(box, boxes):
+    """
+    Intersection of box with each of boxes over the smaller of the two areas,
+    so a box cut off at a tile edge matches the whole one it is part of
+    """
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return intersection / np.maximum(np.minimum(area, areas), 1e-9)
+
+
+def merge_tile_detections(tile_detections, threshold=0.6):
+    """
+    Shift each tile's (label, score, box) detections by its (x, y) offset and
+    keep the highest-scoring detection of every group of same-label boxes that
+    overlap by more than threshold
+    """
+    merged = []
+    by_label = {}
+    for (x, y), detections in tile_detections:
+        for label, score, box in detections:
+            by_label.setdefault(label, []).append((score, [box[0] + x, box[1] + y, box[2] + x, box[3] + y]))
+    for label, candidates in by_label.items():
+        scores = np.array([score for score, _ in candidates])
+        boxes = np.array([box for _, box in candidates], dtype=float)
+        order = np.argsort(-scores)
+        while order.size:
+            best = order[0]
+            merged.append((label, float(scores[best]), boxes[best].tolist()))
+            rest = order[1:]
+            order = rest[overlap_ratios(boxes[best], boxes[rest]) <= threshold]
+    return merged
+
+
+def scale_detections(detections, scale):
+    """
+    Map (label, score, box) detections from a reduced decode back to original-image coordinates
+    """
+    if scale == 1:
+        return detections
+    return [(label, score, [value * scale for value in box]) for label, score, box in detections]
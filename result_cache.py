@@ -0,0 +1,68 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class ResultCache:
+    """
+    LRU cache of inference results keyed by image content hash + model name/version.
+
+    An entry holds the detections as (label, score, box) tuples, the S3 key of the
+    annotated image and the local path it was saved to. When `store` (a database
+    handler) is given, entries are also written to its persistent result cache
+    table and looked up there on a memory miss.
+    """
+
+    def __init__(self, max_size=1024, store=None):
+        self.max_size = max_size
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(data, model_name, model_version):
+        return f"{hashlib.sha256(data).hexdigest()}:{model_name}:{model_version}"
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+        if self.store is not None:
+            entry = self.store.get_cached_result(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, entry)
+            return entry
+
+    def put(self, key, detections, image_url, predicted_path):
+        entry = {"detections": detections, "image_url": image_url, "predicted_path": predicted_path}
+        with self._lock:
+            self._remember(key, entry)
+        if self.store is not None:
+            self.store.save_cached_result(key, detections, image_url, predicted_path)
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "persistent": self.store is not None
+            }
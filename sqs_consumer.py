@@ -0,0 +1,242 @@
+import math
+import threading
+import time
+
+# SQS caps receive, delete and visibility batches at 10 messages
+MAX_BATCH = 10
+
+
+class SqsConsumer:
+    """
+    Receives SQS messages into `handler` and acknowledges them in batches.
+
+    `consumers` poller threads long-poll for up to 10 messages each, never more
+    than wait_for_capacity() says the pipeline can take. Every `scale_interval`
+    seconds the number of pollers is set from ApproximateNumberOfMessages: one
+    per 10 waiting messages, between min_consumers and max_consumers.
+
+    While a message is in flight its visibility timeout is extended every
+    `heartbeat_interval` seconds, so a slow inference doesn't make it reappear
+    and get processed twice. Messages still in flight after `max_in_flight`
+    seconds, and messages passed to release(), are left to time out, so SQS
+    redelivers them for another attempt.
+
+    ack() buffers deletes and sends them with delete_message_batch once 10 are
+    waiting or after `ack_wait` seconds.
+    """
+
+    def __init__(self, sqs, queue_url, handler, wait_for_capacity=None, visibility_timeout=60,
+                 heartbeat_interval=20, max_in_flight=900, min_consumers=1, max_consumers=4,
+                 scale_interval=15, ack_wait=0.5, wait_time=20, on_error=None):
+        self.sqs = sqs
+        self.queue_url = queue_url
+        self.handler = handler
+        self.wait_for_capacity = wait_for_capacity
+        self.visibility_timeout = visibility_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.max_in_flight = max_in_flight
+        self.min_consumers = min_consumers
+        self.max_consumers = max(min_consumers, max_consumers)
+        self.scale_interval = scale_interval
+        self.ack_wait = ack_wait
+        self.wait_time = wait_time
+        # Optional callable(kind, error), e.g. to count errors in metrics
+        self.on_error = on_error
+        self.consumers = 0
+        self.received = 0
+        self.acked = 0
+        self.extended = 0
+        self.released = 0
+        self.receive_calls = 0
+        self.delete_calls = 0
+        self._in_flight = {}  # MessageId -> (ReceiptHandle, received at)
+        self._pending_acks = []
+        self._pollers = {}
+        self._lock = threading.Lock()
+        self._ack_ready = threading.Event()
+        self._stopped = threading.Event()
+
+    def start(self):
+        for name, target in (("acks", self._flush_loop), ("heartbeat", self._heartbeat_loop),
+                             ("scaler", self._scale_loop)):
+            threading.Thread(target=target, name=f"sqs-{name}", daemon=True).start()
+        return self
+
+    def stop(self):
+        """
+        Stop polling and send the deletes that are still buffered
+        """
+        self._stopped.set()
+        self._ack_ready.set()
+        self.flush()
+
+    def _error(self, kind, error):
+        print(f"[SQS {kind} Error] {error}")
+        if self.on_error is not None:
+            self.on_error(kind, error)
+
+    # --- Receiving ---
+
+    def set_consumers(self, count):
+        """
+        Run `count` poller threads. Extra pollers exit after their current receive.
+        """
+        count = min(self.max_consumers, max(self.min_consumers, count))
+        with self._lock:
+            self.consumers = count
+            for index in range(count):
+                if index not in self._pollers:
+                    thread = threading.Thread(target=self._poll, args=(index,), name=f"sqs-poller-{index}",
+                                              daemon=True)
+                    self._pollers[index] = thread
+                    thread.start()
+
+    def _poll(self, index):
+        while True:
+            with self._lock:
+                if index >= self.consumers or self._stopped.is_set():
+                    del self._pollers[index]
+                    return
+            try:
+                self.receive()
+            except Exception as e:
+                self._error("Receive", e)
+                time.sleep(5)  # avoid tight retry loop
+
+    def receive(self):
+        """
+        Long-poll once and hand every message to the handler. Returns how many arrived.
+        """
+        free_slots = self.wait_for_capacity() if self.wait_for_capacity is not None else MAX_BATCH
+        response = self.sqs.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=min(MAX_BATCH, free_slots),
+            WaitTimeSeconds=self.wait_time,
+            VisibilityTimeout=self.visibility_timeout
+        )
+        messages = response.get("Messages", [])
+        now = time.monotonic()
+        with self._lock:
+            self.receive_calls += 1
+            self.received += len(messages)
+            for msg in messages:
+                self._in_flight[msg["MessageId"]] = (msg["ReceiptHandle"], now)
+        for msg in messages:
+            self.handler(msg)
+        return len(messages)
+
+    def queue_depth(self):
+        attributes = self.sqs.get_queue_attributes(QueueUrl=self.queue_url,
+                                                   AttributeNames=["ApproximateNumberOfMessages"])
+        return int(attributes["Attributes"]["ApproximateNumberOfMessages"])
+
+    def scale(self):
+        """
+        Set the number of pollers from the queue depth and return it
+        """
+        self.set_consumers(math.ceil(self.queue_depth() / MAX_BATCH))
+        return self.consumers
+
+    def _scale_loop(self):
+        self.set_consumers(self.min_consumers)
+        while not self._stopped.is_set():
+            try:
+                self.scale()
+            except Exception as e:
+                self._error("Queue Depth", e)
+            self._stopped.wait(self.scale_interval)
+
+    # --- Visibility heartbeat ---
+
+    def release(self, msg):
+        """
+        Stop extending a message whose job was dropped, so it is redelivered
+        once its visibility timeout runs out
+        """
+        with self._lock:
+            if self._in_flight.pop(msg["MessageId"], None) is not None:
+                self.released += 1
+
+    def extend_visibility(self):
+        """
+        Push back the visibility timeout of every message still in flight
+        """
+        now = time.monotonic()
+        with self._lock:
+            for message_id, (_, received_at) in list(self._in_flight.items()):
+                if now - received_at > self.max_in_flight:
+                    del self._in_flight[message_id]
+                    self.released += 1
+            entries = [{"Id": message_id, "ReceiptHandle": receipt, "VisibilityTimeout": self.visibility_timeout}
+                       for message_id, (receipt, _) in self._in_flight.items()]
+        for start in range(0, len(entries), MAX_BATCH):
+            chunk = entries[start:start + MAX_BATCH]
+            try:
+                response = self.sqs.change_message_visibility_batch(QueueUrl=self.queue_url, Entries=chunk)
+            except Exception as e:
+                self._error("Visibility", e)
+                continue
+            failed = {entry["Id"] for entry in response.get("Failed", [])}
+            with self._lock:
+                self.extended += len(chunk) - len(failed)
+                for message_id in failed:
+                    # Usually already acked, or its receipt handle is no longer valid
+                    self._in_flight.pop(message_id, None)
+
+    def _heartbeat_loop(self):
+        while not self._stopped.wait(self.heartbeat_interval):
+            self.extend_visibility()
+
+    # --- Acknowledgements ---
+
+    def ack(self, msg):
+        """
+        Queue a processed message for deletion
+        """
+        with self._lock:
+            self._in_flight.pop(msg["MessageId"], None)
+            self._pending_acks.append(msg)
+            if len(self._pending_acks) >= MAX_BATCH:
+                self._ack_ready.set()
+
+    def flush(self):
+        """
+        Delete every buffered message, 10 per request
+        """
+        with self._lock:
+            pending, self._pending_acks = self._pending_acks, []
+            self._ack_ready.clear()
+        for start in range(0, len(pending), MAX_BATCH):
+            chunk = pending[start:start + MAX_BATCH]
+            entries = [{"Id": str(i), "ReceiptHandle": msg["ReceiptHandle"]} for i, msg in enumerate(chunk)]
+            try:
+                response = self.sqs.delete_message_batch(QueueUrl=self.queue_url, Entries=entries)
+            except Exception as e:
+                # Not deleted: SQS redelivers these after the visibility timeout
+                self._error("Delete", e)
+                continue
+            failed = response.get("Failed", [])
+            for entry in failed:
+                self._error("Delete", f"{entry.get('Code')}: {entry.get('Message')}")
+            with self._lock:
+                self.delete_calls += 1
+                self.acked += len(chunk) - len(failed)
+
+    def _flush_loop(self):
+        while not self._stopped.is_set():
+            self._ack_ready.wait(self.ack_wait)
+            self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "consumers": self.consumers,
+                "received": self.received,
+                "acked": self.acked,
+                "in_flight": len(self._in_flight),
+                "pending_acks": len(self._pending_acks),
+                "visibility_extensions": self.extended,
+                "released": self.released,
+                "receive_calls": self.receive_calls,
+                "delete_calls": self.delete_calls
+            }